@@ -2,17 +2,25 @@ import dash
 from dash import dcc, html, callback
 from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, jsonify, session, Response, stream_with_context
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-import psycopg2
 import secrets
 import os
+import io
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
 from dash.dependencies import Input, Output, State
 from datetime import datetime, timedelta
 import requests
 from pages.feedback import add_feedback_to_app
+from utils.db import (db_connection, pool_stats, snapshot_cache_stats, get_transactions_page,
+                      get_user_identity, invalidate_user_identity, identity_cache_stats,
+                      get_user_by_email, create_user_account, get_backend, query_stats)
+from utils.statement_import import import_statement, StatementImportError
+from utils.export import stream_export, export_filename, EXPORT_FORMATS, ExportError, ExportBusyError
+from utils.write_behind import dashboard_layout_writer
+from utils.forecast_cache import forecast_cache_stats
+from utils.forecast_service import forecast_service
 
 # Load .env for the database URL
 load_dotenv()
@@ -20,6 +28,9 @@ load_dotenv()
 # DB Config
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Token monitoring sends as X-Metrics-Token to read /api/metrics; the route is off when unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
 # Flask Setup
 server = Flask(__name__)
 server.secret_key = secrets.token_hex(16)  # Set a random secret key
@@ -44,10 +55,6 @@ app = dash.Dash(
     title="BlueCard Finance",
 )
 
-# Database connection function
-def connect_db():
-    return psycopg2.connect(DATABASE_URL)
-
 # User model
 class User(UserMixin):
     def __init__(self, user_id, email, password_hash):
@@ -55,14 +62,11 @@ class User(UserMixin):
         self.email = email
         self.password_hash = password_hash
 
-# Load user function (for Flask-Login)
+# Load user function (for Flask-Login). Runs on every authenticated request,
+# so the identity comes from the in-process identity cache when possible.
 @login_manager.user_loader
 def load_user(user_id):
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE user_id = %s', (user_id,))
-    user_data = cursor.fetchone()
-    conn.close()
+    user_data = get_user_identity(user_id)
     
     if user_data:
         return User(user_id=user_data[0], email=user_data[1], password_hash=user_data[2])
@@ -72,10 +76,88 @@ def load_user(user_id):
 @server.route('/logout')
 @login_required
 def logout():
+    # Persist any layout change still waiting in the write-behind queue
+    dashboard_layout_writer.flush(current_user.id)
+    invalidate_user_identity(current_user.id)
     logout_user()
     session.clear()
     return redirect('/')
 
+# API route for data layer metrics (connection pool, caches, layout write-behind, queries per callback, forecast caches and workers).
+# These are process-wide and include other users' queries, so only internal monitoring holding METRICS_TOKEN may read them
+@server.route('/api/metrics')
+def api_metrics():
+    token = request.headers.get('X-Metrics-Token', '')
+    if not METRICS_TOKEN or not secrets.compare_digest(token.encode('utf-8'), METRICS_TOKEN.encode('utf-8')):
+        return jsonify({"success": False, "message": "Not found"}), 404
+
+    return jsonify({
+        "backend": get_backend().describe(),
+        "pool": pool_stats(),
+        "user_snapshot_cache": snapshot_cache_stats(),
+        "identity_cache": identity_cache_stats(),
+        "dashboard_layout_writes": dashboard_layout_writer.stats(),
+        "queries": query_stats(),
+        "forecast_caches": forecast_cache_stats(),
+        "forecast_workers": forecast_service.stats(),
+    })
+
+# API route for importing large bank statements (streamed straight from the upload)
+# Optional form field date_order=dmy|mdy for files whose dates could be either
+@server.route('/api/import-statement', methods=['POST'])
+@login_required
+def api_import_statement():
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({"success": False, "message": "No file uploaded"}), 400
+
+    lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        result = import_statement(current_user.id, lines, filename=upload.filename,
+                                  date_order=request.form.get('date_order') or None)
+    except StatementImportError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    return jsonify({"success": True, **result})
+
+# API route for a full account export, streamed straight from the database
+# GET /api/export?format=jsonl|csv|parquet (csv and parquet are zips, one file per table)
+@server.route('/api/export')
+@login_required
+def api_export():
+    fmt = request.args.get('format', 'jsonl')
+    try:
+        chunks = stream_export(current_user.id, fmt)
+    except ExportBusyError as e:
+        return jsonify({"success": False, "message": str(e)}), 503
+    except ExportError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_FORMATS[fmt][1],
+        headers={"Content-Disposition": f"attachment; filename={export_filename(fmt)}"},
+    )
+
+# API route for paginated transaction history
+# GET /api/transactions?cursor=&limit=&start=YYYY-MM-DD&end=YYYY-MM-DD&category=&type=
+@server.route('/api/transactions')
+@login_required
+def api_transactions():
+    try:
+        page = get_transactions_page(
+            current_user.id,
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', 50, type=int),
+            start_date=request.args.get('start'),
+            end_date=request.args.get('end'),
+            category=request.args.get('category'),
+            transaction_type=request.args.get('type'),
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    return jsonify(page)
+
 # API route for login
 @server.route('/api/login', methods=['POST'])
 def api_login():
@@ -84,11 +166,7 @@ def api_login():
     password = data.get('password')
     
     # Verify credentials
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE email = %s', (email,))
-    user_data = cursor.fetchone()
-    conn.close()
+    user_data = get_user_by_email(email)
     
     if user_data and check_password_hash(user_data[2], password):
         user = User(user_id=user_data[0], email=user_data[1], password_hash=user_data[2])
@@ -105,35 +183,16 @@ def api_signup():
     print("Received data:", data)
     password = data.get('password')
     
-    # Check if user exists
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE email = %s', (email,))
-    existing_user = cursor.fetchone()
-    
-    if existing_user:
-        conn.close()
-        return jsonify({"success": False, "message": "Email already exists"}), 400
-    
-    # Create new user
+    # Create new user, unless the email is already registered
     hashed_password = generate_password_hash(password)
-    cursor.execute(
-        'INSERT INTO users (email, password_hash) VALUES (%s, %s)',
-        (email, hashed_password)
-    )
-    conn.commit()
+    new_user_id = create_user_account(email, hashed_password)
     
-    # Get the new user ID
-    cursor.execute('SELECT * FROM users WHERE email = %s', (email,))
-    user_data = cursor.fetchone()
-    conn.close()
+    if new_user_id is None:
+        return jsonify({"success": False, "message": "Email already exists"}), 400
     
-    if user_data:
-        user = User(user_id=user_data[0], email=user_data[1], password_hash=user_data[2])
-        login_user(user)
-        return jsonify({"success": True})
-    else:
-        return jsonify({"success": False, "message": "Error creating user"}), 500
+    user = User(user_id=new_user_id, email=email, password_hash=hashed_password)
+    login_user(user)
+    return jsonify({"success": True})
 
 # Dash Layout
 app.layout = html.Div([
@@ -233,16 +292,10 @@ def process_login(n_clicks, email, password):
     if not email or not password:
         return dbc.Alert("Please fill all fields", color="danger"), dash.no_update, dash.no_update
 
-    conn = connect_db()
-    cursor = conn.cursor()
-    
     # Debug query - print what's being searched
     print(f"Attempting login for email: {email}")
     
-    # Make sure this matches your actual table structure
-    cursor.execute('SELECT user_id, email, password_hash FROM users WHERE email = %s', (email,))
-    user_data = cursor.fetchone()
-    conn.close()
+    user_data = get_user_by_email(email)
     
     # Debug - check if user was found
     if not user_data:
@@ -288,20 +341,14 @@ def process_signup(n_clicks, email, password, confirm_password):
     if password != confirm_password:
         return dbc.Alert("Passwords do not match", color="danger"), dash.no_update, dash.no_update
 
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE email = %s', (email,))
-    existing_user = cursor.fetchone()
+    hashed_password = generate_password_hash(password)
+    new_user_id = create_user_account(email, hashed_password)
 
-    if existing_user:
+    if new_user_id is None:
         return dbc.Alert("Email already registered", color="danger"), dash.no_update, dash.no_update
 
-    hashed_password = generate_password_hash(password)
-    cursor.execute('INSERT INTO users (email, password_hash) VALUES (%s, %s)', (email, hashed_password))
-    conn.commit()
-
     # Log the user in after successful sign-up
-    user = User(user_id=cursor.lastrowid, email=email, password_hash=hashed_password)
+    user = User(user_id=new_user_id, email=email, password_hash=hashed_password)
     login_user(user, remember=True)
 
     session_data = {"user_id": user.id, "email": user.email}
@@ -309,17 +356,14 @@ def process_signup(n_clicks, email, password, confirm_password):
 
 
 def get_monthly_active_users():
-    conn = connect_db()
-    cursor = conn.cursor()
-
     # Get users who logged in during the last 30 days
-    cursor.execute("""
-        SELECT COUNT(DISTINCT user_id) 
-        FROM user_activity 
-        WHERE timestamp >= CURRENT_DATE - INTERVAL '30 days'
-    """)
-    result = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT COUNT(DISTINCT user_id) 
+            FROM user_activity 
+            WHERE timestamp >= CURRENT_DATE - INTERVAL '30 days'
+        """)
+        result = cursor.fetchone()
     return result[0] if result else 0
 
 # Create user function
@@ -360,7 +404,8 @@ def get_subscription_status(cursor, user_id):
 @app.server.before_request
 def protect_data_endpoints():
     # Restrict direct access to dashboard data endpoints for security
-    if request.path.startswith('/api/') and not request.path.startswith('/api/login') and not request.path.startswith('/api/signup') and not current_user.is_authenticated:
+    # /api/metrics checks its own token instead of a session
+    if request.path.startswith('/api/') and not request.path.startswith('/api/login') and not request.path.startswith('/api/signup') and request.path != '/api/metrics' and not current_user.is_authenticated:
         return redirect(url_for('login'))
     
 from dash import callback_context
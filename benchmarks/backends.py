@@ -0,0 +1,145 @@
+"""Latency of the callback hot paths on each storage backend.
+
+Seeds a throwaway user with --rows transactions and expenses, then times the
+utils.db calls the pages make on every interaction, uncached, on each backend.
+SQLite runs against a fresh temporary file; Postgres needs DATABASE_URL pointing
+at a database created by utils/init_db.py and is skipped when it is not set.
+
+    python -m benchmarks.backends --rows 5000 --repeats 50
+    python -m benchmarks.backends --backends sqlite
+"""
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from utils import db
+from utils.sqlite_backend import SQLiteBackend
+from utils.statement_import import import_statement
+
+
+def seed(rows):
+    """Create a user with `rows` transactions (via a statement import) and expenses"""
+    user_id = db.create_user_account(f"benchmark-{uuid.uuid4().hex[:12]}@bluecard.invalid", 'x')
+    start = datetime(2020, 1, 1)
+
+    statement = io.StringIO()
+    statement.write("Date,Description,Category,Amount\n")
+    for i in range(rows):
+        day = start + timedelta(hours=7 * i)
+        statement.write(f"{day:%Y-%m-%d},Shop {i % 97},Category {i % 12},-{i % 500}.{i % 100:02d}\n")
+    statement.seek(0)
+    import_statement(user_id, statement, filename='benchmark.csv')
+
+    with db.db_connection() as conn, conn.cursor() as cur:
+        cur.executemany(
+            "INSERT INTO expense (user_id, description, amount, category, date) VALUES (%s, %s, %s, %s, %s)",
+            [(user_id, f"Expense {i}", 5 + i % 300, f"Category {i % 12}", start + timedelta(hours=7 * i))
+             for i in range(rows)],
+        )
+    return user_id
+
+
+def measure(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def cases(user_id):
+    """(name, callable) for each hot path, with caches bypassed"""
+    middle = db.get_transactions_page(user_id, limit=500)['next_cursor']
+
+    def snapshot():
+        db.invalidate_user_snapshot(user_id)
+        db.get_user_snapshot(user_id)
+
+    def identity():
+        db.invalidate_user_identity(user_id)
+        db.get_user_identity(user_id)
+
+    def add_and_delete_expense():
+        expense_id = str(uuid.uuid4())
+        db.save_expense(user_id, expense_id, 12.5, 'Category 1', 'Benchmark', datetime.now(), True)
+        db.delete_expense(user_id, expense_id, True)
+
+    settings = [{'components': [], 'n': 0}]
+
+    def save_settings():
+        settings[0]['n'] += 1
+        db.save_dashboard_settings(user_id, settings[0])
+
+    return [
+        ("user snapshot", snapshot),
+        ("login identity", identity),
+        ("transactions page 1", lambda: db.get_transactions_page(user_id, limit=20)),
+        ("transactions deep page", lambda: db.get_transactions_page(user_id, cursor=middle, limit=20)),
+        ("filtered page", lambda: db.get_transactions_page(user_id, limit=20, category='Category 3',
+                                                          start_date='2020-06-01')),
+        ("expense rollup", lambda: db.get_expense_rollup(user_id)),
+        ("add + delete expense", add_and_delete_expense),
+        ("save dashboard settings", save_settings),
+    ]
+
+
+def run_backend(rows, repeats):
+    started = time.perf_counter()
+    user_id = seed(rows)
+    print(f"  seeded {rows} transactions + {rows} expenses in {time.perf_counter() - started:.1f} s")
+    results = {}
+    try:
+        for name, fn in cases(user_id):
+            results[name] = measure(fn, repeats)
+    finally:
+        db.delete_user(user_id)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--backends", default="sqlite,postgres")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.backends.split(','):
+            if name == 'sqlite':
+                backend = SQLiteBackend(os.path.join(tmp, 'benchmark.db'))
+                backend.init_schema()
+            elif name == 'postgres':
+                if not db.DATABASE_URL or db.DATABASE_URL.startswith('sqlite:'):
+                    print("postgres: skipped, DATABASE_URL is not set")
+                    continue
+                backend = db.PostgresBackend(db.DATABASE_URL)
+            else:
+                parser.error(f"unknown backend {name!r}")
+
+            print(f"{name}:")
+            db.set_backend(backend)
+            results[name] = run_backend(args.rows, args.repeats)
+        db.close_pool()
+
+    if not results:
+        return
+    names = list(results)
+    print(f"\n{'median / p95 (ms)':<26}" + "".join(f"{name:>22}" for name in names))
+    for case in next(iter(results.values())):
+        line = f"{case:<26}"
+        for name in names:
+            median, p95 = results[name][case]
+            line += f"{median * 1000:>12.2f} /{p95 * 1000:>7.2f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
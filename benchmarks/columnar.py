@@ -0,0 +1,119 @@
+"""Time to load a user's expense history into typed DataFrame columns.
+
+Compares the record path (RealDictCursor rows, then pd.DataFrame,
+pd.to_datetime and float() on the Decimal amounts) with utils.db's
+get_expense_columns, which the dashboard expense breakdown uses. Both load
+the same --rows expenses of a throwaway user; the totals are compared before
+timing. SQLite runs against a fresh temporary file; Postgres needs
+DATABASE_URL and is skipped when it is not set.
+
+    python -m benchmarks.columnar --rows 50000 --repeats 10
+    python -m benchmarks.columnar --backends postgres
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pandas as pd
+from psycopg2.extras import RealDictCursor
+
+from utils import db
+from utils.sqlite_backend import SQLiteBackend
+
+
+def seed(rows):
+    """Create a user with `rows` expenses spread over the last few years"""
+    user_id = db.create_user_account(f"benchmark-{uuid.uuid4().hex[:12]}@bluecard.invalid", 'x')
+    start = datetime(2020, 1, 1)
+    with db.db_connection() as conn, conn.cursor() as cur:
+        cur.executemany(
+            "INSERT INTO expense (user_id, description, amount, category, date, due_date) VALUES (%s, %s, %s, %s, %s, %s)",
+            [(user_id, f"Expense {i}", 5 + i % 300 + (i % 100) / 100, f"Category {i % 12}",
+              start + timedelta(hours=7 * i), start + timedelta(hours=7 * i, days=14))
+             for i in range(rows)],
+        )
+    return user_id
+
+
+def load_records(user_id):
+    """The record path: dict rows, then per-value conversion in pandas"""
+    with db.db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("SELECT date, due_date, amount, category FROM expense WHERE user_id = %s ORDER BY date",
+                    (user_id,))
+        rows = cur.fetchall()
+    df = pd.DataFrame(rows, columns=['date', 'due_date', 'amount', 'category'])
+    df['date'] = pd.to_datetime(df['date'])
+    df['due_date'] = pd.to_datetime(df['due_date'])
+    df['amount'] = df['amount'].map(float)
+    df['category'] = df['category'].astype('category')
+    return df
+
+
+def load_columns(user_id):
+    return db.get_expense_columns(user_id)
+
+
+def measure(fn, user_id, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(user_id)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+
+def run_backend(rows, repeats):
+    started = time.perf_counter()
+    user_id = seed(rows)
+    print(f"  seeded {rows} expenses in {time.perf_counter() - started:.1f} s")
+    try:
+        records, columns = load_records(user_id), load_columns(user_id)
+        if len(records) != len(columns) or abs(records['amount'].sum() - columns['amount'].sum()) > 0.01:
+            raise SystemExit("FAIL: the columnar fetch returned different expenses")
+        return {name: measure(fn, user_id, repeats)
+                for name, fn in (("records + pandas", load_records), ("columnar", load_columns))}
+    finally:
+        db.delete_user(user_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--backends", default="sqlite,postgres")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.backends.split(','):
+            if name == 'sqlite':
+                backend = SQLiteBackend(os.path.join(tmp, 'benchmark.db'))
+                backend.init_schema()
+            elif name == 'postgres':
+                if not db.DATABASE_URL or db.DATABASE_URL.startswith('sqlite:'):
+                    print("postgres: skipped, DATABASE_URL is not set")
+                    continue
+                backend = db.PostgresBackend(db.DATABASE_URL)
+            else:
+                parser.error(f"unknown backend {name!r}")
+
+            print(f"{name}:")
+            db.set_backend(backend)
+            results[name] = run_backend(args.rows, args.repeats)
+        db.close_pool()
+
+    for name, timings in results.items():
+        print(f"\n{name} ({args.rows} expenses)       median        p95")
+        for case, (median, p95) in timings.items():
+            print(f"  {case:<22}{median * 1000:>8.1f} ms{p95 * 1000:>8.1f} ms")
+        speedup = timings["records + pandas"][0] / timings["columnar"][0]
+        print(f"  columnar is {speedup:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
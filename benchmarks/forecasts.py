@@ -0,0 +1,218 @@
+"""Rolling-origin backtests of the forecast engines: accuracy against cost.
+
+Each history is cut at a series of origins. Every engine is fitted on the
+points before the origin and predicts the next --horizon points, which are
+scored against what actually happened:
+
+    MAPE       mean absolute percentage error (actuals of 0 are skipped)
+    coverage   share of actuals inside the 95% interval (polyfit has none)
+    fit ms     wall time of one fit + predict, median and p95 over origins
+    peak KiB   peak Python memory of one fit + predict on the longest
+               training window (tracemalloc; Stan's own process is not seen)
+
+Engines: 'ets' (logic/ets.py, what model='auto' uses for short histories),
+'prophet' (when installed) and 'polyfit', the straight-line baseline of
+generate_income_chart. The histories are synthetic and seeded; --histories
+adds anonymized ones from a JSON file of
+
+    [{"name": "...", "points": [["2024-01-31", 2500.0], ...]}, ...]
+
+with optional "horizon", "min_train", "stride" and "seasonal_days" per
+history. The engine to use is the cheapest one whose mean MAPE over all
+histories is within --max-mape and whose mean coverage is at least
+--min-coverage.
+
+    python -m benchmarks.forecasts
+    python -m benchmarks.forecasts --engines ets polyfit --max-mape 5
+    python -m benchmarks.forecasts --histories anonymized.json
+"""
+import argparse
+import json
+import logging
+import statistics
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from logic.ets import ets_forecast
+from logic.forecasting import prophet_available
+
+INTERVAL_WIDTH = 0.95
+
+
+def ets_engine(ds, y, future_ds, seasonal_days):
+    return ets_forecast(ds, y, future_ds, interval_width=INTERVAL_WIDTH, seasonal_days=seasonal_days)
+
+
+def prophet_engine(ds, y, future_ds, seasonal_days):
+    from prophet import Prophet
+    model = Prophet(interval_width=INTERVAL_WIDTH, daily_seasonality=False,
+                    weekly_seasonality=7 in seasonal_days, yearly_seasonality=365.25 in seasonal_days)
+    model.fit(pd.DataFrame({'ds': pd.to_datetime(ds), 'y': y}))
+    forecast = model.predict(pd.DataFrame({'ds': pd.to_datetime(future_ds)}))
+    return {column: forecast[column].values for column in ('yhat', 'yhat_lower', 'yhat_upper')}
+
+
+def polyfit_engine(ds, y, future_ds, seasonal_days):
+    """generate_income_chart's projection: the mean of the last 3 points plus
+    the fitted slope per step, with steps at the history's median spacing"""
+    days = np.asarray(ds, dtype='datetime64[D]').astype(np.int64)
+    slope = np.polyfit(np.arange(len(y)), y, 1)[0]
+    step = max(1.0, float(np.median(np.diff(days))))
+    steps = (np.asarray(future_ds, dtype='datetime64[D]').astype(np.int64) - days[-1]) / step
+    return {'yhat': np.mean(y[-3:]) + slope * steps}
+
+
+ENGINES = {'ets': ets_engine, 'prophet': prophet_engine, 'polyfit': polyfit_engine}
+
+
+def synthetic_histories(seed=0):
+    """Income and savings shapes the app sees, as dicts of name, ds, y and
+    the backtest settings for that history"""
+    rng = np.random.default_rng(seed)
+    months = pd.date_range('2021-01-31', periods=36, freq='ME').values
+    t = np.arange(36)
+    histories = [
+        # Salary with a raise each January
+        {'name': 'salary (monthly)', 'ds': months,
+         'y': 2500 * 1.04 ** (t // 12) + rng.normal(0, 20, 36)},
+        # Freelance income: growth, a yearly cycle and noisy months
+        {'name': 'freelance (monthly)', 'ds': months,
+         'y': 1200 + 15 * t + 250 * np.sin(2 * np.pi * t / 12) + rng.normal(0, 120, 36)},
+        # Side income drifting up and down
+        {'name': 'side income (monthly)', 'ds': months[:24],
+         'y': 600 + np.cumsum(rng.normal(0, 40, 24))},
+    ]
+    for history in histories:
+        history.update({'horizon': 6, 'min_train': 12, 'stride': 1, 'seasonal_days': [7]})
+
+    # Cumulative savings with a deposit every 3 to 7 days, smaller at weekends
+    gaps = rng.integers(3, 8, 300)
+    days = np.datetime64('2023-01-02') + np.cumsum(gaps).astype('timedelta64[D]')
+    weekday = (days.astype(np.int64) + 3) % 7
+    deposits = rng.gamma(4, 12, 300) * np.where(weekday >= 5, 0.6, 1.0)
+    histories.append({'name': 'savings (every few days)', 'ds': days, 'y': 500 + np.cumsum(deposits),
+                      'horizon': 30, 'min_train': 60, 'stride': 15, 'seasonal_days': [7, 365.25]})
+    return histories
+
+
+def load_histories(path):
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    histories = []
+    for entry in entries:
+        points = sorted(entry['points'])
+        n = len(points)
+        horizon = entry.get('horizon', max(1, n // 6))
+        min_train = entry.get('min_train', max(3, n // 2))
+        histories.append({
+            'name': entry.get('name', f"history {len(histories) + 1}"),
+            'ds': np.array([point[0] for point in points], dtype='datetime64[D]'),
+            'y': np.array([point[1] for point in points], dtype=float),
+            'horizon': horizon, 'min_train': min_train,
+            'stride': entry.get('stride', max(1, (n - min_train - horizon) // 10)),
+            'seasonal_days': entry.get('seasonal_days', [7]),
+        })
+    return histories
+
+
+def backtest(engine, history):
+    """Scores and fit timings of `engine` over every origin of `history`"""
+    ds, y, horizon = history['ds'], np.asarray(history['y'], dtype=float), history['horizon']
+    errors, covered, timings = [], [], []
+    for origin in range(history['min_train'], len(y) - horizon + 1, history['stride']):
+        started = time.perf_counter()
+        forecast = engine(ds[:origin], y[:origin], ds[origin:origin + horizon], history['seasonal_days'])
+        timings.append(time.perf_counter() - started)
+
+        actual = y[origin:origin + horizon]
+        scored = np.abs(actual) > 1e-9
+        errors.extend(np.abs(forecast['yhat'][scored] - actual[scored]) / np.abs(actual[scored]))
+        if 'yhat_lower' in forecast:
+            covered.extend((forecast['yhat_lower'] <= actual) & (actual <= forecast['yhat_upper']))
+
+    # Memory in a separate pass so tracemalloc does not slow the timed fits
+    origin = len(y) - horizon
+    tracemalloc.start()
+    try:
+        engine(ds[:origin], y[:origin], ds[origin:], history['seasonal_days'])
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'origins': len(timings),
+        'mape': 100 * float(np.mean(errors)) if errors else float('nan'),
+        'coverage': float(np.mean(covered)) if covered else None,
+        'fit_ms': 1000 * statistics.median(timings),
+        'fit_p95_ms': 1000 * timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'peak_kib': peak / 1024,
+    }
+
+
+def choose_engine(results, max_mape, min_coverage):
+    """The cheapest engine meeting the accuracy bar, with its averages"""
+    summary = {}
+    for engine, by_history in results.items():
+        coverages = [result['coverage'] for result in by_history.values() if result['coverage'] is not None]
+        summary[engine] = {
+            'mape': statistics.mean(result['mape'] for result in by_history.values()),
+            'coverage': statistics.mean(coverages) if coverages else None,
+            'fit_ms': statistics.median(result['fit_ms'] for result in by_history.values()),
+        }
+    passing = [engine for engine, totals in summary.items()
+               if totals['mape'] <= max_mape and (min_coverage <= 0 or (totals['coverage'] or 0) >= min_coverage)]
+    return min(passing, key=lambda engine: summary[engine]['fit_ms'], default=None), summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engines", nargs='+', choices=sorted(ENGINES), default=sorted(ENGINES))
+    parser.add_argument("--histories", help="JSON file of anonymized histories to add to the synthetic ones")
+    parser.add_argument("--no-synthetic", action="store_true", help="only backtest the --histories file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-mape", type=float, default=10.0, help="accuracy bar, mean MAPE in percent")
+    parser.add_argument("--min-coverage", type=float, default=0.0,
+                        help="interval coverage bar (0-1); engines without intervals fail any bar above 0")
+    args = parser.parse_args()
+
+    engines = [engine for engine in args.engines if engine != 'prophet' or prophet_available()]
+    if 'prophet' in args.engines and 'prophet' not in engines:
+        print("prophet is not installed, skipping it")
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+
+    histories = [] if args.no_synthetic else synthetic_histories(args.seed)
+    if args.histories:
+        histories += load_histories(args.histories)
+    if not histories:
+        raise SystemExit("no histories to backtest")
+
+    results = {engine: {} for engine in engines}
+    print(f"{'history':<28}{'engine':<10}{'origins':>8}{'MAPE':>9}{'coverage':>10}"
+          f"{'fit ms':>10}{'p95 ms':>10}{'peak KiB':>11}")
+    for history in histories:
+        for engine in engines:
+            result = backtest(ENGINES[engine], history)
+            results[engine][history['name']] = result
+            coverage = f"{result['coverage']:.0%}" if result['coverage'] is not None else '-'
+            print(f"{history['name']:<28}{engine:<10}{result['origins']:>8}{result['mape']:>8.2f}%{coverage:>10}"
+                  f"{result['fit_ms']:>10.2f}{result['fit_p95_ms']:>10.2f}{result['peak_kib']:>11.0f}")
+
+    chosen, summary = choose_engine(results, args.max_mape, args.min_coverage)
+    print(f"\n{'engine':<10}{'mean MAPE':>11}{'coverage':>10}{'fit ms':>10}")
+    for engine, totals in summary.items():
+        coverage = f"{totals['coverage']:.0%}" if totals['coverage'] is not None else '-'
+        print(f"{engine:<10}{totals['mape']:>10.2f}%{coverage:>10}{totals['fit_ms']:>10.2f}")
+
+    bar = f"MAPE <= {args.max_mape:g}%" + (f", coverage >= {args.min_coverage:.0%}" if args.min_coverage > 0 else "")
+    if chosen:
+        print(f"\ncheapest engine with {bar}: {chosen}")
+    else:
+        print(f"\nno engine meets {bar}")
+
+
+if __name__ == "__main__":
+    main()
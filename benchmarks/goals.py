@@ -0,0 +1,98 @@
+"""Time to check every savings goal against a long daily forecast.
+
+Compares the per-goal check the goals table used to make (rebuild a DataFrame
+from the forecast records, parse the dates and argsort the distance to the
+goal date, once for each goal) with logic.goals.evaluate_goals, which checks
+all goals in one searchsorted pass. Both get the same synthetic forecast and
+goals, and their statuses are compared before timing.
+
+    python -m benchmarks.goals --goals 100 --years 10 --repeats 20
+"""
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from logic.goals import evaluate_goals
+
+
+def synthetic(goals, years, seed=0):
+    """Forecast columns (as fit_savings_forecast returns them), a weekly
+    history up to the forecast start, and goals spread over the forecast"""
+    rng = np.random.default_rng(seed)
+    start = date(2020, 1, 1)
+    days = int(years * 365.25)
+    ds = [(start + timedelta(days=i)).isoformat() for i in range(days)]
+    yhat = np.cumsum(rng.normal(20, 15, days)) + 1000
+    forecast = {'ds': ds, 'yhat': yhat.tolist(),
+                'yhat_lower': (yhat - 500).tolist(), 'yhat_upper': (yhat + 500).tolist()}
+
+    history_ds = [(start - timedelta(days=7 * i)).isoformat() for i in range(52, 0, -1)]
+    history_y = np.linspace(0, 1000, 52).tolist()
+
+    goal_list = []
+    for i in range(goals):
+        offset = int(rng.integers(0, days + 60))  # a few land past the end of the forecast
+        target = yhat[min(offset, days - 1)] * rng.uniform(0.8, 1.2)
+        goal_list.append({'name': f"goal {i}", 'amount': float(target),
+                          'date': (start + timedelta(days=offset)).isoformat()})
+    return forecast, history_ds, history_y, goal_list
+
+
+def legacy_check_goal_status(goal, forecast_data):
+    """The per-goal check the goals table made before the batch evaluator"""
+    forecast_df = pd.DataFrame(forecast_data)
+    forecast_df['ds'] = pd.to_datetime(forecast_df['ds'])
+    goal_date = pd.to_datetime(goal['date'])
+    closest_forecast = forecast_df.iloc[forecast_df['ds'].sub(goal_date).abs().argsort()[:1]]
+    predicted_value = closest_forecast['yhat'].values[0]
+    return "On Track" if predicted_value >= goal['amount'] else "Off Track"
+
+
+def legacy(forecast, history_ds, history_y, goals):
+    records = pd.DataFrame(forecast).to_dict('records')
+    return [legacy_check_goal_status(goal, records) for goal in goals]
+
+
+def batch(forecast, history_ds, history_y, goals):
+    evaluation = evaluate_goals([goal['date'] for goal in goals], [goal['amount'] for goal in goals],
+                                history_ds, history_y, forecast['ds'], forecast['yhat'])
+    return list(evaluation['status'])
+
+
+def timed(fn, args, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--goals", type=int, default=100)
+    parser.add_argument("--years", type=float, default=10)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    data = synthetic(args.goals, args.years)
+    print(f"{args.goals} goals against {len(data[0]['ds'])} daily forecast rows")
+    if legacy(*data) != batch(*data):
+        raise SystemExit("FAIL: batch statuses differ from the per-goal check")
+
+    print(f"{'method':<12}{'median':>12}{'p95':>12}")
+    results = {}
+    for name, fn in (('per-goal', legacy), ('batch', batch)):
+        timings = sorted(timed(fn, data, args.repeats))
+        results[name] = statistics.median(timings)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        print(f"{name:<12}{results[name] * 1000:>10.2f} ms{p95 * 1000:>10.2f} ms")
+    print(f"\nbatch is {results['per-goal'] / results['batch']:.0f}x faster")
+
+
+if __name__ == "__main__":
+    main()
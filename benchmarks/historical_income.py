@@ -0,0 +1,109 @@
+"""Round trips and latency of saving a historical income series.
+
+Compares the old per-month SELECT + UPDATE/INSERT loop that update_income used
+with the batched upsert_historical_income path. Needs DATABASE_URL pointing at a
+database created by utils/init_db.py; a throwaway user is created and removed.
+
+    python -m benchmarks.historical_income --months 24 --rtt-ms 20
+
+--rtt-ms adds a simulated network round trip to every statement so a local
+database behaves like the remote one.
+"""
+import argparse
+import statistics
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+from utils.db import DATABASE_URL, upsert_historical_income
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Cursor that counts statements sent to the server"""
+    round_trips = 0
+    rtt = 0.0
+
+    def execute(self, query, vars=None):
+        CountingCursor.round_trips += 1
+        if CountingCursor.rtt:
+            time.sleep(CountingCursor.rtt)
+        return super().execute(query, vars)
+
+
+def legacy_update_income(cur, income_id, historical_data):
+    """The per-month loop update_income used before the batched path"""
+    for month, amount in historical_data.items():
+        cur.execute("""
+            SELECT income_id FROM historical_income
+            WHERE income_id = %s AND month = %s
+        """, (income_id, month))
+        if cur.fetchone():
+            cur.execute("""
+                UPDATE historical_income SET amount = %s
+                WHERE income_id = %s AND month = %s
+            """, (amount, income_id, month))
+        else:
+            cur.execute("""
+                INSERT INTO historical_income (income_id, month, amount)
+                VALUES (%s, %s, %s)
+            """, (income_id, month, amount))
+
+    cur.execute("SELECT SUM(amount) FROM historical_income WHERE income_id = %s", (income_id,))
+    total = cur.fetchone()[0] or 0
+    cur.execute("UPDATE income SET monthly_amount = %s WHERE income_id = %s", (total / 12, income_id))
+
+
+def run(write, conn, income_id, months, repeats):
+    timings = []
+    trips = []
+    for i in range(repeats):
+        historical_data = {f"month_{m}": 1000 + 10 * m + i for m in range(-months + 1, 1)}
+        CountingCursor.round_trips = 0
+        start = time.perf_counter()
+        with conn.cursor() as cur:
+            write(cur, income_id, historical_data)
+        conn.commit()
+        timings.append(time.perf_counter() - start)
+        trips.append(CountingCursor.round_trips + 1)  # + COMMIT
+    return statistics.median(timings), statistics.median(trips)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    CountingCursor.rtt = args.rtt_ms / 1000
+    conn = psycopg2.connect(DATABASE_URL, cursor_factory=CountingCursor)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO users (email, password_hash)
+                VALUES ('benchmark@bluecard.invalid', 'x') RETURNING user_id
+            """)
+            user_id = cur.fetchone()[0]
+            cur.execute("""
+                INSERT INTO income (user_id, amount, source, monthly_amount)
+                VALUES (%s, 0, 'Benchmark', 0) RETURNING income_id
+            """, (user_id,))
+            income_id = cur.fetchone()[0]
+        conn.commit()
+
+        print(f"{args.months} months, {args.repeats} repeats, simulated RTT {args.rtt_ms} ms")
+        for name, write in [("per-month loop", legacy_update_income),
+                            ("batched upsert", upsert_historical_income)]:
+            latency, trips = run(write, conn, income_id, args.months, args.repeats)
+            print(f"  {name:<15} round trips: {trips:>4.0f}   median latency: {latency * 1000:8.2f} ms")
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM users WHERE email = 'benchmark@bluecard.invalid'")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Cold-start time of a web worker, and where its import time goes.
+
+Each run starts a fresh interpreter that imports app (and with it every page
+under pages/), then serves one request through the Flask test client. The
+wall time from launching the process to that first response is compared with
+--ceiling and the command exits non-zero when the median is above it.
+
+    python -m benchmarks.startup --runs 5 --ceiling 3.0
+    python -m benchmarks.startup --profile --top 25
+
+--profile reruns the import under `python -X importtime` and reports the
+slowest imports made by app and its pages, the time each page module took to
+execute, and which heavy libraries were loaded before the first request.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries that should only load when a callback needs them
+HEAVY_MODULES = ['pandas', 'numpy', 'plotly.express', 'plotly.subplots', 'prophet', 'pyarrow', 'openai']
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+from importlib.machinery import SourceFileLoader
+
+# Dash executes each page with SourceFileLoader; time the pages/ ones
+page_seconds = {{}}
+exec_module = SourceFileLoader.exec_module
+def timed_exec_module(self, module):
+    page_started = time.perf_counter()
+    try:
+        return exec_module(self, module)
+    finally:
+        if module.__name__.startswith('pages.'):
+            page_seconds[module.__name__] = time.perf_counter() - page_started
+SourceFileLoader.exec_module = timed_exec_module
+
+import app
+imported = time.perf_counter()
+response = app.server.test_client().get({path!r})
+served = time.perf_counter()
+print(json.dumps({{
+    'import_seconds': imported - started,
+    'first_request_seconds': served - imported,
+    'status': response.status_code,
+    'pages': page_seconds,
+    'loaded': {{name: name in sys.modules for name in {heavy!r}}},
+}}))
+"""
+
+
+def run_child(path, importtime=False):
+    """Start a fresh worker process; returns (wall seconds, report, importtime stderr)"""
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', CHILD.format(root=ROOT, path=path, heavy=HEAVY_MODULES)]
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr[-4000:])
+        raise SystemExit(f"worker failed to start (exit {result.returncode})")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return wall, report, result.stderr
+
+
+def parse_importtime(stderr, max_depth=1):
+    """(cumulative seconds, module) for modules imported directly by the
+    script or by app and its pages (importtime indents nested imports)"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= max_depth and name.strip() != 'app':
+            modules.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(modules, reverse=True)
+
+
+def profile(path, top):
+    wall, report, stderr = run_child(path, importtime=True)
+    print(f"start to first response: {wall:.2f} s (import {report['import_seconds']:.2f} s, "
+          f"first request {report['first_request_seconds']:.2f} s, importtime adds overhead)\n")
+
+    print(f"{'imports by app and its pages':<44}{'cumulative':>12}")
+    for seconds, name in parse_importtime(stderr)[:top]:
+        print(f"{name:<44}{seconds * 1000:>10.1f} ms")
+
+    print(f"\n{'page modules (incl. first imports)':<44}{'exec':>12}")
+    for name, seconds in sorted(report['pages'].items(), key=lambda item: -item[1]):
+        print(f"{name:<44}{seconds * 1000:>10.1f} ms")
+
+    print("\nheavy libraries loaded before the first request:")
+    for name, loaded in report['loaded'].items():
+        print(f"  {name:<20}{'LOADED' if loaded else 'deferred'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ceiling", type=float, default=float(os.getenv("STARTUP_CEILING", "3.0")),
+                        help="seconds allowed from process start to first response (median)")
+    parser.add_argument("--path", default="/", help="URL of the first request")
+    parser.add_argument("--profile", action="store_true", help="report import time instead of benchmarking")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.profile:
+        profile(args.path, args.top)
+        return
+
+    timings = []
+    for run in range(args.runs):
+        wall, report, _ = run_child(args.path)
+        timings.append(wall)
+        print(f"run {run + 1}: {wall:.2f} s to first response (import {report['import_seconds']:.2f} s, "
+              f"first request {report['first_request_seconds']:.2f} s, HTTP {report['status']})")
+
+    median = statistics.median(timings)
+    print(f"\nmedian {median:.2f} s, max {max(timings):.2f} s, ceiling {args.ceiling:.2f} s")
+    loaded = [name for name, is_loaded in report['loaded'].items() if is_loaded]
+    if loaded:
+        print(f"loaded at startup: {', '.join(loaded)}")
+    if median > args.ceiling:
+        raise SystemExit(f"FAIL: cold start {median:.2f} s is above the {args.ceiling:.2f} s ceiling")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
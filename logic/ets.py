@@ -0,0 +1,221 @@
+"""Exponential smoothing (ETS) forecasts in plain NumPy.
+
+Additive-error Holt-Winters with a damped trend and optional additive
+seasonality, i.e. ETS(A,Ad,N) / ETS(A,Ad,A). Smoothing parameters are picked
+by a grid search that runs every candidate through the recursion at once, so
+a fit on a few hundred points takes about a millisecond. Prediction intervals
+use the analytic h-step variance of the model. When observations are only
+appended, ets_extend() carries a fit forward over the new points with its
+parameters kept instead of searching again.
+"""
+from statistics import NormalDist
+
+import numpy as np
+
+ALPHAS = np.linspace(0.1, 0.9, 9)
+BETA_FRACTIONS = np.array([0.0, 0.1, 0.3])  # trend smoothing as a share of alpha
+PHIS = np.array([0.8, 0.9, 0.98])
+GAMMAS = np.array([0.0, 0.1, 0.3])
+
+DAY_US = 86400 * 10**6
+
+
+def _grid(seasonal):
+    alpha, beta, phi, gamma = np.meshgrid(ALPHAS, BETA_FRACTIONS, PHIS, GAMMAS if seasonal else [0.0], indexing='ij')
+    alpha = alpha.ravel()
+    return alpha, beta.ravel() * alpha, phi.ravel(), gamma.ravel()
+
+
+def _initial_state(y, m):
+    if m:
+        level = y[:m].mean()
+        trend = (y[m:2 * m].mean() - level) / m
+        season = y[:m] - level
+        return level, trend, season, m
+    trend = y[1] - y[0] if len(y) > 1 else 0.0
+    return y[0], trend, None, 1
+
+
+def _smooth(y, alpha, beta, phi, gamma, m):
+    """Run every parameter set (arrays of shape (P,)) through the recursion.
+    Returns one-step fitted values (P, n), the final states and the SSE."""
+    n = len(y)
+    level0, trend0, season0, start = _initial_state(y, m)
+    count = len(alpha)
+    level = np.full(count, level0, dtype=float)
+    trend = np.full(count, trend0, dtype=float)
+    season = np.tile(season0, (count, 1)) if m else None
+
+    fitted = np.empty((count, n))
+    fitted[:, :start] = (level0 + season0) if m else y[0]
+    sse = np.zeros(count)
+    for t in range(start, n):
+        s = season[:, t % m] if m else 0.0
+        prediction = level + phi * trend + s
+        fitted[:, t] = prediction
+        error = y[t] - prediction
+        sse += error * error
+        level = level + phi * trend + alpha * error
+        trend = phi * trend + beta * error
+        if m:
+            season[:, t % m] = s + gamma * error
+    return fitted, level, trend, season, sse, n - start
+
+
+def fit_ets(y, seasonal_periods=None):
+    """Fit the damped-trend model to evenly spaced observations `y`. Seasonality
+    is used only when there are at least two full seasons of data."""
+    y = np.asarray(y, dtype=float)
+    m = seasonal_periods if seasonal_periods and seasonal_periods >= 2 and len(y) >= 2 * seasonal_periods else None
+    alpha, beta, phi, gamma = _grid(bool(m))
+    fitted, level, trend, season, sse, residuals = _smooth(y, alpha, beta, phi, gamma, m)
+    best = int(np.argmin(sse)) if residuals else 0
+
+    parameters = 3 + (1 if m else 0)
+    sigma2 = sse[best] / max(1, residuals - parameters) if residuals else 0.0
+    return {
+        'alpha': float(alpha[best]), 'beta': float(beta[best]), 'phi': float(phi[best]),
+        'gamma': float(gamma[best]), 'seasonal_periods': m,
+        'level': float(level[best]), 'trend': float(trend[best]),
+        'season': season[best].copy() if m else None,
+        'fitted': fitted[best], 'sigma': float(np.sqrt(sigma2)), 'n': len(y),
+        'sse': float(sse[best]), 'residuals': residuals,
+    }
+
+
+def update_ets(fit, y_new):
+    """The fit after observing `y_new` as well, with the smoothing parameters
+    kept: the same recursion as _smooth, for one parameter set"""
+    alpha, beta, phi, gamma, m = fit['alpha'], fit['beta'], fit['phi'], fit['gamma'], fit['seasonal_periods']
+    level, trend = fit['level'], fit['trend']
+    season = np.array(fit['season'], dtype=float) if m else None
+    sse, n = fit['sse'], fit['n']
+
+    fitted = np.empty(len(y_new))
+    for i, value in enumerate(np.asarray(y_new, dtype=float)):
+        s = season[n % m] if m else 0.0
+        prediction = level + phi * trend + s
+        fitted[i] = prediction
+        error = value - prediction
+        sse += error * error
+        level = level + phi * trend + alpha * error
+        trend = phi * trend + beta * error
+        if m:
+            season[n % m] = s + gamma * error
+        n += 1
+
+    residuals = fit['residuals'] + len(y_new)
+    parameters = 3 + (1 if m else 0)
+    return {
+        **fit, 'level': float(level), 'trend': float(trend), 'season': season,
+        'fitted': np.concatenate([fit['fitted'], fitted]), 'n': n, 'sse': float(sse), 'residuals': residuals,
+        'sigma': float(np.sqrt(sse / max(1, residuals - parameters))) if residuals else 0.0,
+    }
+
+
+def forecast_ets(fit, horizon, interval_width=0.95):
+    """Point forecasts and intervals for steps 0..horizon after the last
+    observation (step 0 is the smoothed level at the last observation)"""
+    h = np.arange(horizon + 1)
+    phi = fit['phi']
+    # phi + phi^2 + ... + phi^h
+    damped = np.concatenate([[0.0], np.cumsum(phi ** np.arange(1, horizon + 1))])
+    yhat = fit['level'] + damped * fit['trend']
+
+    m = fit['seasonal_periods']
+    if m:
+        yhat = yhat + np.asarray(fit['season'])[(fit['n'] + h - 1) % m]
+
+    # Var(h) = sigma^2 * (1 + sum_{j<h} c_j^2), c_j = alpha + beta*phi_j + gamma*[j % m == 0]
+    c = fit['alpha'] + fit['beta'] * damped[1:]
+    if m:
+        c = c + fit['gamma'] * (np.arange(1, horizon + 1) % m == 0)
+    variance = np.concatenate([[0.0], 1.0 + np.concatenate([[0.0], np.cumsum(c[:-1] ** 2)])]) if horizon else np.zeros(1)
+    spread = NormalDist().inv_cdf(0.5 + interval_width / 2) * fit['sigma'] * np.sqrt(variance)
+    return yhat, yhat - spread, yhat + spread
+
+
+def _to_days(dates):
+    return np.asarray(dates, dtype='datetime64[us]').astype(np.int64) / DAY_US
+
+
+def ets_fit(ds, y, seasonal_days=()):
+    """Fit on observations `y` at (possibly uneven) dates `ds`. The history is
+    interpolated onto an even grid at its median spacing. `seasonal_days`
+    lists candidate season lengths in days (7, 365.25); the first that fits
+    twice into the history is used.
+
+    Returns the fit as plain floats and lists, so it can be cached as JSON
+    and passed to ets_extend() and ets_predict().
+    """
+    t = _to_days(ds)
+    y = np.asarray(y, dtype=float)
+    order = np.argsort(t)
+    t, y = t[order], y[order]
+
+    step = max(1.0, float(np.round(np.median(np.diff(t))))) if len(t) > 1 else 1.0
+    grid = np.arange(t[0], t[-1] + step / 2, step)
+    y_grid = np.interp(grid, t, y)
+
+    seasonal_periods = None
+    for days in seasonal_days:
+        m = int(round(days / step))
+        if m >= 2 and len(y_grid) >= 2 * m:
+            seasonal_periods = m
+            break
+
+    fit = fit_ets(y_grid, seasonal_periods)
+    return _state(fit, t0=float(grid[0]), step=step, t_last=float(t[-1]), y_last=float(y[-1]), updates=0)
+
+
+def _state(fit, **dates):
+    fit = {**fit, **dates, 'fitted': np.asarray(fit['fitted'], dtype=float).tolist()}
+    if fit['season'] is not None:
+        fit['season'] = np.asarray(fit['season'], dtype=float).tolist()
+    return fit
+
+
+def ets_extend(state, ds, y):
+    """An ets_fit() result carried forward over observations dated after the
+    last one it has seen, on the same grid and with the same parameters"""
+    t = _to_days(ds)
+    y = np.asarray(y, dtype=float)
+    order = np.argsort(t)
+    t, y = t[order], y[order]
+    if len(t) and t[0] <= state['t_last']:
+        raise ValueError("ets_extend only takes observations after the fitted history")
+    if not len(t):
+        return state
+
+    step = state['step']
+    grid_end = state['t0'] + step * (state['n'] - 1)
+    new_grid = np.arange(grid_end + step, t[-1] + step / 2, step)
+    y_new = np.interp(new_grid, np.concatenate([[state['t_last']], t]), np.concatenate([[state['y_last']], y]))
+    fit = update_ets(state, y_new)
+    return _state(fit, t_last=float(t[-1]), y_last=float(y[-1]), updates=state['updates'] + 1)
+
+
+def ets_predict(state, future_ds, interval_width=0.95):
+    """Prophet-style yhat, yhat_lower and yhat_upper arrays for `future_ds`.
+    Dates inside the history get the in-sample one-step fit, later dates the
+    forecast."""
+    step = state['step']
+    grid = state['t0'] + step * np.arange(state['n'])
+    future_t = _to_days(future_ds)
+    steps_ahead = (future_t - grid[-1]) / step
+    horizon = int(np.ceil(max(steps_ahead.max(initial=0.0), 0.0))) + 1
+    yhat_h, lower_h, upper_h = forecast_ets(state, horizon, interval_width)
+
+    spread = NormalDist().inv_cdf(0.5 + interval_width / 2) * state['sigma']
+    ahead = steps_ahead > 0
+    h = np.arange(horizon + 1)
+    yhat = np.where(ahead, np.interp(steps_ahead, h, yhat_h), np.interp(future_t, grid, state['fitted']))
+    lower = np.where(ahead, np.interp(steps_ahead, h, lower_h), yhat - spread)
+    upper = np.where(ahead, np.interp(steps_ahead, h, upper_h), yhat + spread)
+    return {'yhat': yhat, 'yhat_lower': lower, 'yhat_upper': upper}
+
+
+def ets_forecast(ds, y, future_ds, interval_width=0.95, seasonal_days=()):
+    """Fit on `ds`/`y` and predict `future_ds` in one go (see ets_fit and
+    ets_predict)"""
+    return ets_predict(ets_fit(ds, y, seasonal_days), future_ds, interval_width)
@@ -0,0 +1,153 @@
+"""Forecast model fits. These run in the forecast worker processes, so the
+module stays free of Dash and database imports and loads Prophet on first use."""
+import os
+import importlib.util
+
+from utils.lazy import lazy_import
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+# Under model='auto', histories with fewer points than this use the NumPy ETS
+# engine; Prophet is only worth its fit cost once there is this much to learn from
+PROPHET_MIN_HISTORY = int(os.getenv("PROPHET_MIN_HISTORY", "24"))
+
+# Appended records an ETS fit is carried forward over with its parameters kept
+# before the parameters are searched for again
+FORECAST_MAX_WARM_UPDATES = int(os.getenv("FORECAST_MAX_WARM_UPDATES", "12"))
+
+FORECAST_ENGINES = ('auto', 'ets', 'prophet')
+
+# Resolutions compact_forecast() can thin a daily forecast to
+FORECAST_RESOLUTIONS = ('D', 'W', 'M')
+
+
+def prophet_available():
+    return importlib.util.find_spec('prophet') is not None
+
+
+def resolve_engine(config, history_points):
+    """'ets' or 'prophet' for a config whose 'model' is one of FORECAST_ENGINES"""
+    model = config.get('model', 'auto')
+    if model not in FORECAST_ENGINES:
+        raise ValueError(f"Unknown forecast model: {model}")
+    if model == 'auto':
+        return 'prophet' if history_points >= PROPHET_MIN_HISTORY and prophet_available() else 'ets'
+    return model
+
+
+def _prophet(config):
+    from prophet import Prophet
+    return Prophet(**{key: value for key, value in config.items() if key != 'model'})
+
+
+def _prophet_params(model):
+    """Fitted Prophet parameters in the form fit(init=...) takes, as plain
+    floats and lists"""
+    params = {name: float(model.params[name][0][0]) for name in ('k', 'm', 'sigma_obs')}
+    params.update({name: [float(value) for value in model.params[name][0]] for name in ('delta', 'beta')})
+    return params
+
+
+def _ets_seasons(config):
+    """Season lengths (days) the ETS engine may use, from the Prophet flags"""
+    seasons = []
+    if config.get('weekly_seasonality'):
+        seasons.append(7)
+    if config.get('yearly_seasonality'):
+        seasons.append(365.25)
+    return seasons
+
+
+# Function to forecast one income source's monthly values on the timeline dates
+def fit_income_timeline(prophet_data, forecast_dates, config):
+    """yhat for each of forecast_dates from [{'ds', 'y'}] history"""
+    if resolve_engine(config, len(prophet_data)) == 'ets':
+        from logic.ets import ets_forecast
+        forecast = ets_forecast(
+            [row['ds'] for row in prophet_data], [float(row['y']) for row in prophet_data], forecast_dates,
+            interval_width=config.get('interval_width', 0.95), seasonal_days=_ets_seasons(config),
+        )
+        return [float(yhat) for yhat in forecast['yhat']]
+
+    m = _prophet(config)
+    m.fit(pd.DataFrame(prophet_data))
+    forecast = m.predict(pd.DataFrame({"ds": forecast_dates}))
+    return [float(yhat) for yhat in forecast["yhat"]]
+
+
+# Function to forecast cumulative savings a number of days past the last record
+def fit_savings_forecast(history, config, periods, previous=None):
+    """Daily forecast from [[iso_date, amount]] history, as columns of ds (ISO
+    dates), yhat, yhat_lower and yhat_upper, plus the model 'state'.
+
+    `previous` is the 'state' of a forecast for the first rows of this same
+    history. An ETS fit is then carried forward over the appended rows and a
+    Prophet fit starts from the previous parameters, instead of from scratch.
+    """
+    df = pd.DataFrame(history, columns=['ds', 'y'])
+    df['ds'] = pd.to_datetime(df['ds'])
+    engine = resolve_engine(config, len(df))
+    if previous and (previous.get('engine') != engine or previous.get('history_points', 0) >= len(df)):
+        previous = None
+
+    if engine == 'ets':
+        from logic.ets import ets_fit, ets_extend, ets_predict
+        # Same rows as Prophet's make_future_dataframe: the history, then daily dates
+        future = pd.concat([df['ds'], pd.Series(pd.date_range(
+            df['ds'].max() + pd.Timedelta(days=1), periods=periods, freq='D'))], ignore_index=True)
+        if previous and previous['ets']['updates'] < FORECAST_MAX_WARM_UPDATES:
+            appended = df.iloc[previous['history_points']:]
+            fit = ets_extend(previous['ets'], appended['ds'].values, appended['y'].values)
+        else:
+            fit = ets_fit(df['ds'].values, df['y'].values, seasonal_days=_ets_seasons(config))
+        result = ets_predict(fit, future.values, interval_width=config.get('interval_width', 0.95))
+        forecast = pd.DataFrame({'ds': future, **result})
+        state = {'engine': engine, 'history_points': len(df), 'ets': fit}
+    else:
+        model = _prophet(config)
+        try:
+            if previous:
+                model.fit(df, init=previous['prophet'])
+            else:
+                model.fit(df)
+        except Exception as e:
+            if not previous:
+                raise
+            # e.g. a different number of changepoints now; fit cold instead
+            print(f"Error warm starting savings forecast, fitting from scratch: {e}")
+            model = _prophet(config)
+            model.fit(df)
+        future = model.make_future_dataframe(periods=periods)
+        forecast = model.predict(future)
+        state = {'engine': engine, 'history_points': len(df), 'prophet': _prophet_params(model)}
+
+    return {
+        'ds': forecast['ds'].dt.strftime('%Y-%m-%d').tolist(),
+        'yhat': forecast['yhat'].astype(float).tolist(),
+        'yhat_lower': forecast['yhat_lower'].astype(float).tolist(),
+        'yhat_upper': forecast['yhat_upper'].astype(float).tolist(),
+        'state': state,
+    }
+
+
+# Function to thin a daily forecast for sending to the browser
+def compact_forecast(forecast, resolution='W', decimals=2):
+    """Columns of `forecast` (as returned by fit_savings_forecast) keeping the
+    last day of each day, week (Monday to Sunday) or month, with the values
+    rounded to `decimals`"""
+    if resolution not in FORECAST_RESOLUTIONS:
+        raise ValueError(f"Unknown forecast resolution: {resolution}")
+    ds = np.array(forecast['ds'], dtype='datetime64[D]')
+    if resolution == 'M':
+        period = ds.astype('datetime64[M]').astype(np.int64)
+    elif resolution == 'W':
+        period = (ds.astype(np.int64) + 3) // 7  # 1970-01-01 was a Thursday
+    else:
+        period = ds.astype(np.int64)
+    keep = np.flatnonzero(np.append(period[1:] != period[:-1], True))
+
+    compact = {'ds': [forecast['ds'][i] for i in keep]}
+    for column in ('yhat', 'yhat_lower', 'yhat_upper'):
+        compact[column] = np.round(np.asarray(forecast[column], dtype=float)[keep], decimals).tolist()
+    return compact
@@ -0,0 +1,63 @@
+"""Savings goal checks against the savings forecast, for every goal at once."""
+import numpy as np
+
+DAYS_PER_MONTH = 30  # same month length the savings page uses for contributions
+
+
+def _days(dates):
+    return np.asarray(dates, dtype='datetime64[D]')
+
+
+# Function to evaluate all savings goals against the history and forecast in one pass
+def evaluate_goals(goal_dates, goal_amounts, history_ds, history_y, forecast_ds=None, forecast_yhat=None):
+    """Status of each goal as columns:
+
+    status        'On Track' when the forecast at the closest date to the goal
+                  date reaches the amount, 'Off Track' when not, None when
+                  there is no forecast
+    projected     that forecast value (NaN without a forecast)
+    shortfall     how far the projection falls short of the amount, 0 if not
+    monthly_contribution
+                  what is still needed on top of the savings recorded on or
+                  before the goal date, per month between the latest record
+                  and the goal date (0 once the goal date has passed)
+
+    `history_ds` and `forecast_ds` must be sorted.
+    """
+    goal_dates = _days(goal_dates)
+    amounts = np.asarray(goal_amounts, dtype=float)
+    history_ds = _days(history_ds)
+    history_y = np.asarray(history_y, dtype=float)
+
+    # Savings recorded on or before each goal date, 0 before the first record
+    if len(history_ds):
+        before = np.searchsorted(history_ds, goal_dates, side='right') - 1
+        saved = np.where(before >= 0, history_y[np.maximum(before, 0)], 0.0)
+        months = (goal_dates - history_ds[-1]).astype(float) / DAYS_PER_MONTH
+        monthly = np.where(months > 0, (amounts - saved) / np.where(months > 0, months, 1.0), 0.0)
+    else:
+        monthly = np.zeros(len(goal_dates))
+
+    count = len(goal_dates)
+    if forecast_ds is None or len(forecast_ds) == 0:
+        return {
+            'status': np.full(count, None, dtype=object),
+            'projected': np.full(count, np.nan),
+            'shortfall': np.full(count, np.nan),
+            'monthly_contribution': monthly,
+        }
+
+    # Closest forecast date to each goal date, the earlier one on a tie
+    forecast_ds = _days(forecast_ds)
+    forecast_yhat = np.asarray(forecast_yhat, dtype=float)
+    right = np.clip(np.searchsorted(forecast_ds, goal_dates), 0, len(forecast_ds) - 1)
+    left = np.maximum(right - 1, 0)
+    closer_left = np.abs(goal_dates - forecast_ds[left]) <= np.abs(forecast_ds[right] - goal_dates)
+    projected = forecast_yhat[np.where(closer_left, left, right)]
+
+    return {
+        'status': np.where(projected >= amounts, 'On Track', 'Off Track').astype(object),
+        'projected': projected,
+        'shortfall': np.maximum(amounts - projected, 0.0),
+        'monthly_contribution': monthly,
+    }
@@ -1,11 +1,17 @@
+import os
 import dash
 from dash import dcc, html, Input, Output, State, callback, ALL, ctx
 import dash_bootstrap_components as dbc
-from prophet import Prophet
-import pandas as pd
 import plotly.graph_objs as go
 from datetime import date
-import numpy as np
+from utils.forecast_cache import ForecastCache, forecast_key
+from utils.forecast_service import forecast_service, ForecastError, FORECAST_POLL_MS
+from logic.forecasting import fit_savings_forecast, resolve_engine, compact_forecast
+from logic.goals import evaluate_goals
+from utils.lazy import lazy_import
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
 
 dash.register_page(__name__, path="/savings", title="Savings Forecast", name="Savings Forecast")
 
@@ -221,7 +227,9 @@ layout = html.Div([
 
         dcc.Store(id='savings-store', storage_type='local'),
         dcc.Store(id='goals-store', storage_type='local'),
-        dcc.Store(id='forecast-data-store', storage_type='session')  # Store for tracking forecast data
+        dcc.Store(id='forecast-data-store', storage_type='session'),  # Forecast cache key plus a compact copy for goal checks
+        # Polls for a savings forecast still being fitted in the background
+        dcc.Interval(id='savings-forecast-poll', interval=FORECAST_POLL_MS, n_intervals=0, disabled=True)
     ], style={'padding': '20px', 'backgroundColor': COLORS['light']}),
 
     # Footer
@@ -440,13 +448,49 @@ def save_savings(n_clicks, store_data, amount, date_val):
     return store_data
 
 
+# Model settings for the savings forecast. They are part of the forecast
+# cache key, so changing them refits.
+SAVINGS_FORECAST_CONFIG = {
+    'model': 'auto',                         # 'ets', 'prophet', or 'auto' for ETS until there is enough history for Prophet
+    'changepoint_prior_scale': 0.01,         # Balance between 0.01-0.5 based on data volatility
+    'seasonality_prior_scale': 0.02,         # Control seasonality strength
+    # 'holidays_prior_scale': 1.0,           # Control holiday effects
+    'yearly_seasonality': True,
+    'weekly_seasonality': True,
+    'daily_seasonality': False,
+    'changepoint_range': 0.8,                # Consider more historical data (0.8-0.95)
+    'seasonality_mode': 'additive',          # Often better for data with increasing variance
+    'interval_width': 0.95,                  # Confidence interval width
+}
+SAVINGS_FORECAST_DAYS = 30 * 12
+SAVINGS_FORECAST_STORE_RESOLUTION = os.getenv("SAVINGS_FORECAST_STORE_RESOLUTION", "W")  # D, W or M: rows of the forecast sent back to the browser for goal checks
+SAVINGS_WARM_START_LOOKBACK = 3  # newest records that may be new since a cached forecast we can continue from
+
+# Fitted savings forecasts, reused until the savings records change
+savings_forecast_cache = ForecastCache('savings')
+
+
+# Function to find a cached forecast this history only appends records to
+def get_previous_savings_state(history):
+    """Model state of the cached forecast for history minus its last few
+    records, so the fit can continue from it instead of starting over"""
+    for appended in range(1, min(SAVINGS_WARM_START_LOOKBACK, len(history) - 2) + 1):
+        previous_key = forecast_key('savings', history[:-appended],
+                                    {**SAVINGS_FORECAST_CONFIG, 'periods': SAVINGS_FORECAST_DAYS})
+        previous = savings_forecast_cache.peek(previous_key)
+        if previous is not None and previous.get('state'):
+            return previous['state']
+    return None
+
+
 @callback(
     [Output('savings-forecast-graph', 'figure'),
      Output('forecast-data-store', 'data')],  # Store the forecast data for status checking
     Input('savings-store', 'data'),
-    Input('goals-store', 'data')
+    Input('goals-store', 'data'),
+    Input('savings-forecast-poll', 'n_intervals')
 )
-def update_forecast(data, goal_data):
+def update_forecast(data, goal_data, poll_intervals):
     forecast_data = None  # Initialize forecast data
     
     if not data or not data.get('records'):
@@ -473,66 +517,89 @@ def update_forecast(data, goal_data):
             font={'family': 'Arial, sans-serif'}
         ), forecast_data
 
-    # Fit the Prophet model
-    model = Prophet(
-    changepoint_prior_scale=0.01,         # Balance between 0.01-0.5 based on data volatility
-    seasonality_prior_scale=0.02,         # Control seasonality strength
-    # holidays_prior_scale=1.0,            # Control holiday effects
-    yearly_seasonality=True,
-    weekly_seasonality=True,
-    daily_seasonality=False,
-    changepoint_range=0.8,                # Consider more historical data (0.8-0.95)
-    seasonality_mode='additive',    # Often better for data with increasing variance
-    interval_width=0.95             # Confidence interval width
-    )
-    model.fit(df_prophet)
-    
-    # Make future predictions
-    future = model.make_future_dataframe(periods=30 * 12)
-    forecast = model.predict(future)
-    
-    # Store forecast data for goal tracking
-    forecast_data = forecast.to_dict('records')
+    # Use the cached forecast, or queue the fit and show a baseline until it is ready
+    history = [[ds.strftime('%Y-%m-%d'), float(y)] for ds, y in zip(df_prophet['ds'], df_prophet['y'])]
+    key = forecast_key('savings', history, {**SAVINGS_FORECAST_CONFIG, 'periods': SAVINGS_FORECAST_DAYS})
+    forecast_pending = False
+    # A deposit was just added: carry the previous fit forward rather than refit
+    previous = None if savings_forecast_cache.peek(key) is not None else get_previous_savings_state(history)
+    try:
+        result = forecast_service.request(
+            savings_forecast_cache, key, fit_savings_forecast, history, SAVINGS_FORECAST_CONFIG, SAVINGS_FORECAST_DAYS,
+            previous, inline=resolve_engine(SAVINGS_FORECAST_CONFIG, len(history)) == 'ets')
+    except ForecastError as e:
+        print(f"Error forecasting savings: {e}")
+        result = None
+    else:
+        forecast_pending = result is None
+
+    if ctx.triggered_id == 'savings-forecast-poll' and forecast_pending:
+        raise dash.exceptions.PreventUpdate  # Still fitting, keep the baseline on screen
+
+    forecast = None
+    if result is not None:
+        forecast = pd.DataFrame({column: result[column] for column in ('ds', 'yhat', 'yhat_lower', 'yhat_upper')})
+        forecast['ds'] = pd.to_datetime(forecast['ds'])
+
+        # Goal checks read the full forecast from the cache by key; the
+        # thinned columns are only used if it has been evicted
+        forecast_data = {
+            'key': key,
+            'resolution': SAVINGS_FORECAST_STORE_RESOLUTION,
+            **compact_forecast(result, SAVINGS_FORECAST_STORE_RESOLUTION),
+        }
 
-    # Smooth the forecast line using a rolling mean (e.g., 7-day window)
-    forecast['yhat_smoothed'] = forecast['yhat'].rolling(window=7, center=True, min_periods=1).mean()
-    # Smooth the upper and lower confidence intervals using a rolling mean (e.g., 7-day window)
-    forecast['yhat_upper_smoothed'] = forecast['yhat_upper'].rolling(window=7, center=True, min_periods=1).mean()
-    forecast['yhat_lower_smoothed'] = forecast['yhat_lower'].rolling(window=7, center=True, min_periods=1).mean()
+        # Smooth the forecast line using a rolling mean (e.g., 7-day window)
+        forecast['yhat_smoothed'] = forecast['yhat'].rolling(window=7, center=True, min_periods=1).mean()
+        # Smooth the upper and lower confidence intervals using a rolling mean (e.g., 7-day window)
+        forecast['yhat_upper_smoothed'] = forecast['yhat_upper'].rolling(window=7, center=True, min_periods=1).mean()
+        forecast['yhat_lower_smoothed'] = forecast['yhat_lower'].rolling(window=7, center=True, min_periods=1).mean()
 
 
     # Create the Plotly figure
     fig = go.Figure()
 
-    # Add confidence intervals (shaded region) with smoothed values
-    fig.add_trace(go.Scatter(
-        x=forecast['ds'],
-        y=forecast['yhat_upper_smoothed'],
-        mode='lines',
-        line=dict(width=0),
-        name='Upper Confidence',
-        showlegend=False
-    ))
-    fig.add_trace(go.Scatter(
-        x=forecast['ds'],
-        y=forecast['yhat_lower_smoothed'],
-        mode='lines',
-        fill='tonexty',
-        fillcolor='rgba(52, 152, 219, 0.2)',  # Light blue fill
-        line=dict(width=0),
-        name='Confidence Interval',
-        showlegend=True
-    ))
-
-
-    # Add forecast points (smoothed line)
-    fig.add_trace(go.Scatter(
-        x=forecast['ds'],
-        y=forecast['yhat_smoothed'],
-        mode='lines',
-        name='Forecast',
-        line=dict(color=COLORS['accent'], width=3),
-    ))
+    if forecast is not None:
+        # Add confidence intervals (shaded region) with smoothed values
+        fig.add_trace(go.Scatter(
+            x=forecast['ds'],
+            y=forecast['yhat_upper_smoothed'],
+            mode='lines',
+            line=dict(width=0),
+            name='Upper Confidence',
+            showlegend=False
+        ))
+        fig.add_trace(go.Scatter(
+            x=forecast['ds'],
+            y=forecast['yhat_lower_smoothed'],
+            mode='lines',
+            fill='tonexty',
+            fillcolor='rgba(52, 152, 219, 0.2)',  # Light blue fill
+            line=dict(width=0),
+            name='Confidence Interval',
+            showlegend=True
+        ))
+
+
+        # Add forecast points (smoothed line)
+        fig.add_trace(go.Scatter(
+            x=forecast['ds'],
+            y=forecast['yhat_smoothed'],
+            mode='lines',
+            name='Forecast',
+            line=dict(color=COLORS['accent'], width=3),
+        ))
+    else:
+        # Baseline while the forecast is fitted: hold the latest balance flat
+        last_date = df_prophet['ds'].iloc[-1]
+        last_value = df_prophet['y'].iloc[-1]
+        fig.add_trace(go.Scatter(
+            x=[last_date, last_date + pd.Timedelta(days=SAVINGS_FORECAST_DAYS)],
+            y=[last_value, last_value],
+            mode='lines',
+            name='Baseline (forecast updating)' if forecast_pending else 'Baseline',
+            line=dict(color=COLORS['accent'], width=2, dash='dash'),
+        ))
 
 
     # Add actual data points (scatter + line combo)
@@ -547,26 +614,17 @@ def update_forecast(data, goal_data):
 
     # Plot goals if any - using horizontal line with center dot as requested
     if goal_data and goal_data.get('goals'):
-        for goal in goal_data['goals']:
+        goals = goal_data['goals']
+        evaluation = evaluate_goals(
+            [pd.to_datetime(goal['date']).date() for goal in goals], [goal['amount'] for goal in goals],
+            df_prophet['ds'].values, df_prophet['y'].values,
+            result['ds'] if result is not None else None, result['yhat'] if result is not None else None,
+        )
+        for goal, monthly_contribution in zip(goals, evaluation['monthly_contribution']):
             goal_date = pd.to_datetime(goal['date'])
             goal_amount = goal['amount']
             goal_name = goal.get('name', "Unnamed Goal")  # Use "Unnamed Goal" if 'name' is missing
 
-            # Get the current savings at the goal date (the most recent savings before the goal date)
-            current_savings_at_goal = df_prophet[df_prophet['ds'] <= goal_date]['y'].iloc[-1] if not df_prophet[df_prophet['ds'] <= goal_date].empty else 0
-
-            # Calculate the remaining amount to reach the goal
-            remaining_amount = goal_amount - current_savings_at_goal
-
-            # Calculate the number of months from now to the goal date
-            months_remaining = (goal_date - pd.to_datetime(df_prophet['ds'].iloc[-1])).days / 30
-
-            # If the months_remaining is positive, calculate the monthly contribution needed
-            if months_remaining > 0:
-                monthly_contribution = remaining_amount / months_remaining
-            else:
-                monthly_contribution = 0  # If no months remaining, no need for contribution
-
             # Create a label with the goal name and monthly contribution
             goal_label = f"{goal_name} (Contribute £{monthly_contribution:.2f} per month)"
 
@@ -637,12 +695,23 @@ def update_forecast(data, goal_data):
             linecolor='rgba(200, 200, 200, 1)',
             linewidth=1,
             tickprefix='£'
-        )
+        ),
+        meta={'forecast_pending': forecast_pending}
     )
 
     return fig, forecast_data
 
 
+# Poll while the graph is showing a baseline for a pending forecast
+@callback(
+    Output('savings-forecast-poll', 'disabled'),
+    Input('savings-forecast-graph', 'figure')
+)
+def toggle_savings_forecast_poll(figure):
+    meta = ((figure or {}).get('layout') or {}).get('meta') or {}
+    return not meta.get('forecast_pending', False)
+
+
 # Create savings table content
 def create_savings_table(data):
     if not data or not data.get('records'):
@@ -718,36 +787,31 @@ def create_savings_table(data):
     ], style={'padding': '5px'})
 
 
-def check_goal_status(goal, forecast_data):
-    """Check if a goal is on track based on forecast data"""
-    if not forecast_data:
-        return None  # No forecast data to determine status
-        
-    # Convert forecast data to DataFrame
-    forecast_df = pd.DataFrame(forecast_data)
-    
-    # Convert date strings to datetime objects
-    forecast_df['ds'] = pd.to_datetime(forecast_df['ds'])
-    goal_date = pd.to_datetime(goal['date'])
-    
-    # Find the forecast value closest to the goal date
-    closest_forecast = forecast_df.iloc[forecast_df['ds'].sub(goal_date).abs().argsort()[:1]]
-    
-    if closest_forecast.empty:
+# Function to get the savings forecast behind forecast-data-store
+def get_goal_forecast(forecast_data):
+    """(dates, yhat) arrays: the full daily forecast from the cache when it is
+    still there, otherwise the compact columns kept in the store"""
+    if not forecast_data or not forecast_data.get('ds'):
         return None
-    
-    # Get the predicted value
-    predicted_value = closest_forecast['yhat'].values[0]
-    
-    # Compare with goal amount
-    if predicted_value >= goal['amount']:
-        return "On Track"
-    else:
-        return "Off Track"
+    key = forecast_data.get('key')
+    columns = (key and savings_forecast_cache.get(key)) or forecast_data
+    return np.array(columns['ds'], dtype='datetime64[D]'), np.asarray(columns['yhat'], dtype=float)
+
+
+# Function to get the savings history the forecast is fitted on
+def get_savings_history(savings_data):
+    """(dates, cumulative savings) arrays, one row per date, sorted"""
+    records = (savings_data or {}).get('records') or []
+    if not records:
+        return np.array([], dtype='datetime64[D]'), np.array([])
+    df = pd.DataFrame(records)
+    df['date'] = pd.to_datetime(df['date'])
+    df = df.groupby('date')['amount'].sum().sort_index()
+    return df.index.values.astype('datetime64[D]'), df.values.astype(float)
 
 
 # Create goals table content
-def create_goals_table(data, forecast_data):
+def create_goals_table(data, forecast_data, savings_data=None):
     if not data or not data.get('goals'):
         return html.Div([
             html.I(className="fas fa-info-circle mr-2", style={'color': COLORS['accent']}),
@@ -763,8 +827,13 @@ def create_goals_table(data, forecast_data):
         
     df['index'] = df.index  # Add index for deletion
     
-    # Add status column
-    df['status'] = df.apply(lambda row: check_goal_status(row, forecast_data), axis=1)
+    # Add status column, every goal checked against the forecast at once
+    forecast = get_goal_forecast(forecast_data)
+    evaluation = evaluate_goals(
+        pd.to_datetime(df['date']).values, df['amount'].values, *get_savings_history(savings_data),
+        *(forecast or (None, None)),
+    )
+    df['status'] = evaluation['status']
 
     table_header = [
         html.Thead(html.Tr([
@@ -876,7 +945,7 @@ def update_data_view(view_type, savings_data, goals_data, forecast_data):
     elif view_type == 'savings':
         return create_savings_table(savings_data)
     elif view_type == 'goals':
-        return create_goals_table(goals_data, forecast_data)
+        return create_goals_table(goals_data, forecast_data, savings_data)
     
     # Default empty state
     return html.Div()
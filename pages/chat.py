@@ -2,27 +2,28 @@ import dash
 from dash import html, dcc, callback, Input, Output, State, register_page, ALL, MATCH, clientside_callback, callback_context, no_update
 import dash_bootstrap_components as dbc
 from dash.exceptions import PreventUpdate
-import pandas as pd
 import plotly.graph_objects as go
-import plotly.express as px
 import json
 import uuid
 from datetime import datetime, timedelta
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from utils.db import connect_db
+from utils.db import (get_user_snapshot, rollup_expenses, add_dashboard_component, delete_dashboard_component,
+                      get_expense_columns)
+from utils.write_behind import dashboard_layout_writer
+from utils.lazy import lazy_import
 import random
 import dash_draggable
 import copy
-import numpy as np
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import dash_player
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import smtplib
 import os
 
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+px = lazy_import('plotly.express')
+subplots = lazy_import('plotly.subplots')
+
 
 # Register this file as the chat page
 register_page(__name__, path='/chat', name='Chat')
@@ -52,24 +53,16 @@ COLORS_CHART = {
     'chart_palette': ['#1E40AF', '#3B82F6', '#60A5FA', '#93C5FD', '#BFDBFE', '#2563EB', '#1D4ED8', '#DBEAFE']
 }
 
-# Database connection function
-def get_db_connection():
-    """Connect to the PostgreSQL database"""
-    try:
-        conn = connect_db()
-        return conn
-    except Exception as e:
-        # # print(f"Error connecting to database: {e}")
-        return None
-
 def get_user_data(user_id):
     """Get user data from database or return default for guest users"""
     # Handle guest or invalid user IDs gracefully
     if not user_id or user_id == 'Guest':
+        demo_expenses = generate_demo_expense_data()
         return {
             'user_info': {'id': 'Guest', 'name': 'Guest User'},
             'income': generate_demo_income_data(),
-            'expenses': generate_demo_expense_data(),
+            'expenses': demo_expenses,
+            'expense_rollup': rollup_expenses(demo_expenses),
             'savings_goals': [],
             'transactions': [],
             'dashboard_settings': {  # Return as object, not JSON string
@@ -92,52 +85,33 @@ def get_user_data(user_id):
             }
         }
 
-    conn = get_db_connection()
-    if not conn:
-        return {}
-
-    user_data = {}
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # Get user info
-            cur.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
-            user = cur.fetchone()
-            if not user:
-                print(f"User {user_id} not found in database")
-                return {}
-
-            user_data['user_info'] = dict(user)
-
-            # Get income data
-            cur.execute("SELECT * FROM income WHERE user_id = %s", (user_id,))
-            user_data['income'] = [dict(row) for row in cur.fetchall()]
-
-            # Get expense data
-            cur.execute("SELECT * FROM expense WHERE user_id = %s", (user_id,))
-            user_data['expenses'] = [dict(row) for row in cur.fetchall()]
-
-            # Get savings goals
-            cur.execute("SELECT * FROM saving_goals WHERE user_id = %s", (user_id,))
-            user_data['savings_goals'] = [dict(row) for row in cur.fetchall()]
-
-            # Get transactions
-            cur.execute(
-                "SELECT * FROM transactions WHERE user_id = %s ORDER BY date DESC LIMIT 50",
-                (user_id,)
-            )
-            user_data['transactions'] = [dict(row) for row in cur.fetchall()]
+        user_data = get_user_snapshot(user_id)
+    except Exception as e:
+        print(f"Error fetching user data: {e}")
+        return {}
 
-            # Get dashboard settings
-            cur.execute("SELECT dashboard_settings FROM users WHERE user_id = %s", (user_id,))
-            dashboard_settings = cur.fetchone()
+    if not user_data:
+        print(f"User {user_id} not found in database")
+        return user_data
 
-    except Exception as e:
-         print(f"Error fetching user data: {e}")
-    finally:
-        conn.close()
+    # Moved cards may still be waiting in the write-behind queue
+    pending_positions = dashboard_layout_writer.peek(user_data['user_info']['user_id'])
+    if pending_positions:
+        for component in user_data['dashboard_settings'].get('components', []):
+            if component['id'] in pending_positions:
+                component['position'] = pending_positions[component['id']]
 
     return user_data
 
+def get_dashboard_user_id(user_data):
+    """The database user id from user-data-store, or None for guests"""
+    user_info = (user_data or {}).get('user_info', {})
+    user_id = user_info.get('user_id') or user_info.get('id')
+    if not user_id or user_id == 'Guest':
+        return None
+    return user_id
+
 # Generate demo data for development and guest users
 def generate_demo_income_data():
     """Generate demo income data for testing"""
@@ -186,7 +160,6 @@ def generate_income_breakdown_pie(income_data, settings=None):
     import plotly.graph_objects as go
     import pandas as pd
     import plotly.io as pio
-    from plotly.subplots import make_subplots
 
     # Set base template
     pio.templates.default = "plotly_white"
@@ -215,7 +188,7 @@ def generate_income_breakdown_pie(income_data, settings=None):
     ][:len(labels)]
 
     # Donut chart
-    fig = make_subplots(rows=1, cols=1, specs=[[{'type': 'domain'}]])
+    fig = subplots.make_subplots(rows=1, cols=1, specs=[[{'type': 'domain'}]])
     fig.add_trace(go.Pie(
         labels=labels,
         values=values,
@@ -274,8 +247,15 @@ def generate_income_breakdown_pie(income_data, settings=None):
 
     return fig
 
-def generate_monte_carlo_simulation(income_data, settings=None, simulations=100):
-    """Generate Monte Carlo simulation for income projections"""
+# Default seed for the income simulation, so a refresh redraws the same fan
+MONTE_CARLO_SEED = 42
+# Most paths a component's settings may ask for; memory grows with paths x months
+MONTE_CARLO_MAX_SIMULATIONS = 50000
+
+def generate_monte_carlo_simulation(income_data, settings=None, simulations=10000):
+    """Generate Monte Carlo simulation for income projections, shown as
+    P5/P25/P50/P75/P95 bands. settings may set 'simulations' (1 to
+    MONTE_CARLO_MAX_SIMULATIONS) and 'seed'."""
     import plotly.graph_objects as go
     import pandas as pd
     import numpy as np
@@ -304,54 +284,64 @@ def generate_monte_carlo_simulation(income_data, settings=None, simulations=100)
     
     # Project forward 24 months
     months = 24
-    simulations = min(simulations, 200)  # Cap at 200 simulations for performance
+    settings = settings or {}
+    try:
+        requested = int(settings.get('simulations', simulations))
+    except (TypeError, ValueError):
+        requested = 0
+    if requested <= 0:
+        print(f"Ignoring invalid Monte Carlo simulations setting: {settings.get('simulations')!r}")
+        requested = simulations
+    simulations = min(requested, MONTE_CARLO_MAX_SIMULATIONS)
+    rng = np.random.default_rng(settings.get('seed', MONTE_CARLO_SEED))
+
+    # A flat history has no spread to sample from
+    avg_growth = float(np.nan_to_num(avg_growth))
+    std_dev = float(np.nan_to_num(std_dev))
     
     # Create dates for projection
     last_date = datetime.now()
     dates = [last_date + timedelta(days=30*i) for i in range(months)]
     
-    # Run Monte Carlo simulations
-    all_simulations = []
-    for sim in range(simulations):
-        values = [last_value]
-        for i in range(1, months):
-            # Random growth with normal distribution
-            growth = np.random.normal(avg_growth, std_dev)
-            next_value = values[-1] * (1 + growth)
-            values.append(next_value)
-        all_simulations.append(values)
+    # Run all Monte Carlo simulations at once: one matrix of monthly growth
+    # draws, compounded along each path
+    growth = rng.normal(avg_growth, std_dev, size=(simulations, months - 1))
+    factors = np.hstack([np.ones((simulations, 1)), 1 + growth])
+    paths = last_value * np.cumprod(factors, axis=1)
     
-    # Calculate median values
-    median_values = np.median(all_simulations, axis=0)
+    # Percentile fan instead of one trace per path
+    p5, p25, p50, p75, p95 = np.percentile(paths, [5, 25, 50, 75, 95], axis=0)
     
     # Create the figure
     fig = go.Figure()
     
-    # Add individual simulations
-    for i, sim_values in enumerate(all_simulations):
-        if i == 0:
-            fig.add_trace(go.Scatter(
-                x=dates, 
-                y=sim_values,
-                line=dict(color='rgba(0, 130, 200, 0.1)', width=1),
-                name='Simulation',
-                hoverinfo='none',
-                showlegend=False
-            ))
-        else:
-            fig.add_trace(go.Scatter(
-                x=dates, 
-                y=sim_values,
-                line=dict(color='rgba(0, 130, 200, 0.1)', width=1),
-                name='Simulation',
-                hoverinfo='none',
-                showlegend=False
-            ))
+    # Add the outer (P5-P95) and inner (P25-P75) bands
+    for lower, upper, fill, label in [
+        (p5, p95, 'rgba(0, 130, 200, 0.12)', '90% of simulations'),
+        (p25, p75, 'rgba(0, 130, 200, 0.25)', '50% of simulations'),
+    ]:
+        fig.add_trace(go.Scatter(
+            x=dates,
+            y=upper,
+            line=dict(width=0),
+            hoverinfo='skip',
+            showlegend=False
+        ))
+        fig.add_trace(go.Scatter(
+            x=dates,
+            y=lower,
+            line=dict(width=0),
+            fill='tonexty',
+            fillcolor=fill,
+            name=label,
+            customdata=upper,
+            hovertemplate='£%{y:,.0f} – £%{customdata:,.0f}<extra>' + label + '</extra>'
+        ))
     
     # Add median line
     fig.add_trace(go.Scatter(
         x=dates,
-        y=median_values,
+        y=p50,
         line=dict(color='#0082c8', width=3),
         name='Median Forecast',
         hovertemplate='<b>%{x|%b %Y}</b><br>£%{y:,.2f}<extra></extra>'
@@ -1140,7 +1130,7 @@ def generate_income_insights_modal(user_data):
                     html.Div([
                         html.H4("Income Forecast Simulation", className="chart-title"),
                         dcc.Graph(
-                            figure=generate_monte_carlo_simulation(income_data, {"simulations": 100}),
+                            figure=generate_monte_carlo_simulation(income_data, {"simulations": 10000}),
                             config={'displayModeBar': False},
                             className="insights-chart"
                         ),
@@ -1311,7 +1301,7 @@ def prepare_insight_for_dashboard(n_clicks_list, current_settings, user_data, bu
         # Income chart types (1-6)
         1: {"type": "income_forecast", "title": "Income Forecast", "settings": {"chart_type": "line"}, "months_ahead": 6},
         2: {"type": "income_breakdown_pie", "title": "Income Sources", "settings": {"chart_type": "pie"}},
-        3: {"type": "income_monte_carlo", "title": "Income Forecast Simulation", "settings": {"simulations": 100}},
+        3: {"type": "income_monte_carlo", "title": "Income Forecast Simulation", "settings": {"simulations": 10000}},
         4: {"type": "income_heatmap", "title": "Income Heatmap", "settings": {}},
         5: {"type": "income_seasonality", "title": "Income Seasonality", "settings": {}},
         6: {"type": "income_growth", "title": "Year-over-Year Growth", "settings": {}},
@@ -1439,10 +1429,10 @@ def update_dashboard_with_insight(insight_data, current_settings, user_data, cur
     # Generate components with the updated settings
     components, _ = generate_dashboard_components(current_settings, user_data)
 
-    # Save if user is not guest
-    user_id = user_data.get('user_info', {}).get('id')
-    if user_id and user_id != 'Guest':
-        save_dashboard_settings_to_db(user_id, current_settings)
+    # Save only the new card if user is not guest
+    user_id = get_dashboard_user_id(user_data)
+    if user_id:
+        add_dashboard_component(user_id, new_component)
 
     empty_style = {"display": "none"}
     
@@ -1477,8 +1467,8 @@ def generate_expense_breakdown(data, settings=None, period='monthly'):
     if settings is None:
         settings = {}
     
-    # Check if user_data is a list and convert to DataFrame
-    if isinstance(data, list) and len(data) > 0:
+    # Accept a list of records or a columnar DataFrame (utils.db.get_expense_columns)
+    if isinstance(data, (list, pd.DataFrame)) and len(data) > 0:
         df = pd.DataFrame(data)
     else:
         # Create demo data with realistic categories
@@ -1747,6 +1737,7 @@ def generate_expenses_insights_modal(user_data):
     - due_date: Date
     """
     expenses_data = user_data.get('expenses', [])
+    expense_rollup = user_data.get('expense_rollup', [])
     
     # Check if we have data
     if not expenses_data:
@@ -1776,7 +1767,7 @@ def generate_expenses_insights_modal(user_data):
                     html.Div([
                         html.H4("Monthly Spending Overview", className="chart-title"),
                         dcc.Graph(
-                            figure=generate_monthly_spending_overview(expenses_data, {"color_scheme": colors_expense}),
+                            figure=generate_monthly_spending_overview(expense_rollup, {"color_scheme": colors_expense}),
                             config={'displayModeBar': False},
                             className="insights-chart"
                         ),
@@ -1789,7 +1780,7 @@ def generate_expenses_insights_modal(user_data):
                     html.Div([
                         html.H4("Expense Breakdown", className="chart-title"),
                         dcc.Graph(
-                            figure=generate_expense_categories_donut(expenses_data, {"color_scheme": colors_expense}),
+                            figure=generate_expense_categories_donut(expense_rollup, {"color_scheme": colors_expense}),
                             config={'displayModeBar': False},
                             className="insights-chart"
                         ),
@@ -1802,7 +1793,7 @@ def generate_expenses_insights_modal(user_data):
                     html.Div([
                         html.H4("Budget vs. Actual", className="chart-title"),
                         dcc.Graph(
-                            figure=generate_budget_vs_actual(expenses_data, user_data.get('budget', {}), {"color_scheme": colors_expense}),
+                            figure=generate_budget_vs_actual(expense_rollup, user_data.get('budget', {}), {"color_scheme": colors_expense}),
                             config={'displayModeBar': False},
                             className="insights-chart"
                         ),
@@ -1818,7 +1809,7 @@ def generate_expenses_insights_modal(user_data):
                     html.Div([
                         html.H4("Top Spending Categories", className="chart-title"),
                         dcc.Graph(
-                            figure=generate_top_spending_categories(expenses_data, {"color_scheme": colors_expense}),
+                            figure=generate_top_spending_categories(expense_rollup, {"color_scheme": colors_expense}),
                             config={'displayModeBar': False},
                             className="insights-chart"
                         ),
@@ -1831,7 +1822,7 @@ def generate_expenses_insights_modal(user_data):
                     html.Div([
                         html.H4("Spending Trends", className="chart-title"),
                         dcc.Graph(
-                            figure=generate_spending_trends(expenses_data, {"color_scheme": colors_expense}),
+                            figure=generate_spending_trends(expense_rollup, {"color_scheme": colors_expense}),
                             config={'displayModeBar': False},
                             className="insights-chart"
                         ),
@@ -1859,11 +1850,11 @@ def generate_expenses_insights_modal(user_data):
 
 # Helper functions for each chart
 
-def generate_monthly_spending_overview(expenses_data, options):
+def generate_monthly_spending_overview(expense_rollup, options):
     """Generate a bar chart showing monthly spending with trend line
     
     Parameters:
-    - expenses_data: List of expense records from SQL database
+    - expense_rollup: Monthly category totals from the expense rollup (get_expense_rollup)
     - options: Dictionary with chart customization options
     
     Returns:
@@ -1886,20 +1877,11 @@ def generate_monthly_spending_overview(expenses_data, options):
     for key, value in default_colors.items():
         colors.setdefault(key, value)
     
-    # Process the actual expense data into monthly totals
-    # Group expenses by month and calculate totals
+    # Sum the rollup's per-category rows into monthly totals
     monthly_data = {}
     
-    # Convert dates to datetime objects if they're strings
-    for expense in expenses_data:
-        date = expense['date'] if isinstance(expense['date'], datetime) else datetime.fromisoformat(expense['date'].replace('Z', '+00:00'))
-        month_key = date.strftime('%Y-%m')
-        amount = float(expense['amount'])
-        
-        if month_key in monthly_data:
-            monthly_data[month_key] += amount
-        else:
-            monthly_data[month_key] = amount
+    for row in expense_rollup:
+        monthly_data[row['month']] = monthly_data.get(row['month'], 0) + float(row['total'])
     
     # Sort by month
     sorted_months = sorted(monthly_data.keys())
@@ -1947,11 +1929,11 @@ def generate_monthly_spending_overview(expenses_data, options):
     
     return fig
 
-def generate_expense_categories_donut(expenses_data, options):
+def generate_expense_categories_donut(expense_rollup, options):
     """Generate a modern donut chart for expense categories
     
     Parameters:
-    - expenses_data: List of expense records from SQL database
+    - expense_rollup: Monthly category totals from the expense rollup (get_expense_rollup)
     - options: Dictionary with chart customization options
     
     Returns:
@@ -1974,17 +1956,11 @@ def generate_expense_categories_donut(expenses_data, options):
     for key, value in default_colors.items():
         colors.setdefault(key, value)
     
-    # Process the actual expense data into category totals
+    # Sum the rollup's monthly rows into category totals
     category_totals = {}
     
-    for expense in expenses_data:
-        category = expense['category'] if expense['category'] else 'Uncategorized'
-        amount = float(expense['amount'])
-        
-        if category in category_totals:
-            category_totals[category] += amount
-        else:
-            category_totals[category] = amount
+    for row in expense_rollup:
+        category_totals[row['category']] = category_totals.get(row['category'], 0) + float(row['total'])
     
     # Sort categories by amount (descending)
     sorted_categories = sorted(category_totals.items(), key=lambda x: x[1], reverse=True)
@@ -2044,11 +2020,11 @@ def generate_expense_categories_donut(expenses_data, options):
     
     return fig
 
-def generate_budget_vs_actual(expenses_data, budget_data, options):
+def generate_budget_vs_actual(expense_rollup, budget_data, options):
     """Generate a bar chart comparing budget vs actual spending by category
     
     Parameters:
-    - expenses_data: List of expense records from SQL database
+    - expense_rollup: Monthly category totals from the expense rollup (get_expense_rollup)
     - budget_data: Dictionary with budget amounts by category
     - options: Dictionary with chart customization options
     
@@ -2072,42 +2048,23 @@ def generate_budget_vs_actual(expenses_data, budget_data, options):
     for key, value in default_colors.items():
         colors.setdefault(key, value)
     
-    # Process the actual expense data into category totals
-    category_totals = {}
-    
-    # Get actual spending by category
-    for expense in expenses_data:
-        category = expense['category'] if expense['category'] else 'Uncategorized'
-        amount = float(expense['amount'])
-        
-        if category in category_totals:
-            category_totals[category] += amount
-        else:
-            category_totals[category] = amount
+    # Get current month for budget comparison
+    current_month_key = datetime.now().strftime('%Y-%m')
     
-    # Get current month and year for budget comparison
-    current_date = datetime.now()
-    current_month = current_date.month
-    current_year = current_date.year
-    
-    # Filter expenses for the current month only
+    # All-time and current-month spending by category, straight from the rollup
+    category_totals = {}
     current_month_expenses = {}
-    for expense in expenses_data:
-        date = expense['date'] if isinstance(expense['date'], datetime) else datetime.fromisoformat(expense['date'].replace('Z', '+00:00'))
-        if date.month == current_month and date.year == current_year:
-            category = expense['category'] if expense['category'] else 'Uncategorized'
-            amount = float(expense['amount'])
-            
-            if category in current_month_expenses:
-                current_month_expenses[category] += amount
-            else:
-                current_month_expenses[category] = amount
+    for row in expense_rollup:
+        category = row['category']
+        amount = float(row['total'])
+        category_totals[category] = category_totals.get(category, 0) + amount
+        if row['month'] == current_month_key:
+            current_month_expenses[category] = current_month_expenses.get(category, 0) + amount
     
     # If no budget data is provided, create a simple estimate based on category totals
     if not budget_data:
         # Use average monthly spend as a simple budget estimate
-        num_months = max(1, len(set((datetime.fromisoformat(expense['date'].replace('Z', '+00:00')).strftime('%Y-%m') 
-                        for expense in expenses_data))))
+        num_months = max(1, len(set(row['month'] for row in expense_rollup)))
         
         budget_estimates = {}
         for category, total in category_totals.items():
@@ -2157,11 +2114,11 @@ def generate_budget_vs_actual(expenses_data, budget_data, options):
     
     return fig
 
-def generate_top_spending_categories(expenses_data, options):
+def generate_top_spending_categories(expense_rollup, options):
     """Generate a horizontal bar chart showing top spending categories
     
     Parameters:
-    - expenses_data: List of expense records from SQL database
+    - expense_rollup: Monthly category totals from the expense rollup (get_expense_rollup)
     - options: Dictionary with chart customization options
     
     Returns:
@@ -2187,36 +2144,21 @@ def generate_top_spending_categories(expenses_data, options):
     # Get time frame - default to past 30 days
     days = options.get("days", 30)
     
-    # Calculate cutoff date
+    # Calculate cutoff month - the rollup is monthly, so the window covers
+    # every month the last `days` days touch
     today = datetime.now()
-    cutoff_date = today - timedelta(days=days)
-    
-    # Filter expenses within the time period
-    filtered_expenses = []
-    for expense in expenses_data:
-        date = expense['date'] if isinstance(expense['date'], datetime) else datetime.fromisoformat(expense['date'].replace('Z', '+00:00'))
-        if date >= cutoff_date:
-            filtered_expenses.append(expense)
+    cutoff_month = (today - timedelta(days=days)).strftime('%Y-%m')
     
-    # Group by description and sum amounts
-    merchant_totals = {}
-    for expense in filtered_expenses:
-        description = expense['description'].strip()
-        # Skip empty descriptions
-        if not description:
-            continue
-            
-        amount = float(expense['amount'])
-        
-        if description in merchant_totals:
-            merchant_totals[description] += amount
-        else:
-            merchant_totals[description] = amount
+    # Sum category totals for the months within the time period
+    category_totals = {}
+    for row in expense_rollup:
+        if row['month'] >= cutoff_month:
+            category_totals[row['category']] = category_totals.get(row['category'], 0) + float(row['total'])
     
-    # Sort and get top 10 merchants
-    top_merchants = sorted(merchant_totals.items(), key=lambda x: x[1], reverse=True)[:10]
+    # Sort and get top 10 categories
+    top_categories = sorted(category_totals.items(), key=lambda x: x[1], reverse=True)[:10]
     
-    if not top_merchants:
+    if not top_categories:
         # No data, return empty figure with message
         fig = go.Figure()
         fig.update_layout(
@@ -2236,12 +2178,12 @@ def generate_top_spending_categories(expenses_data, options):
         )
         return fig
     
-    # Extract merchants and amounts
-    merchants = [merchant for merchant, _ in top_merchants]
-    amounts = [amount for _, amount in top_merchants]
+    # Extract categories and amounts
+    categories = [category for category, _ in top_categories]
+    amounts = [amount for _, amount in top_categories]
     
     # Create color gradient based on amounts
-    color_scale = np.linspace(0.3, 1, len(merchants))
+    color_scale = np.linspace(0.3, 1, len(categories))
     bar_colors = [f'rgba({int(26)}, {int(115)}, {int(232)}, {alpha})' for alpha in color_scale]
     
     # Create figure
@@ -2249,7 +2191,7 @@ def generate_top_spending_categories(expenses_data, options):
     
     # Add horizontal bars
     fig.add_trace(go.Bar(
-        y=merchants,
+        y=categories,
         x=amounts,
         orientation='h',
         marker=dict(
@@ -2293,11 +2235,11 @@ def generate_top_spending_categories(expenses_data, options):
     
     return fig
 
-def generate_spending_trends(expenses_data, options):
+def generate_spending_trends(expense_rollup, options):
     """Generate an area chart showing spending trends over time by category
     
     Parameters:
-    - expenses_data: List of expense records from SQL database
+    - expense_rollup: Monthly category totals from the expense rollup (get_expense_rollup)
     - options: Dictionary with chart customization options
     
     Returns:
@@ -2323,18 +2265,14 @@ def generate_spending_trends(expenses_data, options):
     # Get time frame - default to past 6 months
     months = options.get("months", 6)
     
-    # Calculate cutoff date
+    # Calculate cutoff month
     today = datetime.now()
-    cutoff_date = today - timedelta(days=months*30)  # Approximate
+    cutoff_month = (today - timedelta(days=months*30)).strftime('%Y-%m')  # Approximate
     
-    # Filter expenses within the time period
-    filtered_expenses = []
-    for expense in expenses_data:
-        date = expense['date'] if isinstance(expense['date'], datetime) else datetime.fromisoformat(expense['date'].replace('Z', '+00:00'))
-        if date >= cutoff_date:
-            filtered_expenses.append(expense)
+    # Filter rollup rows within the time period
+    filtered_rows = [row for row in expense_rollup if row['month'] >= cutoff_month]
     
-    if not filtered_expenses:
+    if not filtered_rows:
         # No data, return empty figure with message
         fig = go.Figure()
         fig.update_layout(
@@ -2368,11 +2306,10 @@ def generate_spending_trends(expenses_data, options):
     # Group expenses by month and category type
     monthly_data = {}
     
-    for expense in filtered_expenses:
-        date = expense['date'] if isinstance(expense['date'], datetime) else datetime.fromisoformat(expense['date'].replace('Z', '+00:00'))
-        month_key = date.strftime('%Y-%m')
-        category = expense['category'] if expense['category'] else 'Uncategorized'
-        amount = float(expense['amount'])
+    for row in filtered_rows:
+        month_key = row['month']
+        category = row['category']
+        amount = float(row['total'])
         
         # Determine category type
         if any(cat.lower() in category.lower() for cat in essential_categories):
@@ -2469,7 +2406,6 @@ def generate_recurring_expenses(expenses_data, options):
     """
     from datetime import datetime
     import plotly.graph_objects as go
-    from plotly.subplots import make_subplots
     
     default_colors = {
         'primary': '#FF8C00',  # Dark Orange
@@ -2560,7 +2496,7 @@ def generate_recurring_expenses(expenses_data, options):
     monthly_total = sum(amounts)
     
     # Create figure with subplots
-    fig = make_subplots(
+    fig = subplots.make_subplots(
         rows=2, cols=1,
         row_heights=[0.7, 0.3],
         vertical_spacing=0.1,
@@ -3855,10 +3791,10 @@ def add_component_to_dashboard(n_clicks, chart_data, current_settings, user_data
     # Generate components with the updated settings
     components, _ = generate_dashboard_components(current_settings, user_data)
 
-    # Save if user is not guest
-    user_id = user_data.get('user_info', {}).get('id')
-    if user_id and user_id != 'Guest':
-        save_dashboard_settings_to_db(user_id, current_settings)
+    # Save only the new card if user is not guest
+    user_id = get_dashboard_user_id(user_data)
+    if user_id:
+        add_dashboard_component(user_id, new_component)
 
     empty_style = {"display": "none"}
     
@@ -3913,9 +3849,10 @@ def remove_dashboard_component(n_clicks_list, id_list, current_settings, user_da
     if is_empty:
         current_layouts = {'lg': [], 'md': [], 'sm': [], 'xs': []}
 
-    # Save the settings to the database if not a guest user
-    if user_data.get('user_info', {}).get('user_id') != 'Guest':
-        save_dashboard_settings_to_db(user_data['user_info']['user_id'], current_settings)
+    # Delete just this card from the database if not a guest user
+    user_id = get_dashboard_user_id(user_data)
+    if user_id:
+        delete_dashboard_component(user_id, clicked_id)
 
     return current_settings, empty_style, components, current_layouts
 
@@ -3941,6 +3878,17 @@ def generate_dashboard_components(settings, user_data):
     # Get user data
     income_data = user_data.get('income', [])
     expense_data = user_data.get('expenses', [])
+    expense_rollup = user_data.get('expense_rollup', [])
+
+    # Signed-in users' expense breakdowns read typed columns straight from the
+    # database (one query per render) instead of the records in the store
+    expense_columns = expense_data
+    user_id = get_dashboard_user_id(user_data)
+    if user_id and any(component.get('type') == 'expense_breakdown' for component in settings['components']):
+        try:
+            expense_columns = get_expense_columns(user_id)
+        except Exception as e:
+            print(f"Error fetching expense columns: {e}")
     
     # print(f"DEBUG: Processing {len(settings['components'])} components")
     
@@ -4047,7 +3995,7 @@ def generate_dashboard_components(settings, user_data):
         elif component_type == 'expense_breakdown':
             expense_graph = dcc.Graph(
                 id={"type": "component-graph", "index": component_id},
-                figure=generate_expense_breakdown(expense_data, component_settings),
+                figure=generate_expense_breakdown(expense_columns, component_settings),
                 config={'displayModeBar': False},
                 className="component-graph",
                 style={"height": "100%", "width": "100%"}
@@ -4099,7 +4047,7 @@ def generate_dashboard_components(settings, user_data):
         elif component_type == 'expenses_forecast':
             monthly_spending_graph = dcc.Graph(
                 id={"type": "component-graph", "index": component_id},
-                figure=generate_monthly_spending_overview(expense_data, component_settings),
+                figure=generate_monthly_spending_overview(expense_rollup, component_settings),
                 config={'displayModeBar': False},
                 className="component-graph",
                 style={"height": "100%", "width": "100%"}
@@ -4110,7 +4058,7 @@ def generate_dashboard_components(settings, user_data):
         elif component_type == 'expenses_breakdown_pie':
             expense_breakdown_graph = dcc.Graph(
                 id={"type": "component-graph", "index": component_id},
-                figure=generate_expense_categories_donut(expense_data, component_settings),
+                figure=generate_expense_categories_donut(expense_rollup, component_settings),
                 config={'displayModeBar': False},
                 className="component-graph",
                 style={"height": "100%", "width": "100%"}
@@ -4122,7 +4070,7 @@ def generate_dashboard_components(settings, user_data):
             budget_data = None # Setting this to None for now
             budget_vs_actual_graph = dcc.Graph(
                 id={"type": "component-graph", "index": component_id},
-                figure=generate_budget_vs_actual(expense_data, budget_data, component_settings),
+                figure=generate_budget_vs_actual(expense_rollup, budget_data, component_settings),
                 config={'displayModeBar': False},
                 className="component-graph",
                 style={"height": "100%", "width": "100%"}
@@ -4133,7 +4081,7 @@ def generate_dashboard_components(settings, user_data):
         elif component_type == 'expenses_heatmap':
             top_spending_graph = dcc.Graph(
                 id={"type": "component-graph", "index": component_id},
-                figure=generate_top_spending_categories(expense_data, component_settings),
+                figure=generate_top_spending_categories(expense_rollup, component_settings),
                 config={'displayModeBar': False},
                 className="component-graph",
                 style={"height": "100%", "width": "100%"}
@@ -4144,7 +4092,7 @@ def generate_dashboard_components(settings, user_data):
         elif component_type == 'expenses_seasonality':
             spending_trends_graph = dcc.Graph(
                 id={"type": "component-graph", "index": component_id},
-                figure=generate_spending_trends(expense_data, component_settings),
+                figure=generate_spending_trends(expense_rollup, component_settings),
                 config={'displayModeBar': False},
                 className="component-graph",
                 style={"height": "100%", "width": "100%"}
@@ -4965,6 +4913,7 @@ def save_layout_changes(layouts, current_settings, user_data):
     current_settings = copy.deepcopy(current_settings)
     
     # Update the positions of all components in settings
+    positions = {}
     for layout_item in current_layout:
         item_id = layout_item.get('i')
         if not item_id:
@@ -4984,7 +4933,9 @@ def save_layout_changes(layouts, current_settings, user_data):
         component_found = False
         for component in current_settings['components']:
             if component['id'] == item_id:
-                component['position'] = position
+                if component.get('position') != position:
+                    component['position'] = position
+                    positions[item_id] = position
                 component_found = True
                 break
                 
@@ -4992,34 +4943,18 @@ def save_layout_changes(layouts, current_settings, user_data):
         if not component_found:
             print(f"Component {item_id} found in layout but not in settings")
     
-    # Save to database if not guest user
-    current_settings['layouts'] = layouts
-    user_id = user_data.get('user_info', {}).get('user_id')
-    if user_id and user_id != 'Guest':
-        save_dashboard_settings_to_db(user_id, current_settings)
-        # print(f"Saved dashboard settings after layout change for user {user_id}")
-    
-    return current_settings
+    if not positions:
+        raise PreventUpdate
 
-def save_dashboard_settings_to_db(user_id, settings):
-    """Save dashboard settings to database"""
-    conn = get_db_connection()
-    if not conn:
-        return False
+    # Queue the moved cards if not guest user. Layout events fire continuously
+    # while a card is dragged, so the write-behind only persists the final
+    # positions. Breakpoint layouts are rebuilt from these, never stored.
+    current_settings.pop('layouts', None)
+    user_id = get_dashboard_user_id(user_data)
+    if user_id:
+        dashboard_layout_writer.submit(user_id, positions)
     
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                "UPDATE users SET dashboard_settings = %s WHERE user_id = %s",
-                (json.dumps(settings), user_id)
-            )
-            conn.commit()
-        return True
-    except Exception as e:
-        # print(f"Error saving dashboard settings: {e}")
-        return False
-    finally:
-        conn.close()
+    return current_settings
 
 @callback(
     [Output("dashboard-grid", "children"),
@@ -5049,8 +4984,8 @@ def initialize_dashboard(user_data, current_settings):
 
     # print(f"DEBUG: Has components: {has_components}, showing empty state: {empty_style['display'] == 'block'}")
 
-    # Use layouts from current_settings if available, otherwise use generated ones
-    layouts = current_settings.get('layouts', generated_layouts) if current_settings else generated_layouts
+    # Breakpoint layouts are always derived from each component's position
+    layouts = generated_layouts
     
     # Ensure layouts is properly initialized for all breakpoints
     if not layouts or not isinstance(layouts, dict):
@@ -3,11 +3,8 @@ from dash import html, dcc, callback, Input, Output, State, register_page, clien
 import dash_bootstrap_components as dbc
 from dash.exceptions import PreventUpdate
 from datetime import datetime, timedelta
-import pandas as pd
-import numpy as np
 import datetime
 import calendar
-import plotly.express as px
 import plotly.graph_objects as go
 from datetime import date
 import json
@@ -15,6 +12,13 @@ import os
 import random
 from flask_login import current_user
 
+from utils.db import get_transactions_page
+from utils.lazy import lazy_import
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+px = lazy_import('plotly.express')
+
 # Register this file as the dashboard page
 register_page(__name__, path='/dashboard', name='Dashboard')
 
@@ -1015,10 +1019,18 @@ def update_savings_progress_with_adjusted_budget(transaction_data, total_income,
 
 @callback(
     Output('recent-activity-content', 'children'),
-    Input('Transaction-store', 'data'),
-    prevent_initial_call=True
+    Input('user-id', 'data'),
 )
-def update_recent_activity(transaction_data):
+def update_recent_activity(user_id):
+    # Only the newest page is fetched, however long the user's history is
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    transaction_data = []
+    if actual_user_id:
+        try:
+            transaction_data = get_transactions_page(actual_user_id, limit=5)['transactions']
+        except Exception as e:
+            print(f"Error loading recent activity: {e}")
+
     if not transaction_data:
         return html.Div([
             html.Div([
@@ -1052,10 +1064,9 @@ def update_recent_activity(transaction_data):
             })
         ])
     
-    # Convert transaction data to a DataFrame and sort by date
+    # Transactions arrive newest first
     df_recent = pd.DataFrame(transaction_data)
-    df_recent['due_date'] = pd.to_datetime(df_recent['due_date'])
-    df_recent = df_recent.sort_values('due_date', ascending=False).head(5)  # Show the 5 most recent transactions
+    df_recent['due_date'] = pd.to_datetime(df_recent['date'])
 
     # Create transaction items with consistent styling
     transaction_item_style = {
@@ -5,17 +5,19 @@ import dash_bootstrap_components as dbc
 import datetime
 from datetime import date
 import dash
-import plotly.express as px
 import plotly.graph_objects as go
-import pandas as pd
 from dash.exceptions import PreventUpdate
 import uuid
+import base64
+import io
 
-from utils.db import connect_db
-import psycopg2
-import psycopg2.extras
-from psycopg2.extras import RealDictCursor, Json  # Add Json here
-import json
+from utils.db import (get_user_snapshot, get_transactions_page,
+                      save_expense, delete_expense as delete_expense_record, set_savings_target)
+from utils.statement_import import import_statement, StatementImportError
+from utils.lazy import lazy_import
+
+pd = lazy_import('pandas')
+px = lazy_import('plotly.express')
 
 # Register this file as a page
 dash.register_page(__name__, path='/expenses')
@@ -73,22 +75,9 @@ HEADER_STYLE = {
 }
 
 
-# Database connection function
-def get_db_connection():
-    """Connect to the PostgreSQL database"""
-    try:
-        conn = connect_db()
-        return conn
-    except Exception as e:
-        # print(f"Error connecting to database: {e}")
-        return None
-
 def get_user_data(user_id):
     """Get user data from database or return default for guest users"""
 
-    conn = get_db_connection()
-    if not conn:
-        return {}
     print('printing user_id', user_id)
 
     # Extract the actual user ID value from the dictionary
@@ -98,78 +87,16 @@ def get_user_data(user_id):
     else:
         actual_user_id = user_id
 
-    user_data = {}
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # Get user info
-            cur.execute("SELECT * FROM users WHERE user_id = %s", (actual_user_id,))
-            user = cur.fetchone()
-            if not user:
-                print(f"User {actual_user_id} not found in database")
-                return {}
-
-            user_data['user_info'] = dict(user)
-
-            # Get income data
-            cur.execute("SELECT * FROM income WHERE user_id = %s", (actual_user_id,))
-            user_data['income'] = [dict(row) for row in cur.fetchall()]
-
-            # Get expense data
-            cur.execute("SELECT * FROM expense WHERE user_id = %s", (actual_user_id,))
-            user_data['expenses'] = [dict(row) for row in cur.fetchall()]
-
-            # Get savings goals
-            cur.execute("SELECT * FROM saving_goals WHERE user_id = %s", (actual_user_id,))
-            user_data['savings_goals'] = [dict(row) for row in cur.fetchall()]
-
-            # Get transactions
-            cur.execute(
-                "SELECT * FROM transactions WHERE user_id = %s ORDER BY date DESC LIMIT 50",
-                (actual_user_id,)
-            )
-            user_data['transactions'] = [dict(row) for row in cur.fetchall()]
-
-            # Get savings target
-            cur.execute("SELECT amount FROM savings_target WHERE user_id = %s", (actual_user_id,))
-            savings_target = cur.fetchone()
-            if savings_target:
-                user_data['savings_target'] = savings_target['amount']
-            else:
-                user_data['savings_target'] = 0
-
-            # Get dashboard settings
-            cur.execute("SELECT dashboard_settings FROM users WHERE user_id = %s", (actual_user_id,))
-            dashboard_settings = cur.fetchone()
-            
-            # Initialize with empty component list
-            user_data['dashboard_settings'] = {'components': []}
-            
-            if dashboard_settings and dashboard_settings['dashboard_settings']:
-                # Parse JSON string to object
-                try:
-                    if isinstance(dashboard_settings['dashboard_settings'], str):
-                        parsed_settings = json.loads(dashboard_settings['dashboard_settings'])
-                    else:
-                        parsed_settings = dashboard_settings['dashboard_settings']
-                        
-                    # Ensure the settings have the expected structure
-                    if isinstance(parsed_settings, dict) and 'components' in parsed_settings:
-                        user_data['dashboard_settings'] = parsed_settings
-                        print(f"Successfully loaded dashboard settings for user {actual_user_id}")
-                        print(f"Found {len(parsed_settings.get('components', []))} components")
-                    else:
-                        print(f"Dashboard settings missing components for user {actual_user_id}")
-                        user_data['dashboard_settings'] = {'components': []}
-                except Exception as e:
-                    print(f"Error parsing dashboard settings: {e}")
-                    user_data['dashboard_settings'] = {'components': []}
-            else:
-                print(f"No dashboard settings found for user {actual_user_id}")
-
+        user_data = get_user_snapshot(actual_user_id)
     except Exception as e:
-         print(f"Error fetching user data: {e}")
-    finally:
-        conn.close()
+        print(f"Error fetching user data: {e}")
+        return {}
+
+    if not user_data:
+        print(f"User {actual_user_id} not found in database")
+    else:
+        print(f"Found {len(user_data['dashboard_settings'].get('components', []))} dashboard components")
 
     return user_data
 
@@ -351,6 +278,44 @@ layout = html.Div([
                     ])
                 ], className='mb-4', style=CARD_STYLE),
 
+                # Bank Statement Import Card
+                dbc.Card([
+                    dbc.CardHeader(html.H5("Import Bank Statement", className="card-title m-0"), style=HEADER_STYLE),
+                    dbc.CardBody([
+                        dcc.Upload(
+                            id='statement-upload',
+                            children=html.Div([
+                                html.I(className="fas fa-file-upload me-2"),
+                                "Drag and drop or ",
+                                html.A("select a CSV, OFX or QIF file", style={'color': COLORS['accent'], 'cursor': 'pointer'})
+                            ]),
+                            multiple=False,
+                            style={
+                                'borderWidth': '1px',
+                                'borderStyle': 'dashed',
+                                'borderColor': COLORS['muted'],
+                                'borderRadius': '6px',
+                                'padding': '20px',
+                                'textAlign': 'center',
+                                'color': COLORS['secondary'],
+                            },
+                        ),
+                        dbc.RadioItems(
+                            id='statement-date-order',
+                            options=[
+                                {'label': 'Detect date order', 'value': 'auto'},
+                                {'label': 'Day first (31/01/2024)', 'value': 'dmy'},
+                                {'label': 'Month first (01/31/2024)', 'value': 'mdy'},
+                            ],
+                            value='auto',
+                            inline=True,
+                            className='mt-2',
+                            style={'fontSize': '13px', 'color': COLORS['secondary']},
+                        ),
+                        dcc.Loading(html.Div(id='statement-import-status', className='mt-3'), type="dot"),
+                    ])
+                ], className='mb-4', style=CARD_STYLE),
+
                 # Expense Categories Card
                 dbc.Card([
                     dbc.CardHeader(html.H5("Expense Categories", className="card-title m-0"), style=HEADER_STYLE),
@@ -447,6 +412,52 @@ layout = html.Div([
                         html.Div(id='expense-list-container', className="mt-3"),
                     ])
                 ], className='mb-4', style=CARD_STYLE),
+
+                # Transaction History Card (server-side filtered, one page at a time)
+                dbc.Card([
+                    dbc.CardHeader(html.H5("Transaction History", className="card-title m-0"), style=HEADER_STYLE),
+                    dbc.CardBody([
+                        dbc.Row([
+                            dbc.Col([
+                                dbc.Label("Date Range", className="text-muted"),
+                                dcc.DatePickerRange(
+                                    id='history-date-range',
+                                    display_format='MMM DD, YYYY',
+                                    clearable=True,
+                                    className='mb-2 w-100',
+                                )
+                            ], md=6),
+                            dbc.Col([
+                                dbc.Label("Category", className="text-muted"),
+                                dcc.Dropdown(
+                                    id='history-category',
+                                    options=[{'label': cat, 'value': cat} for cat in CATEGORY_COLORS.keys()],
+                                    placeholder='All categories',
+                                    className='mb-2',
+                                )
+                            ], md=3),
+                            dbc.Col([
+                                dbc.Label("Type", className="text-muted"),
+                                dcc.Dropdown(
+                                    id='history-type',
+                                    options=[{'label': 'Expenses', 'value': 'expense'},
+                                             {'label': 'Income', 'value': 'income'}],
+                                    placeholder='All types',
+                                    className='mb-2',
+                                )
+                            ], md=3),
+                        ]),
+                        html.Div(id='transaction-history-list', className="mt-3"),
+                        html.Div([
+                            dbc.Button("← Newer", id='history-newer', color="light", size="sm", disabled=True),
+                            html.Span(id='history-page-label', className="text-muted mx-3", style={"fontSize": "13px"}),
+                            dbc.Button("Older →", id='history-older', color="light", size="sm", disabled=True),
+                        ], className="d-flex justify-content-center align-items-center mt-2"),
+                        # Cursors of the pages visited so far (the last one is the current page)
+                        dcc.Store(id='history-cursor-stack', storage_type='memory', data=[None]),
+                        dcc.Store(id='history-next-cursor', storage_type='memory'),
+                    ])
+                ], className='mb-4', style=CARD_STYLE),
             ], md=8),  # This is the missing closing bracket with the column width
 
             # Right Column: Summary & Savings
@@ -657,36 +668,13 @@ def add_expense(n_clicks, desc, amount, category, due_date, recurring, expenses,
     print(f"  User ID: {user_id}")
 
     # Save to database
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                if recurring:
-                    # Insert into the expense table for monthly recurring expenses
-                    print("  -> Inserting into 'expense' table")
-                    cur.execute(
-                        """
-                        INSERT INTO expense (expense_id, user_id, amount, category, description, due_date)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        """,
-                        (expense_id, actual_user_id, float(amount), category, desc, due_date)
-                    )
-                else:
-                    # Insert into the transactions table for one-time expenses
-                    print("  -> Inserting into 'transactions' table")
-                    cur.execute(
-                        """
-                        INSERT INTO transactions (transaction_id, user_id, amount, type, category, description, date)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        """,
-                        (expense_id, actual_user_id, float(amount), 'expense', category, desc, due_date)
-                    )
-                conn.commit()
-                print("  -> Insert committed.")
-        except Exception as e:
-            print(f"Error adding expense: {e}")
-        finally:
-            conn.close()
+    try:
+        # Recurring expenses go to the expense table, one-time expenses to transactions
+        print(f"  -> Inserting into '{'expense' if recurring else 'transactions'}' table")
+        save_expense(actual_user_id, expense_id, float(amount), category, desc, due_date, recurring)
+        print("  -> Insert committed.")
+    except Exception as e:
+        print(f"Error adding expense: {e}")
 
     # Update the local store
     if expenses:
@@ -734,33 +722,53 @@ def delete_expense(n_clicks_list, expenses, user_id):
         is_recurring = expense_to_delete.get('recurring', False)
         
         # Delete from database
-        conn = get_db_connection()
-        if conn:
-            try:
-                with conn.cursor() as cur:
-                    if is_recurring:
-                        # Delete from expense table
-                        cur.execute(
-                            "DELETE FROM expense WHERE expense_id = %s AND user_id = %s",
-                            (expense_id, actual_user_id)
-                        )
-                    else:
-                        # Delete from transactions table
-                        cur.execute(
-                            "DELETE FROM transactions WHERE transaction_id = %s AND user_id = %s",
-                            (expense_id, actual_user_id)
-                        )
-                    conn.commit()
-            except Exception as e:
-                print(f"Error deleting expense: {e}")
-            finally:
-                conn.close()
+        try:
+            delete_expense_record(actual_user_id, expense_id, is_recurring)
+        except Exception as e:
+            print(f"Error deleting expense: {e}")
         
         # Update the local store
         expenses.pop(expense_index)
     
     return expenses
 
+# Bank statement import callback
+@callback(
+    [Output("statement-import-status", "children"),
+     Output("user-data-store", "data", allow_duplicate=True)],
+    [Input("statement-upload", "contents")],
+    [State("statement-upload", "filename"),
+     State("statement-date-order", "value"),
+     State("user-id", "data")],
+    prevent_initial_call=True
+)
+def import_bank_statement(contents, filename, date_order, user_id):
+    """Bulk-load an uploaded statement into transactions and refresh the user data"""
+    if not contents:
+        raise PreventUpdate
+
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    if not actual_user_id:
+        return dbc.Alert("Please log in to import statements", color="warning"), dash.no_update
+
+    # dcc.Upload delivers "data:<mime>;base64,<payload>"
+    _, encoded = contents.split(',', 1)
+    lines = io.TextIOWrapper(io.BytesIO(base64.b64decode(encoded)), encoding='utf-8-sig', errors='replace', newline='')
+
+    try:
+        result = import_statement(actual_user_id, lines, filename=filename,
+                                  date_order=None if date_order == 'auto' else date_order)
+    except StatementImportError as e:
+        return dbc.Alert(str(e), color="danger"), dash.no_update
+    except Exception as e:
+        print(f"Error importing statement: {e}")
+        return dbc.Alert("Could not import this statement", color="danger"), dash.no_update
+
+    message = (f"Imported {result['inserted']} transactions from {filename}"
+               f" ({result['duplicates']} duplicates skipped, {result['rejected']} unreadable rows)")
+    user_data = get_user_data(actual_user_id) if result['inserted'] else dash.no_update
+    return dbc.Alert(message, color="success"), user_data
+
 # Update savings target callback
 @callback(
     Output("savings-target-store", "data", allow_duplicate=True),
@@ -790,31 +798,10 @@ def update_savings_target(n_clicks, user_data, savings_goal, user_id):
     user_data['savings_target'] = savings_amount
     
     # Update database
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                # Check if a record already exists
-                cur.execute("SELECT amount FROM savings_target WHERE user_id = %s", (actual_user_id,))
-                existing = cur.fetchone()
-                
-                if existing:
-                    # Update existing record
-                    cur.execute(
-                        "UPDATE savings_target SET amount = %s, date = %s WHERE user_id = %s",
-                        (savings_amount, today, actual_user_id)
-                    )
-                else:
-                    # Insert new record
-                    cur.execute(
-                        "INSERT INTO savings_target (user_id, amount, date) VALUES (%s, %s, %s)",
-                        (actual_user_id, savings_amount, today)
-                    )
-                conn.commit()
-        except Exception as e:
-            print(f"Error updating savings target: {e}")
-        finally:
-            conn.close()
+    try:
+        set_savings_target(actual_user_id, savings_amount, today)
+    except Exception as e:
+        print(f"Error updating savings target: {e}")
     
     return savings_amount, user_data
 
@@ -1012,6 +999,106 @@ def generate_expense_list(expenses):
     
     return html.Div(expense_items, className="expense-list")
 
+def generate_transaction_history(transactions):
+    """Render one page of transactions from get_transactions_page"""
+    if not transactions:
+        return html.Div("No transactions match these filters.", className="text-muted p-3")
+
+    items = []
+    for transaction in transactions:
+        category = transaction.get('category') or 'Other'
+        is_income = transaction.get('type') == 'income'
+        try:
+            date_str = datetime.datetime.fromisoformat(transaction['date']).strftime("%b %d, %Y")
+        except (KeyError, TypeError, ValueError):
+            date_str = "Unknown"
+
+        items.append(html.Div([
+            dbc.Row([
+                dbc.Col([
+                    html.H6(transaction.get('description') or 'N/A', className="mb-0"),
+                    html.Span(category, className="badge badge-light",
+                              style={
+                                  "backgroundColor": CATEGORY_COLORS.get(category, COLORS['muted']),
+                                  "color": COLORS['white'],
+                                  "fontSize": "12px",
+                                  "borderRadius": "30px",
+                                  "padding": "4px 8px",
+                                  "marginTop": "4px"
+                              })
+                ], width=7),
+                dbc.Col([
+                    html.H6(f"{'+' if is_income else '-'}£{transaction.get('amount', 0):.2f}",
+                            className="mb-0 text-end",
+                            style={"color": COLORS['success'] if is_income else COLORS['accent'], "fontWeight": "bold"})
+                ], width=3),
+                dbc.Col([
+                    html.P(date_str, className="mb-0 text-muted text-end", style={"fontSize": "12px"})
+                ], width=2),
+            ], className="align-items-center"),
+            html.Hr(style={"margin": "10px 0", "opacity": "0.2"})
+        ], className="expense-item mb-2"))
+
+    return html.Div(items, className="expense-list")
+
+# Transaction history paging callback
+@callback(
+    [Output("transaction-history-list", "children"),
+     Output("history-cursor-stack", "data"),
+     Output("history-next-cursor", "data"),
+     Output("history-newer", "disabled"),
+     Output("history-older", "disabled"),
+     Output("history-page-label", "children")],
+    [Input("user-id", "data"),
+     Input("user-data-store", "data"),
+     Input("history-date-range", "start_date"),
+     Input("history-date-range", "end_date"),
+     Input("history-category", "value"),
+     Input("history-type", "value"),
+     Input("history-older", "n_clicks"),
+     Input("history-newer", "n_clicks")],
+    [State("history-cursor-stack", "data"),
+     State("history-next-cursor", "data")],
+)
+def update_transaction_history(user_id, user_data, start_date, end_date, category, transaction_type,
+                               older_clicks, newer_clicks, cursor_stack, next_cursor):
+    """Page through the full transaction history with keyset cursors"""
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    if not actual_user_id:
+        return generate_transaction_history([]), [None], None, True, True, ""
+
+    cursor_stack = cursor_stack or [None]
+    if ctx.triggered_id == "history-older" and next_cursor:
+        cursor_stack = cursor_stack + [next_cursor]
+    elif ctx.triggered_id == "history-newer" and len(cursor_stack) > 1:
+        cursor_stack = cursor_stack[:-1]
+    elif ctx.triggered_id not in ("history-older", "history-newer"):
+        # New filters or new data: start again from the newest page
+        cursor_stack = [None]
+
+    try:
+        page = get_transactions_page(
+            actual_user_id,
+            cursor=cursor_stack[-1],
+            limit=20,
+            start_date=start_date,
+            end_date=end_date,
+            category=category,
+            transaction_type=transaction_type,
+        )
+    except Exception as e:
+        print(f"Error loading transaction history: {e}")
+        return generate_transaction_history([]), [None], None, True, True, ""
+
+    return (
+        generate_transaction_history(page['transactions']),
+        cursor_stack,
+        page['next_cursor'],
+        len(cursor_stack) <= 1,
+        page['next_cursor'] is None,
+        f"Page {len(cursor_stack)}",
+    )
+
 # Update total expense badge
 @callback(
     Output("total-expense-badge", "children"),
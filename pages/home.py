@@ -2,7 +2,7 @@ import dash
 from dash import html, dcc, clientside_callback
 import dash_bootstrap_components as dbc
 from dash import Input, Output, State, callback
-from utils.db import connect_db
+from utils.db import get_user_identity
 
 # Register this file as the home page
 dash.register_page(__name__, path="/", name="Home")
@@ -1523,13 +1523,9 @@ html.Div([
 )
 def update_user_email(user_data):
     if user_data and 'user_id' in user_data:
-        conn = connect_db()
-        cursor = conn.cursor()
-        cursor.execute('SELECT email FROM users WHERE user_id = %s', (user_data['user_id'],))
-        user = cursor.fetchone()
-        conn.close()
+        user = get_user_identity(user_data['user_id'])
         if user:
-            return user[0]
+            return user[1]
     return "Guest"
 
 # Logout logic (client-side)
@@ -4,15 +4,18 @@ import dash_bootstrap_components as dbc
 from dash.exceptions import PreventUpdate
 import uuid
 import plotly.graph_objects as go
-import plotly.express as px
-import pandas as pd
-from prophet import Prophet
-import pandas as pd
 from datetime import datetime, timedelta
-import numpy as np
 import json  # Make sure json is imported at the top level
 
 from utils.db import get_income_sources, add_income, delete_income, update_income, persist_historical_income
+from utils.forecast_cache import ForecastCache, forecast_key
+from utils.forecast_service import forecast_service, ForecastError, FORECAST_POLL_MS
+from logic.forecasting import fit_income_timeline, resolve_engine
+from utils.lazy import lazy_import
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+px = lazy_import('plotly.express')
 
 import psycopg2
 import uuid
@@ -316,6 +319,35 @@ def create_pie_chart(income_sources):
     
     return fig
 
+# Model settings for the per-source timeline forecast. They are part of the
+# forecast cache key, so changing them refits every source.
+TIMELINE_FORECAST_CONFIG = {
+    'model': 'auto',  # 'ets', 'prophet', or 'auto' for ETS until there is enough history for Prophet
+    'changepoint_prior_scale': 0.1,  # Lower value to reduce sensitivity to trend changes
+    'yearly_seasonality': False,
+    'weekly_seasonality': True,
+    'daily_seasonality': False,
+    'seasonality_mode': 'additive',
+    'interval_width': 0.95,
+}
+
+# Fitted timeline forecasts, reused until a source's history changes
+timeline_forecast_cache = ForecastCache('income timeline')
+
+# Function to forecast one variable income source over the timeline dates
+def forecast_income_source(source_id, prophet_data, forecast_dates):
+    """Forecast yhat for each of forecast_dates, or None while the fit is still
+    running in the forecast workers. Fitted at most once per (source, history,
+    dates, config); raises ForecastError if the fit failed."""
+    key = forecast_key(source_id, {
+        'history': [[row['ds'].date().isoformat(), row['y']] for row in prophet_data],
+        'dates': [date.date().isoformat() for date in forecast_dates],
+    }, TIMELINE_FORECAST_CONFIG)
+    # ETS fits take about a millisecond, so only Prophet fits go to the workers
+    inline = resolve_engine(TIMELINE_FORECAST_CONFIG, len(prophet_data)) == 'ets'
+    return forecast_service.request(timeline_forecast_cache, key, fit_income_timeline,
+                                    prophet_data, forecast_dates, TIMELINE_FORECAST_CONFIG, inline=inline)
+
 # Modified create_timeline_chart to ensure it works with PostgreSQL data
 def create_timeline_chart(income_sources):
     if not income_sources:
@@ -335,8 +367,8 @@ def create_timeline_chart(income_sources):
         )
         return fig
 
-    # Generate date range for x-axis
-    today = datetime.now()
+    # Generate date range for x-axis (midnight, so forecasts stay cached all day)
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     past_dates = [(today - timedelta(days=30 * i)) for i in range(12, 0, -1)]
     future_dates = [(today + timedelta(days=30 * i)) for i in range(0, 13)]
     all_dates = past_dates + future_dates[1:]  # Exclude duplicate of current month
@@ -345,6 +377,7 @@ def create_timeline_chart(income_sources):
     # Initialize data for each source
     data = []
     total_monthly = np.zeros(len(date_labels))
+    forecast_pending = False  # a source is still being fitted, so the chart shows its baseline for now
 
     # Blue color palette
     blue_palette = [
@@ -365,6 +398,7 @@ def create_timeline_chart(income_sources):
         historical_data = source.get("historical_data", {})
 
         # Check if we have enough historical data for Prophet forecasting
+        forecast_values = None
         if len(historical_data) >= 3 and source.get("consistency", "fixed") == "variable":
             # Prepare data for Prophet
             prophet_data = []
@@ -377,29 +411,22 @@ def create_timeline_chart(income_sources):
                     prophet_data.append({"ds": ds, "y": y})
 
             if prophet_data:
-                # Create Prophet DataFrame
-                prophet_df = pd.DataFrame(prophet_data)
-
-                # Initialize and fit Prophet model
-                m = Prophet(
-                    changepoint_prior_scale=0.1,  # Lower value to reduce sensitivity to trend changes
-                    yearly_seasonality=False,
-                    weekly_seasonality=True,
-                    daily_seasonality=False,
-                    seasonality_mode='additive',
-                    interval_width=0.95
-                )
-                m.fit(prophet_df)
-
-                # Create future dataframe for forecasting
-                future = pd.DataFrame({"ds": all_dates})
-                forecast = m.predict(future)
-
-                # Update y_values with forecasted values
-                for j, (date, yhat) in enumerate(zip(all_dates, forecast["yhat"])):
-                    y_values[j] = max(0, yhat)  # Ensure no negative values
+                # Use the cached forecast for this source, or queue its fit
+                source_id = source.get("id", source.get("income_id", name))
+                try:
+                    forecast_values = forecast_income_source(source_id, prophet_data, all_dates)
+                except ForecastError as e:
+                    print(f"Error forecasting income source {source_id}: {e}")
+                else:
+                    forecast_pending = forecast_pending or forecast_values is None
+
+        if forecast_values is not None:
+            # Update y_values with forecasted values
+            for j, yhat in enumerate(forecast_values):
+                y_values[j] = max(0, yhat)  # Ensure no negative values
         else:
-            # For fixed income or insufficient historical data, use actual values and then constant
+            # For fixed income, insufficient historical data or a forecast still
+            # being fitted, use actual values and then constant
             for j, key in enumerate([f"month_{k}" for k in range(-12, 0)]):  # Only historical keys
                 if key in historical_data:
                     y_values[j] = historical_data[key]
@@ -490,7 +517,8 @@ def create_timeline_chart(income_sources):
             tickprefix="£",
             tickfont=dict(size=10, color="#333")
         ),
-        annotations=annotations
+        annotations=annotations,
+        meta={'forecast_pending': forecast_pending}
     )
 
     return fig
@@ -863,6 +891,9 @@ layout = html.Div([
     # An interval for page initialization
     dcc.Interval(id="income-tab-interval", interval=500, n_intervals=0, max_intervals=1),
 
+    # Polls for timeline forecasts still being fitted in the background
+    dcc.Interval(id="income-forecast-poll", interval=FORECAST_POLL_MS, n_intervals=0, disabled=True),
+
     # Store for income sources
     dcc.Store(id="income-sources-store", storage_type="session"),
     
@@ -1033,9 +1064,6 @@ def toggle_mobile_nav(n_clicks, current_class):
         return "nav-menu show"
     return "nav-menu"
 
-# Import json for pattern-matching callbacks
-import json
-
 @callback(
     [Output("collapse-forecast", "is_open"),
      Output("collapse-whatif", "is_open")],
@@ -1342,6 +1370,31 @@ def update_income_ui(income_sources, refresh_trigger):
     
     return cards, no_sources_msg, total_display, sources_count, pie_fig, timeline_fig, dropdown_options, dropdown_value
 
+# Poll while the timeline chart is showing a baseline for a pending forecast
+@callback(
+    Output("income-forecast-poll", "disabled"),
+    Input("income-timeline-chart", "figure"),
+)
+def toggle_income_forecast_poll(figure):
+    meta = ((figure or {}).get("layout") or {}).get("meta") or {}
+    return not meta.get("forecast_pending", False)
+
+# Swap in the forecast once the background fit has finished
+@callback(
+    Output("income-timeline-chart", "figure", allow_duplicate=True),
+    Input("income-forecast-poll", "n_intervals"),
+    State("income-sources-store", "data"),
+    prevent_initial_call=True
+)
+def refresh_income_forecast(n_intervals, income_sources):
+    if not income_sources:
+        raise PreventUpdate
+
+    timeline_fig = create_timeline_chart(income_sources)
+    if timeline_fig.layout.meta and timeline_fig.layout.meta.get('forecast_pending'):
+        raise PreventUpdate  # Still fitting, keep the baseline on screen
+    return timeline_fig
+
 # Modified historical income save callback
 @callback(
     Output({"type": "historical-save-status", "index": MATCH}, "children"),
@@ -143,14 +143,18 @@ layout = html.Div([
                     # Export data option
                     html.Div([
                         html.H4("Export Your Data", style={'color': COLORS['secondary'], 'marginBottom': '10px'}),
-                        html.P("Download all your financial data as a JSON file for backup or transfer.", 
+                        html.P("Download your complete financial history for backup or transfer.", 
                                style={'marginBottom': '15px', 'fontSize': '14px'}),
-                        html.Button("Export Data", id="export-data-button", style={
-                            **BUTTON_STYLE,
-                            'margin': '10px 0 20px',
-                            'backgroundColor': COLORS['secondary'],
-                        }),
-                        html.Div(id="export-status", style={'marginBottom': '20px', 'color': COLORS['success']})
+                        html.Div([
+                            html.A(label, href=f"/api/export?format={fmt}", id=f"export-{fmt}-link", style={
+                                **BUTTON_STYLE,
+                                'display': 'inline-block',
+                                'margin': '10px 10px 20px 0',
+                                'backgroundColor': COLORS['secondary'],
+                                'textDecoration': 'none',
+                            })
+                            for fmt, label in [('jsonl', 'JSON Lines'), ('csv', 'CSV (zip)'), ('parquet', 'Parquet (zip)')]
+                        ]),
                     ], style={'marginBottom': '25px', 'borderBottom': f'1px solid {COLORS["light"]}', 'paddingBottom': '20px'}),
                     
                     # Reset data option
@@ -267,7 +271,6 @@ layout = html.Div([
     dcc.Store(id='income-sources-store', storage_type='local'),
     dcc.Store(id='savings-store', storage_type='local'),
     dcc.Store(id='goals-store', storage_type='local'),
-    dcc.Download(id="download-data"),
 
     # Footer - Keep as is per request
     html.Footer([
@@ -537,40 +540,6 @@ def save_preferences(n_clicks, currency, theme, date_format, existing_prefs):
         return new_prefs, "Preferences saved successfully!"
     return dash.no_update, dash.no_update
 
-# Callback to export data
-@callback(
-    [Output('download-data', 'data'),
-     Output('export-status', 'children')],
-    Input('export-data-button', 'n_clicks'),
-    [State('session-data-store', 'data'),
-     State('total-income-store', 'data'),
-     State('expenses-store', 'data'),
-     State('total-expenses-store', 'data'),
-     State('savings-target-store', 'data'),
-     State('transaction-store', 'data'),
-     State('preferences-store', 'data')],
-    prevent_initial_call=True
-)
-def export_data(n_clicks, session_data, total_income, expenses, total_expenses, savings_target, transactions, preferences):
-    if n_clicks:
-        export_data = {
-            'session_data': session_data,
-            'total_income': total_income,
-            'expenses': expenses,
-            'total_expenses': total_expenses,
-            'savings_target': savings_target,
-            'transactions': transactions,
-            'preferences': preferences,
-            'export_date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
-        return dict(
-            content=str(export_data),
-            filename=f"bluecard_finance_export_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        ), "Data exported successfully!"
-    
-    return dash.no_update, dash.no_update
-
 # Load preferences on page load
 @callback(
     [Output('currency-preference', 'value'),
@@ -0,0 +1,51 @@
+import threading
+
+from utils.write_behind import WriteBehind
+
+
+class BlockingStore:
+    """Stand-in for save_dashboard_positions that can hold a write open"""
+
+    def __init__(self):
+        self.positions = {}
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def write(self, user_id, positions):
+        self.started.set()
+        self.release.wait(5)
+        self.positions.update(positions)
+        return True
+
+
+def test_submit_during_in_flight_write_keeps_both_positions():
+    store = BlockingStore()
+    writer = WriteBehind(store.write, delay=0.01, max_delay=0.01, merge=dict.update)
+
+    store.release.clear()
+    writer.submit(1, {'a': {'x': 1, 'y': 0, 'w': 8, 'h': 6}})
+    assert store.started.wait(5)  # A's write is now in flight
+
+    writer.submit(1, {'b': {'x': 2, 'y': 0, 'w': 8, 'h': 6}})
+    store.release.set()
+    writer.close()
+
+    assert store.positions == {'a': {'x': 1, 'y': 0, 'w': 8, 'h': 6},
+                               'b': {'x': 2, 'y': 0, 'w': 8, 'h': 6}}
+
+
+def test_concurrent_submits_merge_into_one_pending_value():
+    store = BlockingStore()
+    writer = WriteBehind(store.write, delay=60, max_delay=60, merge=dict.update)
+
+    threads = [threading.Thread(target=writer.submit, args=(1, {f"card-{i}": {'x': i, 'y': 0, 'w': 8, 'h': 6}}))
+               for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+
+    assert sorted(store.positions) == sorted(f"card-{i}" for i in range(20))
+    assert writer.stats()['written'] == 1
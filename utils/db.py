@@ -1,11 +1,32 @@
 import os
+import atexit
+import itertools
+import threading
+import time
+from contextlib import contextmanager
 import psycopg2
 import psycopg2.extras
+from psycopg2 import pool as pg_pool
 from psycopg2.extras import RealDictCursor, Json  # Add Json here
 from hashlib import sha256
 import bcrypt
 import json  # Make sure json is imported too
+import copy
+import base64
+import logging
+import re
+from collections import deque
+from datetime import datetime, timedelta, date as date_type
+from decimal import Decimal
+from cachetools import TTLCache
 from dotenv import load_dotenv
+from flask import g, has_request_context, request
+
+from utils.lazy import lazy_import
+
+# Only the columnar fetch path needs these, so they load on first use
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
 
 load_dotenv()
 
@@ -20,90 +41,1293 @@ DB_PARAMS = {
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-# Function to connect to the database
-def connect_db():
-    conn = psycopg2.connect(DATABASE_URL)
+# Storage backend: 'postgres' (DATABASE_URL) or 'sqlite', an embedded database
+# file at SQLITE_PATH for running the app and benchmarks on one machine.
+# A sqlite:///path DATABASE_URL selects SQLite as well.
+_SQLITE_URL_PREFIX = 'sqlite:///'
+DB_BACKEND = os.getenv("DB_BACKEND") or (
+    'sqlite' if (DATABASE_URL or '').startswith(_SQLITE_URL_PREFIX) else 'postgres')
+SQLITE_PATH = os.getenv("SQLITE_PATH") or (
+    DATABASE_URL[len(_SQLITE_URL_PREFIX):] if (DATABASE_URL or '').startswith(_SQLITE_URL_PREFIX)
+    else 'bluecard.db')
+
+# Connection pool settings (override with environment variables)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))  # ping connections idle longer than this
+
+# User snapshot cache settings
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))  # seconds before a cached snapshot is reloaded
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))  # users kept before least recently used are evicted
+
+# Login identity cache settings (Flask-Login user_loader)
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))  # seconds an identity is trusted before users is re-read
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "4096"))  # identities kept before least recently used are evicted
+
+# Query instrumentation settings
+DB_INSTRUMENT = os.getenv("DB_INSTRUMENT", "1") != "0"  # 0 hands out raw connections with no query stats
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))  # queries slower than this go to the slow-query log
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG")  # file for the slow-query log, stderr when unset
+
+# Rows converted per batch by the columnar fetch path
+COLUMNAR_BATCH_SIZE = int(os.getenv("COLUMNAR_BATCH_SIZE", "10000"))
+
+# Monthly transaction partitions (Postgres) created ahead of time by
+# utils/init_db.py; rows past the last one land in the default partition
+TRANSACTION_PARTITION_MONTHS_AHEAD = int(os.getenv("TRANSACTION_PARTITION_MONTHS_AHEAD", "12"))
+
+
+class PoolTimeout(pg_pool.PoolError):
+    """Raised when no pooled connection becomes free within the timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of storage backend connections that blocks when exhausted"""
+
+    def __init__(self, backend, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX,
+                 timeout=DB_POOL_TIMEOUT, ping_after=DB_POOL_PING_AFTER):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size min={minconn} max={maxconn}")
+
+        self.backend = backend
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = []  # list of (connection, last_returned_at)
+        self._size = 0   # open connections, idle + checked out
+        self._closed = False
+
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'connections_opened': 0,
+            'connections_discarded': 0,
+            'health_check_failures': 0,
+        }
+
+        for _ in range(minconn):
+            self._idle.append((self._open(), time.monotonic()))
+            self._size += 1
+
+    def _open(self):
+        conn = self.backend.connect()
+        with self._cond:
+            self._stats['connections_opened'] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats['connections_discarded'] += 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn, idle_for):
+        """Cheap checks always, a round-trip ping only for long-idle connections"""
+        if conn.closed:
+            return False
+        if self.backend.in_transaction(conn):
+            return False
+        if idle_for < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        start = time.monotonic()
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise pg_pool.PoolError("connection pool is closed")
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    # Reserve the slot now, open the connection outside the lock
+                    self._size += 1
+                    conn, returned_at = None, None
+                    break
+
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"no database connection free after {self.timeout}s")
+                waited = True
+                self._cond.wait(remaining)
+
+            wait_time = time.monotonic() - start
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time_total'] += wait_time
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+
+        if conn is not None and not self._is_healthy(conn, time.monotonic() - returned_at):
+            # Keep the slot reserved and replace the dead connection below
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._cond:
+                self._stats['health_check_failures'] += 1
+                self._stats['connections_discarded'] += 1
+            conn = None
+
+        if conn is None:
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        return conn
+
+    def putconn(self, conn, discard=False):
+        if discard or conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        # Never hand out a connection that is still inside a transaction
+        if self.backend.in_transaction(conn):
+            try:
+                conn.rollback()
+            except Exception:
+                self._discard(conn)
+                return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+            })
+        stats['wait_time_avg'] = stats['wait_time_total'] / stats['waits'] if stats['waits'] else 0.0
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    # Recreate after a fork (e.g. gunicorn workers) so processes never share sockets
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool(get_backend())
+    return _pool
+
+
+def close_pool():
+    """Close every idle pooled connection (called automatically at exit)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+
+
+atexit.register(close_pool)
+
+
+def pool_stats():
+    """Pool size and wait metrics for monitoring"""
+    if _pool is None:
+        return {}
+    return _pool.stats()
+
+
+# Query instrumentation: every statement run on a db_connection() is timed
+# (execute plus fetch), counted per originating Dash callback or Flask route,
+# and written to the slow-query log when it takes longer than SLOW_QUERY_MS.
+_query_lock = threading.Lock()
+_query_totals = {'queries': 0, 'rows': 0, 'time_total': 0.0, 'errors': 0, 'slow': 0}
+_callback_query_stats = {}   # origin -> per-origin totals, see _record_query
+_statement_stats = {}        # normalised SQL -> totals
+_recent_slow_queries = deque(maxlen=50)
+_STATEMENT_STATS_SIZE = 500  # distinct statements tracked, later ones are folded into "other"
+
+_slow_query_logger = logging.getLogger('bluecard.slow_queries')
+_slow_query_logger.propagate = False
+_slow_query_logger.setLevel(logging.WARNING)
+_slow_query_logger.addHandler(
+    logging.FileHandler(SLOW_QUERY_LOG) if SLOW_QUERY_LOG else logging.StreamHandler())
+
+
+def _normalise_sql(query):
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    query = re.sub(r'\s+', ' ', str(query)).strip()
+    # execute_values expands VALUES lists inline, keep one row of them
+    query = re.sub(r'(VALUES \([^)]*\))(, \([^)]*\))+', r'\1, ...', query)
+    return query[:300]
+
+
+def _callback_name(output):
+    """Qualified function name of the Dash callback registered for `output`"""
+    try:
+        import dash
+        func = dash.get_app().callback_map[output]['callback']
+        return f"{func.__module__}.{func.__name__}"
+    except Exception:
+        return output
+
+
+def _query_origin():
+    """The Dash callback or Flask route this query runs for, cached on the request"""
+    if not has_request_context():
+        return f"thread:{threading.current_thread().name}"
+    origin = g.get('_db_query_origin')
+    if origin is None:
+        if request.path.endswith('_dash-update-component'):
+            body = request.get_json(silent=True) or {}
+            origin = f"callback:{_callback_name(body.get('output', ''))}"
+        else:
+            origin = f"route:{request.endpoint or request.path}"
+        g._db_query_origin = origin
+    return origin
+
+
+def _record_query(query, elapsed, rows, origin, failed):
+    statement = _normalise_sql(query)
+    slow = elapsed * 1000 >= SLOW_QUERY_MS
+
+    # Queries per callback invocation; outside a request each query stands alone
+    first_in_call = True
+    queries_in_call = 1
+    if has_request_context():
+        queries_in_call = g.get('_db_query_count', 0) + 1
+        g._db_query_count = queries_in_call
+        first_in_call = queries_in_call == 1
+
+    with _query_lock:
+        _query_totals['queries'] += 1
+        _query_totals['rows'] += rows
+        _query_totals['time_total'] += elapsed
+        _query_totals['errors'] += failed
+        _query_totals['slow'] += slow
+
+        stats = _callback_query_stats.get(origin)
+        if stats is None:
+            stats = _callback_query_stats[origin] = {
+                'calls': 0, 'queries': 0, 'rows': 0, 'time_total': 0.0,
+                'max_queries_per_call': 0, 'slow': 0,
+            }
+        stats['calls'] += first_in_call
+        stats['queries'] += 1
+        stats['rows'] += rows
+        stats['time_total'] += elapsed
+        stats['slow'] += slow
+        stats['max_queries_per_call'] = max(stats['max_queries_per_call'], queries_in_call)
+
+        if statement not in _statement_stats and len(_statement_stats) >= _STATEMENT_STATS_SIZE:
+            statement = 'other'
+        stats = _statement_stats.get(statement)
+        if stats is None:
+            stats = _statement_stats[statement] = {'count': 0, 'rows': 0, 'time_total': 0.0, 'time_max': 0.0}
+        stats['count'] += 1
+        stats['rows'] += rows
+        stats['time_total'] += elapsed
+        stats['time_max'] = max(stats['time_max'], elapsed)
+
+        if slow:
+            entry = {
+                'at': datetime.now().isoformat(timespec='seconds'),
+                'ms': round(elapsed * 1000, 2),
+                'rows': rows,
+                'origin': origin,
+                'failed': bool(failed),
+                'query': statement,
+            }
+            _recent_slow_queries.append(entry)
+
+    # Parameters are left out on purpose, they can hold emails and password hashes
+    if slow:
+        _slow_query_logger.warning(json.dumps(entry))
+
+
+class _InstrumentedCursor:
+    """Cursor proxy that times execute/executemany/copy_expert and the fetches
+    that follow, so lazily stepped SQLite queries are measured too"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._query = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._finish()
+        self._cursor.close()
+        return False
+
+    def _run(self, method, query, *args):
+        self._finish()
+        self._query = query
+        self._origin = _query_origin()
+        self._fetched = 0
+        self._failed = False
+        started = time.perf_counter()
+        try:
+            return method(query, *args)
+        except Exception:
+            self._failed = True
+            raise
+        finally:
+            self._elapsed = time.perf_counter() - started
+
+    def _timed_fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._query is not None:
+                self._elapsed += time.perf_counter() - started
+
+    def _finish(self):
+        """Record the current statement once its results have been read"""
+        if self._query is None:
+            return
+        query, self._query = self._query, None
+        try:
+            rowcount = self._cursor.rowcount
+        except Exception:
+            rowcount = -1
+        _record_query(query, self._elapsed, max(rowcount or 0, self._fetched), self._origin, self._failed)
+
+    def execute(self, query, params=None):
+        return self._run(self._cursor.execute, query, params)
+
+    def executemany(self, query, params_seq):
+        return self._run(self._cursor.executemany, query, params_seq)
+
+    def copy_expert(self, sql, file, *args):
+        return self._run(self._cursor.copy_expert, sql, file, *args)
+
+    def fetchone(self):
+        row = self._timed_fetch(self._cursor.fetchone)
+        if row is not None and self._query is not None:
+            self._fetched += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._timed_fetch(self._cursor.fetchmany, *args)
+        if self._query is not None:
+            self._fetched += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed_fetch(self._cursor.fetchall)
+        if self._query is not None:
+            self._fetched += len(rows)
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+
+class _InstrumentedConnection:
+    """Connection proxy handing out instrumented cursors"""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._cursors = []
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = _InstrumentedCursor(self._conn.cursor(*args, **kwargs))
+        self._cursors.append(cursor)
+        return cursor
+
+    def finish(self):
+        for cursor in self._cursors:
+            cursor._finish()
+        self._cursors = []
+
+
+def query_stats(top=20):
+    """Query counts and latency in total, per callback/route and per statement"""
+    with _query_lock:
+        totals = dict(_query_totals)
+        callbacks = {origin: dict(stats) for origin, stats in _callback_query_stats.items()}
+        statements = {sql: dict(stats) for sql, stats in _statement_stats.items()}
+        recent_slow = list(_recent_slow_queries)
+
+    for stats in callbacks.values():
+        stats['queries_per_call'] = round(stats['queries'] / stats['calls'], 2) if stats['calls'] else None
+        stats['time_avg_ms'] = round(stats['time_total'] * 1000 / stats['queries'], 3)
+        stats['time_total_ms'] = round(stats.pop('time_total') * 1000, 3)
+    for stats in statements.values():
+        stats['time_avg_ms'] = round(stats['time_total'] * 1000 / stats['count'], 3)
+        stats['time_max_ms'] = round(stats.pop('time_max') * 1000, 3)
+        stats['time_total_ms'] = round(stats.pop('time_total') * 1000, 3)
+
+    totals['time_total_ms'] = round(totals.pop('time_total') * 1000, 3)
+    totals['slow_query_ms'] = SLOW_QUERY_MS
+    # Callbacks issuing the most queries per call first: that is where N+1 loops show up
+    totals['callbacks'] = dict(sorted(callbacks.items(),
+                                      key=lambda item: (item[1]['queries_per_call'] or 0, item[1]['queries']),
+                                      reverse=True))
+    totals['statements'] = [
+        {'query': sql, **stats}
+        for sql, stats in sorted(statements.items(), key=lambda item: item[1]['time_total_ms'], reverse=True)[:top]
+    ]
+    totals['recent_slow_queries'] = recent_slow
+    return totals
+
+
+def reset_query_stats():
+    """Forget all recorded query stats (e.g. between benchmark runs)"""
+    with _query_lock:
+        for key in _query_totals:
+            _query_totals[key] = 0.0 if key == 'time_total' else 0
+        _callback_query_stats.clear()
+        _statement_stats.clear()
+        _recent_slow_queries.clear()
+
+
+@contextmanager
+def db_connection():
+    """Check out a pooled connection, commit on success, roll back on error and return it"""
+    pool = get_pool()
+    conn = pool.getconn()
+    tracked = _InstrumentedConnection(conn) if DB_INSTRUMENT else None
+    broken = False
+    try:
+        yield conn if tracked is None else tracked
+        if tracked is not None:
+            tracked.finish()
+        conn.commit()
+    except Exception as e:
+        broken = isinstance(e, pool.backend.disconnect_errors)
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        raise
+    finally:
+        if tracked is not None:
+            tracked.finish()
+        pool.putconn(conn, discard=broken)
+
+
+# Function to open a dedicated (unpooled) connection, e.g. for schema scripts or exports.
+# statement_timeout / idle_timeout (seconds) are enforced by the server on Postgres
+def connect_db(statement_timeout=None, idle_timeout=None):
+    conn = get_backend().connect(statement_timeout=statement_timeout, idle_timeout=idle_timeout)
     return conn
 
+# Everything the pages keep in user-data-store, fetched in one round trip.
+# Only the columns the pages read are selected (never password_hash).
+USER_SNAPSHOT_QUERY = """
+    WITH u AS (
+        SELECT user_id, email, full_name, dashboard_settings
+        FROM users
+        WHERE user_id = %(user_id)s
+    ),
+    inc AS (
+        SELECT income_id, source, amount, monthly_amount, frequency,
+               income_type, category, date
+        FROM income
+        WHERE user_id = %(user_id)s
+    ),
+    exp AS (
+        SELECT expense_id, description, amount, category, date, due_date
+        FROM expense
+        WHERE user_id = %(user_id)s
+    ),
+    goals AS (
+        SELECT goal_id, goal_name, target_amount, current_amount, deadline
+        FROM saving_goals
+        WHERE user_id = %(user_id)s
+    ),
+    txn AS (
+        SELECT transaction_id, amount, type, category, description, date
+        FROM transactions
+        WHERE user_id = %(user_id)s
+        ORDER BY date DESC, transaction_id DESC
+        LIMIT %(transaction_limit)s
+    ),
+    rollup AS (
+        SELECT to_char(month, 'YYYY-MM') AS month, category, total::float8 AS total, count
+        FROM expense_monthly_rollup
+        WHERE user_id = %(user_id)s
+    )
+    SELECT json_build_object(
+        'user_info', json_build_object(
+            'user_id', u.user_id, 'email', u.email, 'full_name', u.full_name
+        ),
+        'dashboard_settings', u.dashboard_settings,
+        'dashboard_components', COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', d.component_id, 'type', d.type, 'title', d.title, 'settings', d.settings,
+                'position', json_build_object('x', d.x, 'y', d.y, 'w', d.w, 'h', d.h)
+            ) ORDER BY d.sort_order, d.component_id)
+            FROM dashboard_components d WHERE d.user_id = %(user_id)s
+        ), '[]'::json),
+        'income', COALESCE((SELECT json_agg(inc) FROM inc), '[]'::json),
+        'expenses', COALESCE((SELECT json_agg(exp) FROM exp), '[]'::json),
+        'expense_rollup', COALESCE((SELECT json_agg(rollup ORDER BY rollup.month, rollup.category) FROM rollup), '[]'::json),
+        'savings_goals', COALESCE((SELECT json_agg(goals) FROM goals), '[]'::json),
+        'transactions', COALESCE((SELECT json_agg(txn ORDER BY txn.date DESC, txn.transaction_id DESC) FROM txn), '[]'::json),
+        'savings_target', COALESCE(
+            (SELECT amount FROM savings_target WHERE user_id = %(user_id)s LIMIT 1), 0
+        )
+    )
+    FROM u
+"""
+
+def parse_dashboard_settings(raw_settings):
+    """Return stored dashboard settings as a dict, falling back to an empty dashboard"""
+    if not raw_settings:
+        return {'components': []}
+    try:
+        settings = json.loads(raw_settings) if isinstance(raw_settings, str) else raw_settings
+    except (TypeError, ValueError) as e:
+        print(f"Error parsing dashboard settings: {e}")
+        return {'components': []}
+    if not isinstance(settings, dict):
+        return {'components': []}
+    settings.setdefault('components', [])
+    return settings
+
+# Dashboard cards are rows in dashboard_components; users.dashboard_settings
+# keeps only the dashboard-wide options. Each card's grid position is stored
+# once and the per-breakpoint layouts are derived from it when rendering.
+DASHBOARD_COMPONENT_COLUMNS = "component_id, type, title, settings, x, y, w, h, sort_order"
+
+def _component_row(user_id, component, sort_order):
+    """Column values for a dashboard component dict, in DASHBOARD_COMPONENT_COLUMNS order"""
+    position = component.get('position') or {}
+    return (
+        user_id,
+        str(component['id']),
+        component.get('type', 'unknown'),
+        component.get('title'),
+        Json(component.get('settings') or {}),
+        int(position.get('x', 0)),
+        int(position.get('y', 0)),
+        int(position.get('w', 8)),
+        int(position.get('h', 6)),
+        sort_order,
+    )
+
+def _component_from_row(row):
+    component_id, type_, title, settings, x, y, w, h = row[:8]
+    return {
+        'id': component_id,
+        'type': type_,
+        'title': title,
+        'settings': json.loads(settings) if isinstance(settings, str) else (settings or {}),
+        'position': {'x': x, 'y': y, 'w': w, 'h': h},
+    }
+
+def get_dashboard_components(user_id):
+    """A user's dashboard components in the order they were added"""
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT {DASHBOARD_COMPONENT_COLUMNS}
+            FROM dashboard_components
+            WHERE user_id = %s
+            ORDER BY sort_order, component_id
+        """, (actual_user_id,))
+        return [_component_from_row(row) for row in cur.fetchall()]
+
+def add_dashboard_component(user_id, component):
+    """Insert one dashboard component after the existing ones. Returns False
+    when a component with the same id is already stored."""
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    row = _component_row(actual_user_id, component, None)[:-1]
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            INSERT INTO dashboard_components (user_id, {DASHBOARD_COMPONENT_COLUMNS})
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, (
+                SELECT COALESCE(MAX(sort_order), -1) + 1 FROM dashboard_components WHERE user_id = %s
+            ))
+            ON CONFLICT (user_id, component_id) DO NOTHING
+        """, row + (actual_user_id,))
+        added = cur.rowcount > 0
+    if added:
+        invalidate_user_snapshot(actual_user_id)
+    return added
+
+def delete_dashboard_component(user_id, component_id):
+    """Remove one dashboard component. Returns False if it was not stored."""
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM dashboard_components WHERE user_id = %s AND component_id = %s",
+                    (actual_user_id, str(component_id)))
+        deleted = cur.rowcount > 0
+    if deleted:
+        invalidate_user_snapshot(actual_user_id)
+    return deleted
+
+def save_dashboard_positions(user_id, positions):
+    """Store grid positions given as {component_id: {'x', 'y', 'w', 'h'}}, updating
+    only the components that actually moved or resized. Returns False when
+    nothing changed."""
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    if not positions:
+        return False
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT component_id, x, y, w, h FROM dashboard_components WHERE user_id = %s",
+                    (actual_user_id,))
+        stored = {row[0]: tuple(row[1:]) for row in cur.fetchall()}
+        updates = []
+        for component_id, position in positions.items():
+            new = (int(position.get('x', 0)), int(position.get('y', 0)),
+                   int(position.get('w', 8)), int(position.get('h', 6)))
+            if component_id in stored and stored[component_id] != new:
+                updates.append(new + (actual_user_id, component_id))
+        if updates:
+            cur.executemany("""
+                UPDATE dashboard_components SET x = %s, y = %s, w = %s, h = %s
+                WHERE user_id = %s AND component_id = %s
+            """, updates)
+    if updates:
+        invalidate_user_snapshot(actual_user_id)
+    return bool(updates)
+
+def _dashboard_options(settings):
+    """The dashboard-wide part of a settings dict, which stays in users.dashboard_settings"""
+    return {key: value for key, value in (settings or {}).items() if key not in ('components', 'layouts')}
+
+def _save_dashboard_components(cur, user_id, components):
+    """Make the stored components match `components`, writing only the rows that
+    differ. Returns the number of rows written."""
+    cur.execute(f"SELECT {DASHBOARD_COMPONENT_COLUMNS} FROM dashboard_components WHERE user_id = %s",
+                (user_id,))
+    stored = {}
+    for row in cur.fetchall():
+        component = _component_from_row(row)
+        stored[component['id']] = (component, row[8])
+
+    inserts, updates, seen = [], [], set()
+    for sort_order, component in enumerate(components):
+        row = _component_row(user_id, component, sort_order)
+        component_id = row[1]
+        seen.add(component_id)
+        if component_id not in stored:
+            inserts.append(row)
+            continue
+        current, current_order = stored[component_id]
+        wanted = _component_from_row(row[1:4] + (component.get('settings') or {},) + row[5:])
+        if current != wanted or current_order != sort_order:
+            updates.append(row[2:] + (user_id, component_id))
+    deletes = [(user_id, component_id) for component_id in stored if component_id not in seen]
+
+    if deletes:
+        cur.executemany("DELETE FROM dashboard_components WHERE user_id = %s AND component_id = %s", deletes)
+    if inserts:
+        cur.executemany(f"""
+            INSERT INTO dashboard_components (user_id, {DASHBOARD_COMPONENT_COLUMNS})
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, inserts)
+    if updates:
+        cur.executemany("""
+            UPDATE dashboard_components
+            SET type = %s, title = %s, settings = %s, x = %s, y = %s, w = %s, h = %s, sort_order = %s
+            WHERE user_id = %s AND component_id = %s
+        """, updates)
+    return len(deletes) + len(inserts) + len(updates)
+
+def save_dashboard_settings(user_id, settings):
+    """Store a user's whole dashboard: components go to dashboard_components,
+    touching only the rows that changed, and the remaining options to
+    users.dashboard_settings. Returns False when nothing changed."""
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    settings = settings or {}
+    with db_connection() as conn, conn.cursor() as cur:
+        written = _save_dashboard_components(cur, actual_user_id, settings.get('components') or [])
+        cur.execute(get_backend().save_dashboard_settings_query,
+                    {'settings': Json(_dashboard_options(settings)), 'user_id': actual_user_id})
+        changed = written > 0 or cur.rowcount > 0
+    if changed:
+        invalidate_user_snapshot(actual_user_id)
+    return changed
+
+def migrate_dashboard_components():
+    """Move components kept in the old users.dashboard_settings blob into
+    dashboard_components and drop the stored per-breakpoint layouts. Users who
+    already have component rows keep them. Returns the number of users migrated."""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT user_id, dashboard_settings FROM users
+            WHERE CAST(dashboard_settings AS TEXT) LIKE '%"components"%'
+               OR CAST(dashboard_settings AS TEXT) LIKE '%"layouts"%'
+        """)
+        legacy = cur.fetchall()
+        for user_id, raw_settings in legacy:
+            settings = parse_dashboard_settings(raw_settings)
+            cur.execute("SELECT 1 FROM dashboard_components WHERE user_id = %s LIMIT 1", (user_id,))
+            if cur.fetchone() is None:
+                _save_dashboard_components(cur, user_id, [
+                    component for component in settings['components']
+                    if isinstance(component, dict) and component.get('id')
+                ])
+            cur.execute("UPDATE users SET dashboard_settings = %s WHERE user_id = %s",
+                        (Json(_dashboard_options(settings)), user_id))
+    for user_id, _ in legacy:
+        invalidate_user_snapshot(user_id)
+    return len(legacy)
+
+class _CountingCache(TTLCache):
+    """TTL + LRU cache that counts capacity evictions"""
+    evictions = 0
+
+    def popitem(self):
+        self.evictions += 1
+        return super().popitem()
+
+
+# Per-process cache of user snapshots keyed by user_id. Every write path below
+# calls invalidate_user_snapshot; the TTL bounds staleness for writes made by
+# other worker processes.
+_snapshot_cache = _CountingCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_snapshot_lock = threading.Lock()
+_snapshot_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+# Bumped on every invalidation so a load that raced a write is not cached
+_snapshot_generation = 0
+
+
+def _user_key(user_id):
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    return str(actual_user_id)
+
+
+def invalidate_user_snapshot(user_id):
+    """Drop a user's cached snapshot after their data changes"""
+    global _snapshot_generation
+    if user_id is None:
+        return
+    with _snapshot_lock:
+        _snapshot_generation += 1
+        _snapshot_stats['invalidations'] += 1
+        _snapshot_cache.pop(_user_key(user_id), None)
+
+
+def clear_snapshot_cache():
+    global _snapshot_generation
+    with _snapshot_lock:
+        _snapshot_generation += 1
+        _snapshot_cache.clear()
+
+
+def snapshot_cache_stats():
+    """Hit/miss counters and size of the user snapshot cache for monitoring"""
+    with _snapshot_lock:
+        stats = dict(_snapshot_stats)
+        stats.update({
+            'size': len(_snapshot_cache),
+            'max_size': _snapshot_cache.maxsize,
+            'ttl': _snapshot_cache.ttl,
+            'evictions': _snapshot_cache.evictions,
+        })
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+def _load_user_snapshot(actual_user_id, transaction_limit):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(get_backend().user_snapshot_query, {
+            'user_id': actual_user_id,
+            'transaction_limit': transaction_limit,
+        })
+        row = cur.fetchone()
+
+    if not row:
+        return {}
+
+    # psycopg2 decodes the json column itself; SQLite returns text
+    snapshot = json.loads(row[0]) if isinstance(row[0], str) else row[0]
+    # Dashboard options from the users row, cards from dashboard_components
+    settings = parse_dashboard_settings(snapshot.get('dashboard_settings'))
+    components = snapshot.pop('dashboard_components', None)
+    if isinstance(components, str):
+        components = json.loads(components)
+    settings.pop('layouts', None)
+    if components:
+        settings['components'] = components
+    snapshot['dashboard_settings'] = settings
+    return snapshot
+
+
+def get_user_snapshot(user_id, transaction_limit=50):
+    """Load a user's info, income, expenses, monthly expense rollup, goals, recent
+    transactions, savings target and dashboard settings with a single query. Returns {} for unknown users.
+    Default-sized snapshots are served from the per-user cache when possible."""
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    if transaction_limit != 50:
+        return _load_user_snapshot(actual_user_id, transaction_limit)
+
+    key = _user_key(actual_user_id)
+    with _snapshot_lock:
+        snapshot = _snapshot_cache.get(key)
+        if snapshot is not None:
+            _snapshot_stats['hits'] += 1
+            return copy.deepcopy(snapshot)
+        _snapshot_stats['misses'] += 1
+        generation = _snapshot_generation
+
+    snapshot = _load_user_snapshot(actual_user_id, transaction_limit)
+
+    if snapshot:
+        with _snapshot_lock:
+            if generation == _snapshot_generation:
+                _snapshot_cache[key] = snapshot
+        snapshot = copy.deepcopy(snapshot)
+    return snapshot
+
+def get_expense_rollup(user_id, since=None):
+    """Monthly expense totals by category from expense_monthly_rollup, oldest first.
+    Rows are {'month': 'YYYY-MM', 'category', 'total', 'count'}; `since` is a date
+    and drops months before the one it falls in."""
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    query = get_backend().expense_rollup_query
+    params = [actual_user_id]
+    if since:
+        since = _as_date(since)
+        query += " AND month >= %s"
+        params.append(date_type(since.year, since.month, 1))
+    query += " ORDER BY month, category"
+
+    with db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(query, params)
+        return [dict(row) for row in cur.fetchall()]
+
+def rollup_expenses(expenses):
+    """Build get_expense_rollup-shaped rows from raw expense records (demo data)"""
+    buckets = {}
+    for expense in expenses:
+        date = expense.get('date')
+        if not date:
+            continue
+        if isinstance(date, str):
+            date = datetime.fromisoformat(date.replace('Z', '+00:00'))
+        key = (date.strftime('%Y-%m'), expense.get('category') or 'Uncategorized')
+        total, count = buckets.get(key, (0.0, 0))
+        buckets[key] = (total + float(expense['amount']), count + 1)
+    return [{'month': month, 'category': category, 'total': total, 'count': count}
+            for (month, category), (total, count) in sorted(buckets.items())]
+
+def encode_transaction_cursor(date, transaction_id):
+    """Opaque keyset cursor for the position just after (date, transaction_id)"""
+    if isinstance(date, datetime):
+        date = date.isoformat()
+    raw = f"{date}|{transaction_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_transaction_cursor(cursor):
+    """Inverse of encode_transaction_cursor; raises ValueError for malformed cursors"""
+    try:
+        date, transaction_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|', 1)
+        return datetime.fromisoformat(date), transaction_id
+    except Exception as e:
+        raise ValueError(f"Invalid transaction cursor: {cursor!r}") from e
+
+def _as_date(value):
+    if value is None or isinstance(value, (datetime, date_type)):
+        return value
+    return datetime.fromisoformat(str(value))
+
+def _jsonable_row(row):
+    row = dict(row)
+    for key, value in row.items():
+        if isinstance(value, Decimal):
+            row[key] = float(value)
+        elif isinstance(value, (datetime, date_type)):
+            row[key] = value.isoformat()
+        elif value is not None and not isinstance(value, (str, int, float, bool)):
+            row[key] = str(value)
+    return row
+
+def get_transactions_page(user_id, cursor=None, limit=50, start_date=None, end_date=None,
+                          category=None, transaction_type=None):
+    """One page of a user's transactions, newest first, using keyset pagination
+    on (date, transaction_id). Filters are applied in SQL; end_date is inclusive.
+    Returns {'transactions': [...], 'next_cursor': str or None}."""
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    limit = max(1, min(int(limit), 500))
+
+    conditions = ["user_id = %s"]
+    params = [actual_user_id]
+
+    if cursor:
+        after_date, after_id = decode_transaction_cursor(cursor)
+        conditions.append("(date, transaction_id) < (%s, %s)")
+        params.extend([after_date, after_id])
+    if start_date:
+        conditions.append("date >= %s")
+        params.append(_as_date(start_date))
+    if end_date:
+        conditions.append("date < %s")
+        params.append(_as_date(end_date) + timedelta(days=1))
+    if category:
+        conditions.append("category = %s")
+        params.append(category)
+    if transaction_type:
+        conditions.append("type = %s")
+        params.append(transaction_type)
+
+    # Fetch one extra row to know whether another page exists
+    params.append(limit + 1)
+    query = f"""
+        SELECT transaction_id, amount, type, category, description, date
+        FROM transactions
+        WHERE {' AND '.join(conditions)}
+        ORDER BY date DESC, transaction_id DESC
+        LIMIT %s
+    """
+
+    with db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(query, params)
+        rows = cur.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_transaction_cursor(last['date'], last['transaction_id'])
+
+    return {
+        'transactions': [_jsonable_row(row) for row in rows],
+        'next_cursor': next_cursor,
+    }
+
+# Columnar fetch: query results as typed NumPy columns in a DataFrame, for
+# analytics over long histories. Amounts and timestamps are converted in SQL
+# (float8 / epoch microseconds on Postgres) and then a whole batch at a time,
+# so no Decimal or datetime object is built per row.
+_COLUMN_DTYPES = {
+    'float': 'float64',            # NULL -> NaN
+    'datetime': 'datetime64[us]',  # NULL -> NaT
+    'category': object,
+    'text': object,
+}
+
+
+def fetch_columns(query, params, kinds, batch_size=COLUMNAR_BATCH_SIZE):
+    """Run `query` and return a DataFrame with one typed column per selected value.
+    `kinds` is a list of (name, kind) in select order, kind one of 'float',
+    'datetime', 'category' or 'text'; select float and datetime values through
+    columnar_expression() so the backend hands them over ready to convert."""
+    parts = [[] for _ in kinds]
+    backend = get_backend()
+
+    with db_connection() as conn:
+        cur = backend.server_cursor(conn)
+        try:
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for part, (_, kind), values in zip(parts, kinds, zip(*rows)):
+                    part.append(np.array(values, dtype=_COLUMN_DTYPES[kind]))
+        finally:
+            cur.close()
+
+    columns = {}
+    for part, (name, kind) in zip(parts, kinds):
+        values = np.concatenate(part) if part else np.array([], dtype=_COLUMN_DTYPES[kind])
+        columns[name] = pd.Categorical(values) if kind == 'category' else values
+    return pd.DataFrame(columns)
+
+
+def columnar_expression(column, kind):
+    """Select-list expression for `column` as fetch_columns expects it"""
+    if kind == 'float':
+        return get_backend().columnar_float.format(column)
+    if kind == 'datetime':
+        return get_backend().columnar_datetime.format(column)
+    return column
+
+
+def _fetch_user_columns(table, kinds, user_id, conditions=(), params=(), order_by='date'):
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    select = ', '.join(f"{columnar_expression(name, kind)} AS {name}" for name, kind in kinds)
+    where = ' AND '.join(["user_id = %s", *conditions])
+    query = f"SELECT {select} FROM {table} WHERE {where} ORDER BY {order_by}"
+    return fetch_columns(query, [actual_user_id, *params], kinds)
+
+
+def get_expense_columns(user_id, since=None):
+    """A user's expenses, oldest first, as a DataFrame with datetime64 date/due_date,
+    float64 amount and categorical category. `since` drops earlier expenses."""
+    conditions, params = [], []
+    if since:
+        conditions.append("date >= %s")
+        params.append(_as_date(since))
+    return _fetch_user_columns(
+        'expense',
+        [('date', 'datetime'), ('due_date', 'datetime'), ('amount', 'float'), ('category', 'category')],
+        user_id, conditions, params,
+    )
+
+
+def get_transaction_columns(user_id, start_date=None, end_date=None, transaction_type=None):
+    """A user's transactions, oldest first, as a DataFrame with datetime64 date,
+    float64 amount and categorical type/category. end_date is inclusive."""
+    conditions, params = [], []
+    if start_date:
+        conditions.append("date >= %s")
+        params.append(_as_date(start_date))
+    if end_date:
+        conditions.append("date < %s")
+        params.append(_as_date(end_date) + timedelta(days=1))
+    if transaction_type:
+        conditions.append("type = %s")
+        params.append(transaction_type)
+    return _fetch_user_columns(
+        'transactions',
+        [('date', 'datetime'), ('amount', 'float'), ('type', 'category'), ('category', 'category')],
+        user_id, conditions, params, order_by='date, transaction_id',
+    )
+
+
+def get_income_columns(user_id):
+    """A user's income sources, oldest first, as a DataFrame with datetime64 date,
+    float64 amount/monthly_amount and categorical source/category"""
+    return _fetch_user_columns(
+        'income',
+        [('date', 'datetime'), ('amount', 'float'), ('monthly_amount', 'float'),
+         ('source', 'category'), ('category', 'category')],
+        user_id, order_by='date, income_id',
+    )
+
+def _month_start(value):
+    value = _as_date(value)
+    return date_type(value.year, value.month, 1)
+
+
+def _add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date_type(index // 12, index % 12 + 1, 1)
+
+
+def ensure_transaction_partitions(first=None, last=None, cur=None):
+    """Create the monthly transaction partitions from `first` to `last`
+    (default: this month to TRANSACTION_PARTITION_MONTHS_AHEAD ahead).
+    Runs on `cur` when given, else in its own transaction. Returns how many
+    partitions were created; always 0 on backends without partitioning."""
+    first = _month_start(first or datetime.now())
+    last = _month_start(last) if last else _add_months(first, TRANSACTION_PARTITION_MONTHS_AHEAD)
+    if cur is not None:
+        return get_backend().ensure_transaction_partitions(cur, first, last)
+    with db_connection() as conn, conn.cursor() as cur:
+        return get_backend().ensure_transaction_partitions(cur, first, last)
+
+
 # Function to register a new user
 def register_user(email, password, full_name):
-    conn = connect_db()
-    cur = conn.cursor()
-
     # Hash password before storing it
     hashed_pw = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
 
-    cur.execute("""
-    INSERT INTO users (email, password_hash, full_name)
-    VALUES (%s, %s, %s) RETURNING user_id;
-    """, (email, hashed_pw, full_name))
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+            INSERT INTO users (email, password_hash, full_name)
+            VALUES (%s, %s, %s) RETURNING user_id;
+            """, (email, hashed_pw, full_name))
 
-    user_id = cur.fetchone()[0]
-    conn.commit()
-    cur.close()
-    conn.close()
+            user_id = cur.fetchone()[0]
 
     return user_id
 
 # Function to authenticate a user
 def authenticate_user(email, password):
-    conn = connect_db()
-    cur = conn.cursor()
-
-    cur.execute("SELECT user_id, password_hash FROM users WHERE email = %s;", (email,))
-    result = cur.fetchone()
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT user_id, password_hash FROM users WHERE email = %s;", (email,))
+            result = cur.fetchone()
 
     if result and bcrypt.checkpw(password.encode('utf-8'), result[1].encode('utf-8')):
         return result[0]  # return user_id if authentication is successful
     else:
         return None
 
+# Per-process cache of the (user_id, email, password_hash) rows Flask-Login's
+# user_loader runs on every authenticated request, including each Dash callback.
+# Logout, password changes and account deletion invalidate; the TTL bounds how
+# long another worker process can keep serving a stale identity.
+_identity_cache = _CountingCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+_identity_lock = threading.Lock()
+_identity_stats = {'hits': 0, 'misses': 0, 'invalidations': 0,
+                   'lookup_time_total': 0.0, 'lookup_time_max': 0.0}
+_identity_generation = 0
+
+
+def get_user_identity(user_id):
+    """(user_id, email, password_hash) for a user, or None if there is no such user"""
+    started = time.perf_counter()
+    key = _user_key(user_id)
+    with _identity_lock:
+        identity = _identity_cache.get(key)
+        generation = _identity_generation
+
+    hit = identity is not None
+    if not hit:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT user_id, email, password_hash FROM users WHERE user_id = %s", (key,))
+            identity = cur.fetchone()
+
+    elapsed = time.perf_counter() - started
+    with _identity_lock:
+        _identity_stats['hits' if hit else 'misses'] += 1
+        # Unknown users are not cached, and neither is a row read while an invalidation raced it
+        if not hit and identity is not None and generation == _identity_generation:
+            _identity_cache[key] = identity
+        _identity_stats['lookup_time_total'] += elapsed
+        _identity_stats['lookup_time_max'] = max(_identity_stats['lookup_time_max'], elapsed)
+    return identity
+
+
+def invalidate_user_identity(user_id):
+    """Drop a user's cached login identity (logout, password change, deletion)"""
+    global _identity_generation
+    if user_id is None:
+        return
+    with _identity_lock:
+        _identity_generation += 1
+        _identity_stats['invalidations'] += 1
+        _identity_cache.pop(_user_key(user_id), None)
+
+
+def identity_cache_stats():
+    """Hit rate and lookup latency of the login identity cache for monitoring"""
+    with _identity_lock:
+        stats = dict(_identity_stats)
+        stats.update({
+            'size': len(_identity_cache),
+            'max_size': _identity_cache.maxsize,
+            'ttl': _identity_cache.ttl,
+            'evictions': _identity_cache.evictions,
+        })
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+    stats['lookup_time_avg_ms'] = stats['lookup_time_total'] / lookups * 1000 if lookups else 0.0
+    stats['lookup_time_max_ms'] = stats['lookup_time_max'] * 1000
+    return stats
+
+
+# Function to change a user's password (the hash is made by the caller's scheme)
+def update_password_hash(user_id, password_hash):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("UPDATE users SET password_hash = %s, updated_at = NOW() WHERE user_id = %s",
+                    (password_hash, user_id))
+    invalidate_user_identity(user_id)
+
+
+# Function to delete a user account and, through ON DELETE CASCADE, all of its data
+def delete_user(user_id):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM users WHERE user_id = %s", (user_id,))
+        deleted = cur.rowcount > 0
+    invalidate_user_identity(user_id)
+    invalidate_user_snapshot(user_id)
+    return deleted
+
 def add_income(user_id, income_data):
-    conn = connect_db()
     try:
-        with conn.cursor() as cur:
-            # Extract the user_id value if it's a dictionary
-            actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
-            
-            # Insert into the existing "income" table instead of "income_sources"
-            cur.execute("""
-                INSERT INTO income 
-                (user_id, source, amount, monthly_amount, weekly_amount, daily_amount, 
-                 frequency, income_type, consistency, category) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING income_id
-            """, (
-                actual_user_id, 
-                income_data.get('source'), 
-                income_data.get('amount'), 
-                income_data.get('monthly_amount'), 
-                income_data.get('weekly_amount'), 
-                income_data.get('daily_amount'),
-                income_data.get('frequency'), 
-                income_data.get('type'),  # Note: column is income_type, but data key is 'type'
-                income_data.get('consistency'),
-                income_data.get('category')
-                # Removed the JSONB data field as it doesn't exist in your table
-            ))
-            income_id = cur.fetchone()[0]
-            conn.commit()
-            return income_id
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                # Extract the user_id value if it's a dictionary
+                actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+                
+                # Insert into the existing "income" table instead of "income_sources"
+                cur.execute("""
+                    INSERT INTO income 
+                    (user_id, source, amount, monthly_amount, weekly_amount, daily_amount, 
+                     frequency, income_type, consistency, category) 
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING income_id
+                """, (
+                    actual_user_id, 
+                    income_data.get('source'), 
+                    income_data.get('amount'), 
+                    income_data.get('monthly_amount'), 
+                    income_data.get('weekly_amount'), 
+                    income_data.get('daily_amount'),
+                    income_data.get('frequency'), 
+                    income_data.get('type'),  # Note: column is income_type, but data key is 'type'
+                    income_data.get('consistency'),
+                    income_data.get('category')
+                    # Removed the JSONB data field as it doesn't exist in your table
+                ))
+                income_id = cur.fetchone()[0]
+        invalidate_user_snapshot(actual_user_id)
+        return income_id
     except Exception as e:
-        conn.rollback()
         print(f"Error adding income: {e}")
         raise
-    finally:
-        conn.close()
 
 def get_income_sources(user_id):
-    conn = connect_db()
     print(f"Getting income sources for user_id: {user_id}")
     # Check if user_id is a dictionary and extract the actual user_id
     try:
         # Extract the user_id value if it's a dictionary
         actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
         
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        with db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute("""
                 SELECT income_id, source, amount, monthly_amount, weekly_amount, daily_amount,
                        frequency, income_type as type, consistency, category
@@ -113,87 +1337,113 @@ def get_income_sources(user_id):
             
             sources = cur.fetchall()
             
-            # Process results into proper dictionaries
-            result = []
-            for source in sources:
-                # Convert from RealDictRow to regular dict
-                source_dict = dict(source)
-                
-                # Add id to the result
-                source_dict["id"] = source_dict["income_id"]
-                
-                # If we have historical data as JSON string, parse it
-                if source_dict.get("historical_data"):
-                    if isinstance(source_dict["historical_data"], str):
-                        source_dict["historical_data"] = json.loads(source_dict["historical_data"])
-                
-                # Add extra fields from the data JSON if they exist
-                if source_dict.get("data") and isinstance(source_dict["data"], dict):
-                    for key, value in source_dict["data"].items():
-                        if key not in source_dict:
-                            source_dict[key] = value
-                
-                # Set name field for compatibility with existing code
-                source_dict["name"] = source_dict.get("source", "Unnamed Income")
-                
-                result.append(source_dict)
-                
-            return result
+        # Process results into proper dictionaries
+        result = []
+        for source in sources:
+            # Convert from RealDictRow to regular dict
+            source_dict = dict(source)
+            
+            # Add id to the result
+            source_dict["id"] = source_dict["income_id"]
+            
+            # If we have historical data as JSON string, parse it
+            if source_dict.get("historical_data"):
+                if isinstance(source_dict["historical_data"], str):
+                    source_dict["historical_data"] = json.loads(source_dict["historical_data"])
+            
+            # Add extra fields from the data JSON if they exist
+            if source_dict.get("data") and isinstance(source_dict["data"], dict):
+                for key, value in source_dict["data"].items():
+                    if key not in source_dict:
+                        source_dict[key] = value
+            
+            # Set name field for compatibility with existing code
+            source_dict["name"] = source_dict.get("source", "Unnamed Income")
+            
+            result.append(source_dict)
+            
+        return result
     except Exception as e:
         print(f"Error getting income sources: {e}")
         return []
-    finally:
-        conn.close()
+
+# Upserts a whole historical income series in one statement. With recompute,
+# the same statement also refreshes income.monthly_amount (total of the stored
+# history / 12). The CTEs all read the pre-statement snapshot, so the total is
+# the stored months that are not being replaced plus the new values.
+HISTORICAL_INCOME_UPSERT = """
+    WITH new_rows (income_id, month, amount) AS (
+        VALUES %s
+    ),
+    upserted AS (
+        INSERT INTO historical_income (income_id, month, amount)
+        SELECT income_id, month, amount FROM new_rows
+        ON CONFLICT (income_id, month)
+        DO UPDATE SET amount = EXCLUDED.amount
+        RETURNING income_id
+    )
+    SELECT DISTINCT income.user_id
+    FROM income
+    WHERE income.income_id IN (SELECT income_id FROM upserted)
+"""
+
+HISTORICAL_INCOME_UPSERT_AND_RECOMPUTE = """
+    WITH new_rows (income_id, month, amount) AS (
+        VALUES %s
+    ),
+    upserted AS (
+        INSERT INTO historical_income (income_id, month, amount)
+        SELECT income_id, month, amount FROM new_rows
+        ON CONFLICT (income_id, month)
+        DO UPDATE SET amount = EXCLUDED.amount
+        RETURNING income_id
+    ),
+    totals AS (
+        SELECT n.income_id,
+               COALESCE(SUM(n.amount), 0) + COALESCE((
+                   SELECT SUM(h.amount) FROM historical_income h
+                   WHERE h.income_id = n.income_id
+                     AND h.month NOT IN (SELECT month FROM new_rows)
+               ), 0) AS total
+        FROM new_rows n
+        GROUP BY n.income_id
+    )
+    UPDATE income
+    SET monthly_amount = totals.total / 12
+    FROM totals
+    WHERE income.income_id = totals.income_id
+    RETURNING income.user_id
+"""
+
+def upsert_historical_income(cur, income_id, historical_data, recompute_monthly_amount=True):
+    """Write every month of historical_data for income_id in a single round trip.
+    Returns the user_id owning the income source (None if nothing was written)."""
+    rows = [(income_id, month, amount) for month, amount in historical_data.items()]
+
+    if not rows:
+        if not recompute_monthly_amount:
+            return None
+        cur.execute("""
+            UPDATE income
+            SET monthly_amount = COALESCE(
+                (SELECT SUM(amount) FROM historical_income WHERE income_id = %s), 0
+            ) / 12.0
+            WHERE income_id = %s
+            RETURNING user_id
+        """, (income_id, income_id))
+        owners = cur.fetchall()
+    else:
+        owners = get_backend().upsert_historical_income(cur, income_id, rows, recompute_monthly_amount)
+    return owners[0][0] if owners else None
 
 def update_income(income_id, update_data):
-    conn = connect_db()
+    owner_id = None
     try:
-        with conn.cursor() as cur:
-            # Handle historical data separately
+        with db_connection() as conn, conn.cursor() as cur:
+            # Historical data is upserted in bulk, and monthly_amount
+            # (total of all historical amounts / 12) is recomputed in the same statement
             if "historical_data" in update_data:
-                historical_data = update_data["historical_data"]
-
-                # Loop through each month’s data and save it
-                for month, amount in historical_data.items():
-                    # Check if this historical record exists
-                    cur.execute("""
-                        SELECT income_id FROM historical_income
-                        WHERE income_id = %s AND month = %s
-                    """, (income_id, month))
-
-                    result = cur.fetchone()
-
-                    if result:
-                        # Update existing historical record with the user’s input amount
-                        cur.execute("""
-                            UPDATE historical_income
-                            SET amount = %s
-                            WHERE income_id = %s AND month = %s
-                        """, (amount, income_id, month))
-                    else:
-                        # Insert new historical record with the user’s input amount
-                        cur.execute("""
-                            INSERT INTO historical_income (income_id, month, amount)
-                            VALUES (%s, %s, %s)
-                        """, (income_id, month, amount))
-
-                # After updating historical data, calculate the average monthly amount (sum of all historical amounts / number of months)
-                cur.execute("""
-                    SELECT SUM(amount) FROM historical_income
-                    WHERE income_id = %s
-                """, (income_id,))
-                
-                total_yearly_amount = cur.fetchone()[0] or 0  # Ensure no NULLs if no historical data
-                
-                # Calculate the monthly amount by dividing the total yearly amount by 12
-                monthly_amount = total_yearly_amount / 12
-
-                # Update monthly_amount in the income table (this is the only field that's updated with the average)
-                cur.execute("""
-                    UPDATE income
-                    SET monthly_amount = %s
-                    WHERE income_id = %s
-                """, (monthly_amount, income_id))
+                owner_id = upsert_historical_income(cur, income_id, update_data["historical_data"])
 
             # Handle other updates (non-historical) if present
             updates = []
@@ -205,106 +1455,294 @@ def update_income(income_id, update_data):
                     values.append(value)
 
             if updates:
-                query = f"UPDATE income SET {', '.join(updates)} WHERE income_id = %s"
+                query = f"UPDATE income SET {', '.join(updates)} WHERE income_id = %s RETURNING user_id"
                 values.append(income_id)
                 cur.execute(query, values)
-
-            # Commit all changes
-            conn.commit()
+                row = cur.fetchone()
+                owner_id = row[0] if row else owner_id
+        invalidate_user_snapshot(owner_id)
     except Exception as e:
-        conn.rollback()
         print(f"Error updating income: {e}")
         raise
-    finally:
-        conn.close()
 
 
 # Function to delete an income source
 # Check your delete_income function to make sure it's properly implemented
 def delete_income(income_id):
-    conn = connect_db()
-    cur = conn.cursor()
-    
-    # First delete historical data
-    cur.execute("DELETE FROM historical_income WHERE income_id = %s", (income_id,))
-    
-    # Then delete the income source itself
-    cur.execute("DELETE FROM income WHERE income_id = %s", (income_id,))
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_connection() as conn, conn.cursor() as cur:
+        # First delete historical data
+        cur.execute("DELETE FROM historical_income WHERE income_id = %s", (income_id,))
+        
+        # Then delete the income source itself
+        cur.execute("DELETE FROM income WHERE income_id = %s RETURNING user_id", (income_id,))
+        row = cur.fetchone()
+
+    if row:
+        invalidate_user_snapshot(row[0])
 
 # Function to add expense
 def add_expense(user_id, amount, category):
-    conn = connect_db()
-    cur = conn.cursor()
-
-    cur.execute("""
-    INSERT INTO expense (user_id, amount, category)
-    VALUES (%s, %s, %s);
-    """, (user_id, amount, category))
-
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+        INSERT INTO expense (user_id, amount, category)
+        VALUES (%s, %s, %s);
+        """, (user_id, amount, category))
+    invalidate_user_snapshot(user_id)
 
 # Function to add a saving goal
 def add_saving_goal(user_id, goal_name, target_amount, deadline):
-    conn = connect_db()
-    cur = conn.cursor()
-
-    cur.execute("""
-    INSERT INTO saving_goals (user_id, goal_name, target_amount, deadline)
-    VALUES (%s, %s, %s, %s);
-    """, (user_id, goal_name, target_amount, deadline))
-
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+        INSERT INTO saving_goals (user_id, goal_name, target_amount, deadline)
+        VALUES (%s, %s, %s, %s);
+        """, (user_id, goal_name, target_amount, deadline))
+    invalidate_user_snapshot(user_id)
 
 # Function to record a transaction (income or expense)
 def record_transaction(user_id, amount, transaction_type, description):
-    conn = connect_db()
-    cur = conn.cursor()
-
-    cur.execute("""
-    INSERT INTO transactions (user_id, amount, type, description)
-    VALUES (%s, %s, %s, %s);
-    """, (user_id, amount, transaction_type, description))
-
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+        INSERT INTO transactions (user_id, amount, type, description)
+        VALUES (%s, %s, %s, %s);
+        """, (user_id, amount, transaction_type, description))
+    invalidate_user_snapshot(user_id)
 
 # Function to retrieve income and expenses for a user
 def get_user_financials(user_id):
-    conn = connect_db()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-
-    cur.execute("""
-    SELECT * FROM income WHERE user_id = %s;
-    """, (user_id,))
-    income = cur.fetchall()
-
-    cur.execute("""
-    SELECT * FROM expense WHERE user_id = %s;
-    """, (user_id,))
-    expenses = cur.fetchall()
+    with db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+        SELECT * FROM income WHERE user_id = %s;
+        """, (user_id,))
+        income = cur.fetchall()
 
-    cur.close()
-    conn.close()
+        cur.execute("""
+        SELECT * FROM expense WHERE user_id = %s;
+        """, (user_id,))
+        expenses = cur.fetchall()
 
     return {"income": income, "expenses": expenses}
 
 # Function for editing historical income data
 def persist_historical_income(income_id, historical_data):
-    conn = connect_db()
-    with conn.cursor() as cur:
-        for month, amount in historical_data.items():
+    with db_connection() as conn, conn.cursor() as cur:
+        owner_id = upsert_historical_income(cur, income_id, historical_data, recompute_monthly_amount=False)
+    invalidate_user_snapshot(owner_id)
+
+# Function to look up a login by email: (user_id, email, password_hash) or None
+def get_user_by_email(email):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT user_id, email, password_hash FROM users WHERE email = %s", (email,))
+        return cur.fetchone()
+
+# Function to create a login. Returns the new user_id, or None if the email is already registered
+def create_user_account(email, password_hash):
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO users (email, password_hash) VALUES (%s, %s)
+            ON CONFLICT (email) DO NOTHING
+            RETURNING user_id
+        """, (email, password_hash))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+# Function to save an expense from the expense page. Recurring expenses go to
+# the expense table, one-off expenses to transactions.
+def save_expense(user_id, expense_id, amount, category, description, due_date, recurring):
+    with db_connection() as conn, conn.cursor() as cur:
+        if recurring:
+            cur.execute("""
+                INSERT INTO expense (expense_id, user_id, amount, category, description, due_date)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (expense_id, user_id, amount, category, description, due_date))
+        else:
             cur.execute("""
-                INSERT INTO historical_income (income_id, month, amount)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (income_id, month)
-                DO UPDATE SET amount = EXCLUDED.amount
-            """, (income_id, month, amount))
\ No newline at end of file
+                INSERT INTO transactions (transaction_id, user_id, amount, type, category, description, date)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (expense_id, user_id, amount, 'expense', category, description, due_date))
+    invalidate_user_snapshot(user_id)
+
+# Function to delete an expense saved by save_expense
+def delete_expense(user_id, expense_id, recurring):
+    with db_connection() as conn, conn.cursor() as cur:
+        if recurring:
+            cur.execute("DELETE FROM expense WHERE expense_id = %s AND user_id = %s", (expense_id, user_id))
+        else:
+            cur.execute("DELETE FROM transactions WHERE transaction_id = %s AND user_id = %s", (expense_id, user_id))
+    invalidate_user_snapshot(user_id)
+
+# Function to set a user's monthly savings target
+def set_savings_target(user_id, amount, target_date):
+    with db_connection() as conn, conn.cursor() as cur:
+        # Check if a record already exists
+        cur.execute("SELECT amount FROM savings_target WHERE user_id = %s", (user_id,))
+        if cur.fetchone():
+            cur.execute("UPDATE savings_target SET amount = %s, date = %s WHERE user_id = %s",
+                        (amount, target_date, user_id))
+        else:
+            cur.execute("INSERT INTO savings_target (user_id, amount, date) VALUES (%s, %s, %s)",
+                        (user_id, amount, target_date))
+    invalidate_user_snapshot(user_id)
+
+
+# Storage backends. Everything above talks to the database through
+# db_connection() with psycopg2-style SQL; a backend supplies connections and
+# the few statements and bulk operations that differ between databases.
+
+def _copy_field(value):
+    if value is None:
+        return r'\N'
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class _CopyStream:
+    """File-like object that feeds rows to COPY FROM STDIN as they are produced"""
+
+    def __init__(self, rows, columns):
+        self._rows = iter(rows)
+        self.columns = columns
+        self._buffer = ''
+        self.count = 0
+        self.error = None  # raised by the row source; COPY only reports it as QueryCanceled
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                row = next(self._rows, None)
+            except Exception as e:
+                self.error = e
+                raise
+            if row is None:
+                break
+            self._buffer += '\t'.join(_copy_field(row[c]) for c in self.columns) + '\n'
+            self.count += 1
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    readline = read
+
+
+class PostgresBackend:
+    """utils.db storage backend for the Postgres database at DATABASE_URL"""
+    name = 'postgres'
+    # Errors after which a connection is unusable and is dropped from the pool
+    disconnect_errors = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+    user_snapshot_query = USER_SNAPSHOT_QUERY
+    expense_rollup_query = """
+        SELECT to_char(month, 'YYYY-MM') AS month, category, total::float8 AS total, count
+        FROM expense_monthly_rollup
+        WHERE user_id = %s
+    """
+    save_dashboard_settings_query = """
+        UPDATE users SET dashboard_settings = %(settings)s
+        WHERE user_id = %(user_id)s
+          AND dashboard_settings IS DISTINCT FROM %(settings)s::jsonb
+    """
+
+    # Select-list templates for fetch_columns: float8 and epoch microseconds
+    columnar_float = "{}::float8"
+    columnar_datetime = "(EXTRACT(EPOCH FROM {}) * 1000000)::int8"
+
+    def __init__(self, dsn):
+        self.dsn = dsn
+
+    def describe(self):
+        return {'backend': self.name}
+
+    def server_cursor(self, conn):
+        """Named (server-side) cursor, so long results arrive in fetchmany batches"""
+        return conn.cursor(name=f"stream_{os.getpid()}_{next(_cursor_ids)}")
+
+    def begin_read_snapshot(self, cur):
+        """Make the rest of this transaction read one consistent snapshot"""
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+
+    def ensure_transaction_partitions(self, cur, first, last):
+        cur.execute("SELECT ensure_transactions_partitions(%s, %s)", (first, last))
+        return cur.fetchone()[0]
+
+    def connect(self, statement_timeout=None, idle_timeout=None):
+        """New connection. The timeouts (seconds) make the server cancel longer
+        statements and end the session once a transaction sits idle that long."""
+        settings = []
+        if statement_timeout:
+            settings.append(f"-c statement_timeout={int(statement_timeout * 1000)}")
+        if idle_timeout:
+            settings.append(f"-c idle_in_transaction_session_timeout={int(idle_timeout * 1000)}")
+        if settings:
+            return psycopg2.connect(self.dsn, options=' '.join(settings))
+        return psycopg2.connect(self.dsn)
+
+    def in_transaction(self, conn):
+        return conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def upsert_historical_income(self, cur, income_id, rows, recompute_monthly_amount):
+        query = HISTORICAL_INCOME_UPSERT_AND_RECOMPUTE if recompute_monthly_amount else HISTORICAL_INCOME_UPSERT
+        return psycopg2.extras.execute_values(
+            cur, query, rows,
+            template="(%s::integer, %s::varchar, %s::numeric)",
+            page_size=len(rows),
+            fetch=True,
+        )
+
+    def create_temp_table(self, cur, name, columns):
+        cur.execute(f"CREATE TEMP TABLE {name} ({columns}) ON COMMIT DROP")
+
+    def copy_rows(self, cur, table, columns, rows):
+        """Stream rows (dicts) into table with COPY; returns the row count"""
+        stream = _CopyStream(rows, columns)
+        try:
+            cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", stream)
+        except psycopg2.extensions.QueryCanceledError:
+            if stream.error is not None:
+                raise stream.error
+            raise
+        return stream.count
+
+
+_cursor_ids = itertools.count()
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend(name):
+    if name == 'postgres':
+        return PostgresBackend(DATABASE_URL)
+    if name == 'sqlite':
+        from utils.sqlite_backend import SQLiteBackend
+        return SQLiteBackend(SQLITE_PATH)
+    raise ValueError(f"Unknown DB_BACKEND {name!r}, expected 'postgres' or 'sqlite'")
+
+
+def get_backend():
+    """Return the storage backend selected by DB_BACKEND, creating it on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend(DB_BACKEND)
+    return _backend
+
+
+def set_backend(backend):
+    """Switch this process to another storage backend (a backend object or a
+    DB_BACKEND name), e.g. to run the same benchmark against both. Closes the
+    current pool and empties the caches, which belong to the old database."""
+    global _backend, _identity_generation
+    if isinstance(backend, str):
+        backend = _create_backend(backend)
+    close_pool()
+    clear_snapshot_cache()
+    with _identity_lock:
+        _identity_generation += 1
+        _identity_cache.clear()
+    with _backend_lock:
+        _backend = backend
+    return backend
@@ -0,0 +1,351 @@
+import os
+import csv
+import importlib.util
+import io
+import json
+import threading
+import zipfile
+from datetime import datetime, date
+from decimal import Decimal
+
+from utils.db import connect_db, get_backend
+
+# Export settings (override with environment variables)
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))  # rows fetched from the server-side cursor per batch
+EXPORT_MAX_RUNNING = int(os.getenv("EXPORT_MAX_RUNNING", "2"))  # exports streaming at once, each on its own connection outside the pool
+EXPORT_STATEMENT_TIMEOUT = float(os.getenv("EXPORT_STATEMENT_TIMEOUT", "300"))  # seconds one export query may run
+EXPORT_IDLE_TIMEOUT = float(os.getenv("EXPORT_IDLE_TIMEOUT", "120"))  # seconds a stalled download may keep its snapshot open before the server ends it
+
+# Slots for running exports, taken before the response starts
+_export_slots = threading.BoundedSemaphore(EXPORT_MAX_RUNNING)
+
+EXPORT_FORMATS = {
+    # format: (file extension, mimetype)
+    'jsonl': ('jsonl', 'application/x-ndjson'),
+    'csv': ('zip', 'application/zip'),
+    'parquet': ('zip', 'application/zip'),
+}
+
+# Everything a user owns, in export order, as (table, columns, query). Column
+# kinds drive the CSV/JSON value formatting and the Parquet schema; the queries
+# take %(user_id)s and never select password_hash.
+EXPORT_TABLES = [
+    ('account',
+     [('user_id', 'int'), ('email', 'text'), ('full_name', 'text'), ('created_at', 'timestamp'),
+      ('dashboard_settings', 'json')],
+     "SELECT user_id, email, full_name, created_at, dashboard_settings FROM users WHERE user_id = %(user_id)s"),
+    ('income',
+     [('income_id', 'int'), ('source', 'text'), ('amount', 'money'), ('monthly_amount', 'money'),
+      ('weekly_amount', 'money'), ('daily_amount', 'money'), ('frequency', 'text'), ('income_type', 'text'),
+      ('consistency', 'text'), ('category', 'text'), ('date', 'timestamp')],
+     """SELECT income_id, source, amount, monthly_amount, weekly_amount, daily_amount, frequency,
+               income_type, consistency, category, date
+        FROM income WHERE user_id = %(user_id)s ORDER BY income_id"""),
+    ('historical_income',
+     [('income_id', 'int'), ('month', 'text'), ('amount', 'money')],
+     """SELECT h.income_id, h.month, h.amount
+        FROM historical_income h JOIN income i ON i.income_id = h.income_id
+        WHERE i.user_id = %(user_id)s ORDER BY h.income_id, h.month"""),
+    ('expense',
+     [('expense_id', 'text'), ('description', 'text'), ('amount', 'money'), ('category', 'text'),
+      ('date', 'timestamp'), ('due_date', 'timestamp')],
+     """SELECT expense_id, description, amount, category, date, due_date
+        FROM expense WHERE user_id = %(user_id)s ORDER BY date, expense_id"""),
+    ('transactions',
+     [('transaction_id', 'text'), ('amount', 'money'), ('type', 'text'), ('category', 'text'),
+      ('description', 'text'), ('date', 'timestamp')],
+     """SELECT transaction_id, amount, type, category, description, date
+        FROM transactions WHERE user_id = %(user_id)s ORDER BY date, transaction_id"""),
+    ('saving_goals',
+     [('goal_id', 'text'), ('goal_name', 'text'), ('target_amount', 'money'), ('current_amount', 'money'),
+      ('deadline', 'date'), ('created_at', 'timestamp')],
+     """SELECT goal_id, goal_name, target_amount, current_amount, deadline, created_at
+        FROM saving_goals WHERE user_id = %(user_id)s ORDER BY created_at, goal_id"""),
+    ('dashboard_components',
+     [('component_id', 'text'), ('type', 'text'), ('title', 'text'), ('settings', 'json'),
+      ('x', 'int'), ('y', 'int'), ('w', 'int'), ('h', 'int')],
+     """SELECT component_id, type, title, settings, x, y, w, h
+        FROM dashboard_components WHERE user_id = %(user_id)s ORDER BY sort_order, component_id"""),
+    ('savings_target',
+     [('amount', 'money'), ('date', 'date')],
+     "SELECT amount, date FROM savings_target WHERE user_id = %(user_id)s ORDER BY date"),
+]
+
+
+class ExportError(Exception):
+    """Raised for an export that cannot be produced (unknown format, missing library)"""
+
+
+class ExportBusyError(ExportError):
+    """Raised when EXPORT_MAX_RUNNING exports are already streaming"""
+
+
+def _text_value(value):
+    """Value as it appears in CSV: exact decimals, ISO dates, JSON for settings"""
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, datetime):
+        return value.isoformat(' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, str) or value is None or isinstance(value, (int, float, bool, dict, list)):
+        return value
+    return str(value)  # UUIDs
+
+
+def iter_table_batches(user_id):
+    """Yield (table, columns, rows) with up to EXPORT_BATCH_SIZE rows at a time
+    for every export table, all read from one consistent snapshot. Tables
+    without rows yield one empty batch so every file still gets a header.
+
+    The snapshot lives as long as the client takes to download, so it uses
+    its own connection rather than one from the request pool. The server ends
+    it if a query runs past EXPORT_STATEMENT_TIMEOUT or the download stalls
+    for EXPORT_IDLE_TIMEOUT."""
+    backend = get_backend()
+    conn = connect_db(statement_timeout=EXPORT_STATEMENT_TIMEOUT, idle_timeout=EXPORT_IDLE_TIMEOUT)
+    try:
+        with conn.cursor() as cur:
+            backend.begin_read_snapshot(cur)
+        for table, columns, query in EXPORT_TABLES:
+            cur = backend.server_cursor(conn)
+            try:
+                cur.execute(query, {'user_id': user_id})
+                empty = True
+                while True:
+                    rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+                    if not rows:
+                        break
+                    empty = False
+                    yield table, columns, rows
+                if empty:
+                    yield table, columns, []
+            finally:
+                cur.close()
+        conn.rollback()  # read only, nothing to keep
+    finally:
+        conn.close()
+
+
+class _ExportStream:
+    """Iterator over an export's chunks that frees its export slot once it is
+    finished or closed (Flask closes it when the response ends, however early)"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._lock = threading.Lock()
+        self._released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        try:
+            self._chunks.close()
+        finally:
+            _export_slots.release()
+
+
+class _ChunkSink:
+    """Write-only, unseekable file that collects bytes until drained, so a
+    ZipFile can be streamed out piece by piece"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class _ZipEntryFile:
+    """Write-only view of an open zip entry that keeps its own position, for
+    writers (pyarrow) that ask tell() on their output"""
+
+    def __init__(self, entry):
+        self._entry = entry
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._entry.write(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def seekable(self):
+        return False
+
+    def writable(self):
+        return True
+
+    def readable(self):
+        return False
+
+
+def _export_header(user_id, fmt):
+    return {
+        'user_id': user_id,
+        'format': fmt,
+        'exported_at': datetime.now().isoformat(timespec='seconds'),
+        'tables': [table for table, _, _ in EXPORT_TABLES],
+    }
+
+
+def stream_jsonl(user_id):
+    """One JSON object per line: a header, then {"table": ..., "data": {...}} per row"""
+    yield json.dumps({'table': 'export', 'data': _export_header(user_id, 'jsonl')}) + '\n'
+    for table, columns, rows in iter_table_batches(user_id):
+        names = [name for name, _ in columns]
+        yield ''.join(
+            json.dumps({'table': table, 'data': {name: _json_value(value) for name, value in zip(names, row)}}) + '\n'
+            for row in rows
+        )
+
+
+def stream_csv_zip(user_id):
+    """A zip with one CSV per table and an export.json header, built as it streams"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('export.json', json.dumps(_export_header(user_id, 'csv'), indent=2))
+        text = None
+        current = None
+        for table, columns, rows in iter_table_batches(user_id):
+            if table != current:
+                if text is not None:
+                    text.close()
+                current = table
+                entry = archive.open(f"{table}.csv", 'w', force_zip64=True)
+                text = io.TextIOWrapper(entry, encoding='utf-8', newline='', write_through=True)
+                writer = csv.writer(text)
+                writer.writerow([name for name, _ in columns])
+            writer.writerows([_text_value(value) for value in row] for row in rows)
+            yield sink.drain()
+        if text is not None:
+            text.close()
+    yield sink.drain()
+
+
+def _arrow_schema(pa, columns):
+    types = {
+        'int': pa.int64(),
+        'text': pa.string(),
+        'json': pa.string(),
+        'money': pa.float64(),
+        'timestamp': pa.timestamp('us'),
+        'date': pa.date32(),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _arrow_value(value, kind):
+    if value is None:
+        return None
+    if kind == 'money':
+        return float(value)
+    if kind == 'json':
+        return value if isinstance(value, str) else json.dumps(value)
+    if kind == 'text':
+        return str(value)
+    return value
+
+
+def stream_parquet_zip(user_id):
+    """A zip with one Parquet file per table, one row group per fetched batch"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError("Parquet export needs pyarrow installed")
+
+    sink = _ChunkSink()
+    # Parquet pages are compressed already, so the zip entries are stored as is
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+        archive.writestr('export.json', json.dumps(_export_header(user_id, 'parquet'), indent=2))
+        writer = None
+        entry = None
+        current = None
+        for table, columns, rows in iter_table_batches(user_id):
+            if table != current:
+                if writer is not None:
+                    writer.close()
+                    entry.close()
+                current = table
+                schema = _arrow_schema(pa, columns)
+                entry = archive.open(f"{table}.parquet", 'w', force_zip64=True)
+                writer = pq.ParquetWriter(_ZipEntryFile(entry), schema)
+            if rows:
+                data = {
+                    name: [_arrow_value(row[index], kind) for row in rows]
+                    for index, (name, kind) in enumerate(columns)
+                }
+                writer.write_table(pa.Table.from_pydict(data, schema=schema))
+            yield sink.drain()
+        if writer is not None:
+            writer.close()
+            entry.close()
+    yield sink.drain()
+
+
+STREAMS = {
+    'jsonl': stream_jsonl,
+    'csv': stream_csv_zip,
+    'parquet': stream_parquet_zip,
+}
+
+
+def export_filename(fmt):
+    extension = EXPORT_FORMATS[fmt][0]
+    return f"bluecard_finance_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
+def stream_export(user_id, fmt='jsonl'):
+    """Iterator of the user's complete account export in `fmt` (jsonl, csv or
+    parquet). Memory use stays at one batch of rows whatever the history size.
+    Close it if it is not read to the end, to free its export slot."""
+    if fmt not in STREAMS:
+        raise ExportError(f"Unsupported export format: {fmt}")
+    if fmt == 'parquet':
+        # Fail before the response starts rather than halfway through it
+        if importlib.util.find_spec('pyarrow') is None:
+            raise ExportError("Parquet export needs pyarrow installed")
+    if not _export_slots.acquire(blocking=False):
+        raise ExportBusyError("Too many exports are running, please try again in a minute")
+    return _ExportStream(STREAMS[fmt](user_id))
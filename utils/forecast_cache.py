@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import time
+
+from cachetools import LRUCache
+
+# Forecast cache settings (override with environment variables)
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "2048"))  # forecasts kept in memory before least recently used are evicted
+FORECAST_CACHE_DIR = os.getenv("FORECAST_CACHE_DIR")  # directory that keeps forecasts across restarts and workers, memory only when unset
+
+# Every cache created in this process, for /api/metrics
+_caches = []
+
+
+def forecast_key(source_id, history, config):
+    """Stable hash of everything a forecast depends on: the source, its history
+    and the model configuration. Key order in dicts does not matter."""
+    payload = json.dumps([str(source_id), history, config], sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ForecastCache:
+    """LRU cache of fitted forecast results keyed by forecast_key().
+
+    Values must be JSON serialisable (e.g. a list of yhat floats). When
+    `directory` is set each result is also written there as <key>.json, so a
+    restarted or sibling worker reuses it instead of refitting. Entries never
+    go stale: a changed history or config gives a different key.
+    """
+
+    def __init__(self, name, maxsize=FORECAST_CACHE_SIZE, directory=FORECAST_CACHE_DIR):
+        self.name = name
+        self.directory = os.path.join(directory, name.replace(' ', '_')) if directory else None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'fits': 0, 'fit_seconds': 0.0, 'errors': 0}
+        _caches.append(self)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Error reading cached forecast {key}: {e}")
+            return None
+
+    def _store(self, key, value):
+        if not self.directory:
+            return
+        # Write to a temporary file first so readers never see half a forecast
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Error writing cached forecast {key}: {e}")
+
+    def get(self, key):
+        """The cached result for `key`, or None"""
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._stats['hits'] += 1
+                return value
+
+        value = self._load(key)
+        with self._lock:
+            if value is None:
+                self._stats['misses'] += 1
+            else:
+                self._stats['disk_hits'] += 1
+                self._cache[key] = value
+        return value
+
+    def peek(self, key):
+        """The in-memory result for `key` or None, without touching the disk
+        or the hit/miss stats"""
+        with self._lock:
+            return self._cache.get(key)
+
+    def put(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+        self._store(key, value)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached result for `key`, calling compute() to fit it on a miss"""
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        started = time.perf_counter()
+        try:
+            value = compute()
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        with self._lock:
+            self._stats['fits'] += 1
+            self._stats['fit_seconds'] += time.perf_counter() - started
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        """Forget the in-memory entries (files in `directory` are kept)"""
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'size': len(self._cache), 'max_size': self._cache.maxsize,
+                          'directory': self.directory})
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+
+def forecast_cache_stats():
+    """Stats for every forecast cache in this process, by name"""
+    return {cache.name: cache.stats() for cache in _caches}
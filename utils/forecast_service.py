@@ -0,0 +1,145 @@
+import os
+import atexit
+import threading
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from cachetools import TTLCache
+
+# Forecast worker settings (override with environment variables)
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", "2"))  # processes fitting forecasts, 0 fits inline inside the callback
+FORECAST_START_METHOD = os.getenv("FORECAST_START_METHOD", "spawn")  # spawn keeps workers clear of the server's threads and connections
+FORECAST_POLL_MS = int(os.getenv("FORECAST_POLL_MS", "1000"))  # how often a page checks for a forecast it is waiting on
+FORECAST_RETRY_AFTER = float(os.getenv("FORECAST_RETRY_AFTER", "300"))  # seconds before a failed fit is tried again
+
+
+class ForecastError(Exception):
+    """Raised when the fit for a forecast failed; the page should show its baseline"""
+
+
+class ForecastService:
+    """Runs forecast fits in a pool of worker processes so callbacks never wait
+    on them.
+
+    request() answers from the ForecastCache when it can. Otherwise it queues
+    the fit, once per key however many callbacks ask for it, and returns None
+    until the result has landed in the cache. Pages render a baseline in the
+    meantime and poll every FORECAST_POLL_MS.
+    """
+
+    def __init__(self, workers=FORECAST_WORKERS, start_method=FORECAST_START_METHOD, name='forecast'):
+        self.workers = workers
+        self.start_method = start_method
+        self.name = name
+
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> (future, submitted_at)
+        self._failures = TTLCache(maxsize=1024, ttl=FORECAST_RETRY_AFTER)
+        self._latencies = deque(maxlen=500)  # seconds from submit to result, most recent jobs
+        self._stats = {'requested': 0, 'cached': 0, 'submitted': 0, 'deduplicated': 0,
+                       'completed': 0, 'failed': 0, 'inline': 0}
+
+    def _pool(self):
+        # Created on first use, and again in a forked server worker where the
+        # parent's pool processes do not belong to us
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+            )
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def request(self, cache, key, fn, *args, inline=False):
+        """The cached result for `key`, or None while fn(*args) runs in the pool.
+        `fn` must be a module-level function so it can be sent to a worker.
+        inline=True fits in the calling thread, for models cheaper than a
+        round trip to the pool."""
+        value = cache.get(key)
+        with self._lock:
+            self._stats['requested'] += 1
+            if value is not None:
+                self._stats['cached'] += 1
+                return value
+            if key in self._failures:
+                raise ForecastError(self._failures[key])
+
+        if inline or self.workers <= 0:
+            with self._lock:
+                self._stats['inline'] += 1
+            try:
+                return cache.get_or_compute(key, lambda: fn(*args))
+            except Exception as e:
+                raise ForecastError(str(e)) from e
+
+        with self._lock:
+            if key in self._inflight:
+                self._stats['deduplicated'] += 1
+                return None
+            # The fit may have finished or failed since the first cache check
+            if key in self._failures:
+                raise ForecastError(self._failures[key])
+            value = cache.get(key)
+            if value is not None:
+                self._stats['cached'] += 1
+                return value
+            submitted_at = time.monotonic()
+            future = self._pool().submit(fn, *args)
+            self._inflight[key] = (future, submitted_at)
+            self._stats['submitted'] += 1
+        future.add_done_callback(lambda done: self._finished(cache, key, done, submitted_at))
+        return None
+
+    def _finished(self, cache, key, future, submitted_at):
+        try:
+            value = future.result()
+        except Exception as e:
+            print(f"Error fitting {self.name} {key}: {e}")
+            with self._lock:
+                self._failures[key] = str(e) or type(e).__name__
+                self._stats['failed'] += 1
+                self._inflight.pop(key, None)
+            return
+        # Into the cache before leaving _inflight, so a request that no longer
+        # finds the key in flight finds it when it re-checks the cache under the lock
+        cache.put(key, value)
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._stats['completed'] += 1
+            self._latencies.append(time.monotonic() - submitted_at)
+
+    def pending(self, key):
+        with self._lock:
+            return key in self._inflight
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            now = time.monotonic()
+            waiting = [now - submitted_at for _, submitted_at in self._inflight.values()]
+            latencies = sorted(self._latencies)
+        stats.update({
+            'workers': self.workers,
+            'queue_depth': len(waiting),
+            'oldest_pending_seconds': max(waiting, default=0.0),
+        })
+        if latencies:
+            stats['latency_p50'] = latencies[len(latencies) // 2]
+            stats['latency_p95'] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            stats['latency_max'] = latencies[-1]
+        return stats
+
+    def close(self):
+        """Stop the worker processes, dropping queued fits"""
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+
+
+# Shared by every page that fits forecasts
+forecast_service = ForecastService()
+atexit.register(forecast_service.close)
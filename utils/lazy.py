@@ -0,0 +1,43 @@
+import sys
+import importlib
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module and imports it on first attribute access, so
+    heavy libraries only load in workers that actually use them"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._lazy_lock = threading.Lock()
+        self._lazy_module = None
+
+    def _load(self):
+        module = self._lazy_module
+        if module is None:
+            with self._lazy_lock:
+                if self._lazy_module is None:
+                    self._lazy_module = importlib.import_module(self.__name__)
+                module = self._lazy_module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self._lazy_module is not None else 'not loaded'
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name):
+    """`pd = lazy_import('pandas')` instead of `import pandas as pd`. Returns
+    the real module when something has imported it already.
+
+    The pages import pandas, numpy and plotly.express this way, so a server
+    worker starts without them and the first callback that needs one pays
+    for the import."""
+    return importlib.import_module(name) if name in sys.modules else LazyModule(name)
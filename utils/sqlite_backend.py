@@ -0,0 +1,449 @@
+"""Embedded SQLite storage backend for utils.db.
+
+Selected with DB_BACKEND=sqlite (or a sqlite:///path DATABASE_URL) so the app,
+its load tests and the benchmarks can run on one machine without a Postgres
+server. Connections run in WAL mode, so readers never block the single writer,
+and are wrapped to look like psycopg2 connections: %s / %(name)s placeholders,
+`with conn.cursor() as cur`, and dict rows for cursor_factory=RealDictCursor.
+Only statements that are Postgres-specific have their own SQL here.
+"""
+import os
+import re
+import json
+import sqlite3
+from datetime import datetime, date
+from decimal import Decimal
+from functools import lru_cache
+
+from psycopg2.extras import Json
+
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))  # seconds a writer waits for the write lock
+
+
+def _convert_timestamp(value):
+    return datetime.fromisoformat(value.decode())
+
+
+def _convert_date(value):
+    return date.fromisoformat(value.decode()[:10])
+
+
+# Values are stored the way Postgres renders them, so text comparisons order correctly
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(Json, lambda value: json.dumps(value.adapted))
+sqlite3.register_converter('TIMESTAMP', _convert_timestamp)
+sqlite3.register_converter('DATE', _convert_date)
+sqlite3.register_converter('DECIMAL', lambda value: Decimal(value.decode()))
+sqlite3.register_converter('NUMERIC', lambda value: Decimal(value.decode()))
+sqlite3.register_converter('JSONB', json.loads)
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+@lru_cache(maxsize=512)
+def _translate(query):
+    """Rewrite psycopg2 placeholders (%s, %(name)s, %%) into sqlite3 ones"""
+    def replace(match):
+        if match.group(1):
+            return ':' + match.group(1)
+        return '?' if match.group(0) == '%s' else '%'
+    return _PLACEHOLDER.sub(replace, query)
+
+
+class SQLiteCursor:
+    """psycopg2-style cursor over a sqlite3 cursor"""
+
+    def __init__(self, cursor, dict_rows=False):
+        self._cursor = cursor
+        self._dict_rows = dict_rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, query, params=None):
+        # Like psycopg2, queries without parameters are sent as written
+        if params is None:
+            self._cursor.execute(query)
+        else:
+            self._cursor.execute(_translate(query), params)
+
+    def executemany(self, query, params_seq):
+        self._cursor.executemany(_translate(query), params_seq)
+
+    def _row(self, row):
+        if row is None or not self._dict_rows:
+            return row
+        return dict(zip((column[0] for column in self._cursor.description), row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size else self._cursor.fetchmany()
+        return [self._row(row) for row in rows]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._row(row)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """psycopg2-style connection over a sqlite3 connection"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT,
+                                     detect_types=sqlite3.PARSE_DECLTYPES,
+                                     check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.create_function("NOW", 0, lambda: datetime.now().isoformat(' '))
+        self.closed = False
+
+    def cursor(self, cursor_factory=None):
+        return SQLiteCursor(self._conn.cursor(), dict_rows=cursor_factory is not None)
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def executescript(self, script):
+        self._conn.executescript(script)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+        self.closed = True
+
+
+# Random version 4 UUID, as text, for the UUID primary keys
+_UUID_DEFAULT = """(lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4' ||
+    substr(hex(randomblob(2)), 2) || '-' || substr('89ab', 1 + (abs(random()) % 4), 1) ||
+    substr(hex(randomblob(2)), 2) || '-' || hex(randomblob(6))))"""
+
+_NOW_DEFAULT = "(datetime('now', 'localtime'))"
+
+# Same tables, indexes and expense rollup as utils/init_db.py
+SCHEMA = f"""
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email VARCHAR(255) UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        full_name VARCHAR(255),
+        created_at TIMESTAMP DEFAULT {_NOW_DEFAULT},
+        updated_at TIMESTAMP DEFAULT {_NOW_DEFAULT},
+        is_active BOOLEAN DEFAULT 1,
+        dashboard_settings JSONB DEFAULT '{{"components":[]}}'
+    );
+
+    CREATE TABLE IF NOT EXISTS income (
+        income_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+        amount DECIMAL(12, 2) NOT NULL,
+        source VARCHAR(255) NOT NULL,
+        monthly_amount DECIMAL(12, 2),
+        weekly_amount DECIMAL(12, 2),
+        daily_amount DECIMAL(12, 2),
+        frequency VARCHAR(50),
+        income_type VARCHAR(100),
+        consistency VARCHAR(100),
+        category VARCHAR(100),
+        date TIMESTAMP DEFAULT {_NOW_DEFAULT}
+    );
+
+    CREATE TABLE IF NOT EXISTS historical_income (
+        income_id INTEGER NOT NULL REFERENCES income(income_id) ON DELETE CASCADE,
+        month VARCHAR(20) NOT NULL,
+        amount DECIMAL(12, 2)
+    );
+
+    CREATE TABLE IF NOT EXISTS expense (
+        expense_id UUID PRIMARY KEY DEFAULT {_UUID_DEFAULT},
+        user_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+        description TEXT,
+        amount DECIMAL(12, 2) NOT NULL,
+        category VARCHAR(255),
+        date TIMESTAMP DEFAULT {_NOW_DEFAULT},
+        due_date TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS saving_goals (
+        goal_id UUID PRIMARY KEY DEFAULT {_UUID_DEFAULT},
+        user_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+        goal_name VARCHAR(255) NOT NULL,
+        target_amount DECIMAL(12, 2) NOT NULL,
+        current_amount DECIMAL(12, 2) DEFAULT 0,
+        deadline DATE,
+        created_at TIMESTAMP DEFAULT {_NOW_DEFAULT}
+    );
+
+    CREATE TABLE IF NOT EXISTS transactions (
+        transaction_id UUID PRIMARY KEY DEFAULT {_UUID_DEFAULT},
+        user_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+        amount DECIMAL(12, 2) NOT NULL,
+        type VARCHAR(50) NOT NULL,
+        category VARCHAR(255),
+        description TEXT,
+        date TIMESTAMP DEFAULT {_NOW_DEFAULT}
+    );
+
+    CREATE TABLE IF NOT EXISTS dashboard_components (
+        user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+        component_id VARCHAR(64) NOT NULL,
+        type VARCHAR(100) NOT NULL,
+        title VARCHAR(255),
+        settings JSONB NOT NULL DEFAULT '{{}}',
+        x INTEGER NOT NULL DEFAULT 0,
+        y INTEGER NOT NULL DEFAULT 0,
+        w INTEGER NOT NULL DEFAULT 8,
+        h INTEGER NOT NULL DEFAULT 6,
+        sort_order INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, component_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS savings_target (
+        user_id INTEGER REFERENCES users(user_id) ON DELETE CASCADE,
+        amount NUMERIC(12, 2) NOT NULL,
+        date DATE NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS expense_monthly_rollup (
+        user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+        month DATE NOT NULL,
+        category VARCHAR(255) NOT NULL,
+        total DECIMAL(14, 2) NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month, category)
+    );
+
+    CREATE UNIQUE INDEX IF NOT EXISTS historical_income_income_month_key
+        ON historical_income (income_id, month);
+    CREATE INDEX IF NOT EXISTS idx_transactions_user_date_id
+        ON transactions (user_id, date DESC, transaction_id DESC);
+    CREATE INDEX IF NOT EXISTS idx_income_user ON income (user_id);
+    CREATE INDEX IF NOT EXISTS idx_expense_user ON expense (user_id);
+    CREATE INDEX IF NOT EXISTS idx_saving_goals_user ON saving_goals (user_id);
+    CREATE INDEX IF NOT EXISTS idx_savings_target_user ON savings_target (user_id);
+"""
+
+_ROLLUP_ADD = """
+        INSERT INTO expense_monthly_rollup (user_id, month, category, total, count)
+        SELECT NEW.user_id, strftime('%Y-%m-01', NEW.date),
+               COALESCE(NULLIF(NEW.category, ''), 'Uncategorized'), NEW.amount, 1
+        WHERE NEW.user_id IS NOT NULL AND NEW.date IS NOT NULL
+        ON CONFLICT (user_id, month, category)
+        DO UPDATE SET total = total + excluded.total, count = count + 1;
+"""
+
+_ROLLUP_REMOVE = """
+        UPDATE expense_monthly_rollup
+           SET total = total - OLD.amount, count = count - 1
+         WHERE user_id = OLD.user_id
+           AND month = strftime('%Y-%m-01', OLD.date)
+           AND category = COALESCE(NULLIF(OLD.category, ''), 'Uncategorized');
+        DELETE FROM expense_monthly_rollup
+         WHERE user_id = OLD.user_id
+           AND month = strftime('%Y-%m-01', OLD.date)
+           AND category = COALESCE(NULLIF(OLD.category, ''), 'Uncategorized')
+           AND count <= 0;
+"""
+
+# SQLite triggers cannot branch on the operation, so there is one per event
+ROLLUP_TRIGGERS = f"""
+    CREATE TRIGGER IF NOT EXISTS expense_rollup_insert AFTER INSERT ON expense
+    BEGIN {_ROLLUP_ADD} END;
+
+    CREATE TRIGGER IF NOT EXISTS expense_rollup_update
+    AFTER UPDATE OF user_id, amount, category, date ON expense
+    BEGIN {_ROLLUP_REMOVE} {_ROLLUP_ADD} END;
+
+    CREATE TRIGGER IF NOT EXISTS expense_rollup_delete AFTER DELETE ON expense
+    BEGIN {_ROLLUP_REMOVE} END;
+"""
+
+ROLLUP_BACKFILL = """
+    BEGIN IMMEDIATE;
+    DELETE FROM expense_monthly_rollup;
+    INSERT INTO expense_monthly_rollup (user_id, month, category, total, count)
+    SELECT user_id, strftime('%Y-%m-01', date),
+           COALESCE(NULLIF(category, ''), 'Uncategorized'), SUM(amount), COUNT(*)
+    FROM expense
+    WHERE user_id IS NOT NULL AND date IS NOT NULL
+    GROUP BY 1, 2, 3;
+    COMMIT;
+"""
+
+# SQLite version of utils.db.USER_SNAPSHOT_QUERY. Subquery results lose their
+# JSON type, hence the json() wrappers; dates are rendered as Postgres renders them.
+USER_SNAPSHOT_QUERY = """
+    SELECT json_object(
+        'user_info', json_object('user_id', u.user_id, 'email', u.email, 'full_name', u.full_name),
+        'dashboard_settings', json(u.dashboard_settings),
+        'dashboard_components', json((
+            SELECT json_group_array(json_object(
+                'id', component_id, 'type', type, 'title', title, 'settings', json(settings),
+                'position', json_object('x', x, 'y', y, 'w', w, 'h', h)))
+            FROM (SELECT * FROM dashboard_components WHERE user_id = %(user_id)s
+                  ORDER BY sort_order, component_id)
+        )),
+        'income', json((
+            SELECT json_group_array(json_object(
+                'income_id', income_id, 'source', source, 'amount', amount,
+                'monthly_amount', monthly_amount, 'frequency', frequency,
+                'income_type', income_type, 'category', category,
+                'date', replace(date, ' ', 'T')))
+            FROM income WHERE user_id = %(user_id)s
+        )),
+        'expenses', json((
+            SELECT json_group_array(json_object(
+                'expense_id', expense_id, 'description', description, 'amount', amount,
+                'category', category, 'date', replace(date, ' ', 'T'),
+                'due_date', replace(due_date, ' ', 'T')))
+            FROM expense WHERE user_id = %(user_id)s
+        )),
+        'expense_rollup', json((
+            SELECT json_group_array(json_object(
+                'month', substr(month, 1, 7), 'category', category, 'total', total, 'count', count))
+            FROM (SELECT * FROM expense_monthly_rollup WHERE user_id = %(user_id)s
+                  ORDER BY month, category)
+        )),
+        'savings_goals', json((
+            SELECT json_group_array(json_object(
+                'goal_id', goal_id, 'goal_name', goal_name, 'target_amount', target_amount,
+                'current_amount', current_amount, 'deadline', deadline))
+            FROM saving_goals WHERE user_id = %(user_id)s
+        )),
+        'transactions', json((
+            SELECT json_group_array(json_object(
+                'transaction_id', transaction_id, 'amount', amount, 'type', type,
+                'category', category, 'description', description,
+                'date', replace(date, ' ', 'T')))
+            FROM (SELECT * FROM transactions WHERE user_id = %(user_id)s
+                  ORDER BY date DESC, transaction_id DESC
+                  LIMIT %(transaction_limit)s)
+        )),
+        'savings_target', COALESCE(
+            (SELECT amount FROM savings_target WHERE user_id = %(user_id)s LIMIT 1), 0
+        )
+    )
+    FROM users u
+    WHERE u.user_id = %(user_id)s
+"""
+
+
+class SQLiteBackend:
+    """utils.db storage backend for an embedded SQLite database file"""
+    name = 'sqlite'
+    # Errors after which a connection is unusable and is dropped from the pool
+    disconnect_errors = (sqlite3.InterfaceError,)
+
+    user_snapshot_query = USER_SNAPSHOT_QUERY
+    expense_rollup_query = """
+        SELECT substr(month, 1, 7) AS month, category, CAST(total AS REAL) AS total, count
+        FROM expense_monthly_rollup
+        WHERE user_id = %s
+    """
+    save_dashboard_settings_query = """
+        UPDATE users SET dashboard_settings = %(settings)s
+        WHERE user_id = %(user_id)s
+          AND dashboard_settings IS NOT %(settings)s
+    """
+
+    # Select-list templates for fetch_columns; timestamps stay ISO text, which
+    # NumPy parses a whole batch at a time
+    columnar_float = "CAST({} AS REAL)"
+    columnar_datetime = "CAST({} AS TEXT)"
+
+    def __init__(self, path):
+        if path == ':memory:':
+            raise ValueError("SQLite backend needs a database file; every pooled connection would get its own :memory: database")
+        self.path = path
+
+    def describe(self):
+        return {'backend': self.name, 'path': self.path}
+
+    def connect(self, statement_timeout=None, idle_timeout=None):
+        # Server-side timeouts are a Postgres feature; a SQLite file has no server session to end
+        return SQLiteConnection(self.path)
+
+    def in_transaction(self, conn):
+        return conn.in_transaction
+
+    def server_cursor(self, conn):
+        # sqlite3 already steps through results as they are fetched
+        return conn.cursor()
+
+    def begin_read_snapshot(self, cur):
+        # A read transaction in WAL mode sees one snapshot until it ends
+        cur.execute("BEGIN")
+
+    def ensure_transaction_partitions(self, cur, first, last):
+        # No declarative partitioning in SQLite; transactions is one table
+        return 0
+
+    def init_schema(self):
+        """Create the tables, indexes and rollup triggers, then rebuild the rollup"""
+        conn = self.connect()
+        try:
+            conn.executescript(SCHEMA)
+            conn.executescript(ROLLUP_TRIGGERS)
+            conn.executescript(ROLLUP_BACKFILL)
+        finally:
+            conn.close()
+
+    def upsert_historical_income(self, cur, income_id, rows, recompute_monthly_amount):
+        # No network round trips to save, so plain executemany is the batched path here
+        cur.executemany("""
+            INSERT INTO historical_income (income_id, month, amount)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (income_id, month) DO UPDATE SET amount = excluded.amount
+        """, rows)
+        if recompute_monthly_amount:
+            cur.execute("""
+                UPDATE income
+                SET monthly_amount = COALESCE(
+                    (SELECT SUM(amount) FROM historical_income WHERE income_id = %s), 0
+                ) / 12.0
+                WHERE income_id = %s
+                RETURNING user_id
+            """, (income_id, income_id))
+        else:
+            cur.execute("SELECT user_id FROM income WHERE income_id = %s", (income_id,))
+        return cur.fetchall()
+
+    def create_temp_table(self, cur, name, columns):
+        # No ON COMMIT DROP in SQLite; the table is per connection, so clear any leftover
+        cur.execute(f"DROP TABLE IF EXISTS temp.{name}")
+        cur.execute(f"CREATE TEMP TABLE {name} ({columns})")
+
+    def copy_rows(self, cur, table, columns, rows):
+        placeholders = ', '.join(['%s'] * len(columns))
+        cur.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+            (tuple(row[column] for column in columns) for row in rows),
+        )
+        return max(cur.rowcount, 0)
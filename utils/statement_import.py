@@ -0,0 +1,315 @@
+import csv
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from utils.db import db_connection, get_backend, invalidate_user_snapshot
+
+# Header names (lower-cased) recognised in CSV statements
+CSV_DATE_COLUMNS = ('date', 'transaction date', 'posted date', 'posting date', 'value date', 'booking date')
+CSV_AMOUNT_COLUMNS = ('amount', 'transaction amount', 'value')
+CSV_DEBIT_COLUMNS = ('debit', 'debit amount', 'paid out', 'money out', 'withdrawal', 'withdrawals')
+CSV_CREDIT_COLUMNS = ('credit', 'credit amount', 'paid in', 'money in', 'deposit', 'deposits')
+CSV_DESCRIPTION_COLUMNS = ('description', 'payee', 'name', 'details', 'narrative', 'memo', 'reference')
+CSV_CATEGORY_COLUMNS = ('category',)
+
+# One of these is picked per file (see settle_dates); day-first before month-first
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y', '%m/%d/%Y', '%m/%d/%y', '%d-%m-%Y',
+                '%Y/%m/%d', '%d.%m.%Y', '%d %b %Y', '%d %B %Y', '%b %d, %Y', '%Y%m%d')
+# QIF files are written month-first
+QIF_DATE_FORMATS = ('%m/%d/%Y', '%m/%d/%y', '%d/%m/%Y', '%d/%m/%y', '%Y-%m-%d', '%m-%d-%Y', '%m-%d-%y')
+
+# Day-first (31/01/2024) or month-first (01/31/2024) numeric dates
+DATE_ORDERS = ('dmy', 'mdy')
+
+SUPPORTED_FORMATS = ('csv', 'ofx', 'qif')
+
+STAGING_COLUMNS = ('date', 'amount', 'type', 'category', 'description')
+
+
+class StatementImportError(ValueError):
+    """Raised when a statement file cannot be read at all"""
+
+
+def parse_date(value, formats=DATE_FORMATS):
+    value = value.strip().replace("'", "/")  # QIF writes years after 2000 as 1/31'24
+    for fmt in formats:
+        try:
+            date = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if date.year >= 1900:  # '%Y' also reads the 24 of 01/02/24 as year 24
+            return date
+    return None
+
+
+def format_order(fmt):
+    """'dmy' or 'mdy' for a numeric day/month format, None when the format
+    cannot be confused with the other order (ISO dates, month names)"""
+    if fmt.startswith('%Y') or '%b' in fmt or '%B' in fmt:
+        return None
+    return 'dmy' if fmt.index('%d') < fmt.index('%m') else 'mdy'
+
+
+def settle_dates(records, formats=DATE_FORMATS, order=None):
+    """Yield (date, record) for each (date string, record) pair, reading every
+    date in the file with the same format.
+
+    The format is the first of `formats` that reads all dates seen so far.
+    Records are held back while that could still be day-first or month-first
+    and released once a date settles it (a day above 12). A file that stays
+    ambiguous to the end needs `order` ('dmy' or 'mdy'), otherwise
+    StatementImportError is raised. An explicit `order` rules out the
+    other order from the start. Dates the chosen format cannot read come
+    back as None.
+    """
+    if order is not None:
+        if order not in DATE_ORDERS:
+            raise StatementImportError(f"Unknown date order: {order}")
+        formats = [fmt for fmt in formats if format_order(fmt) in (None, order)]
+
+    def ambiguous(candidates):
+        return len({format_order(fmt) for fmt in candidates} - {None}) > 1
+
+    candidates = list(formats)
+    held = []
+    chosen = None
+    read_any = False
+    for value, record in records:
+        if chosen is not None:
+            yield parse_date(value, (chosen,)), record
+            continue
+
+        readable = [fmt for fmt in candidates if parse_date(value, (fmt,))]
+        if readable:
+            candidates = readable
+            read_any = True
+        held.append((value, record))
+        if readable and not ambiguous(candidates):
+            chosen = candidates[0]
+            for held_value, held_record in held:
+                yield parse_date(held_value, (chosen,)), held_record
+            held = []
+
+    if held:
+        if read_any and ambiguous(candidates):
+            raise StatementImportError(
+                "Dates in this file could be day-first or month-first (e.g. 03/04/2024); "
+                "choose the date order and import it again")
+        # None of the dates could be read
+        for _, held_record in held:
+            yield None, held_record
+
+
+def parse_amount(value):
+    """Parse '£1,234.50', '-12.00' or '(12.00)' into a signed Decimal"""
+    if value is None:
+        return None
+    value = re.sub(r'[£$€\s,]', '', str(value))
+    if not value:
+        return None
+    negative = value.startswith('(') and value.endswith(')')
+    value = value.strip('()')
+    try:
+        amount = Decimal(value)
+    except InvalidOperation:
+        return None
+    return -amount if negative else amount
+
+
+def _transaction(date, amount, description, category, default_category):
+    """Normalise a signed statement line into a transactions row"""
+    return {
+        'date': date,
+        'amount': abs(amount),
+        'type': 'expense' if amount < 0 else 'income',
+        'category': category or default_category,
+        'description': (description or '').strip()[:1000],
+    }
+
+
+def _find_column(fieldnames, candidates):
+    for name in fieldnames:
+        if name.strip().lower() in candidates:
+            return name
+    return None
+
+
+def parse_csv(lines, stats, default_category='Other', order=None):
+    """Yield transactions from a CSV statement with a header row"""
+    reader = csv.DictReader(lines)
+    fieldnames = reader.fieldnames or []
+
+    date_col = _find_column(fieldnames, CSV_DATE_COLUMNS)
+    amount_col = _find_column(fieldnames, CSV_AMOUNT_COLUMNS)
+    debit_col = _find_column(fieldnames, CSV_DEBIT_COLUMNS)
+    credit_col = _find_column(fieldnames, CSV_CREDIT_COLUMNS)
+    description_col = _find_column(fieldnames, CSV_DESCRIPTION_COLUMNS)
+    category_col = _find_column(fieldnames, CSV_CATEGORY_COLUMNS)
+
+    if not date_col or not (amount_col or debit_col or credit_col):
+        raise StatementImportError(f"CSV needs a date and an amount (or debit/credit) column, got {fieldnames}")
+
+    for date, row in settle_dates(((row.get(date_col) or '', row) for row in reader), DATE_FORMATS, order):
+        if amount_col:
+            amount = parse_amount(row.get(amount_col))
+        else:
+            debit = parse_amount(row.get(debit_col)) if debit_col else None
+            credit = parse_amount(row.get(credit_col)) if credit_col else None
+            amount = (credit or 0) - abs(debit or 0) if (debit or credit) else None
+
+        if date is None or not amount:
+            stats['rejected'] += 1
+            continue
+
+        description = row.get(description_col) if description_col else ''
+        category = row.get(category_col) if category_col else None
+        yield _transaction(date, amount, description, category, default_category)
+
+
+OFX_TAG = re.compile(r'<(/?)([A-Z0-9.]+)>([^<\r\n]*)', re.IGNORECASE)
+
+
+def parse_ofx(lines, stats, default_category='Other', order=None):
+    """Yield transactions from an OFX (SGML or XML) statement, one STMTTRN at a time"""
+    current = None
+    for line in lines:
+        for closing, tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if not closing:
+                    current = {}
+                    continue
+                if current is not None:
+                    date = parse_date((current.get('DTPOSTED') or '')[:8], ('%Y%m%d',))
+                    amount = parse_amount(current.get('TRNAMT'))
+                    if date is None or not amount:
+                        stats['rejected'] += 1
+                    else:
+                        description = current.get('NAME') or current.get('PAYEE') or ''
+                        if current.get('MEMO'):
+                            description = f"{description} {current['MEMO']}".strip()
+                        yield _transaction(date, amount, description, None, default_category)
+                current = None
+            elif current is not None and not closing and value.strip():
+                current[tag] = value.strip()
+
+
+def _qif_records(lines):
+    """(date string, record) for each record of a QIF file ('^' terminates each record)"""
+    record = {}
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line or line.startswith('!'):
+            continue
+        code, value = line[0], line[1:].strip()
+        if code != '^':
+            record.setdefault(code, value)
+            continue
+        yield record.get('D', ''), record
+        record = {}
+
+
+def parse_qif(lines, stats, default_category='Other', order=None):
+    """Yield transactions from a QIF statement. QIF is month-first unless the
+    file or `order` says otherwise."""
+    for date, record in settle_dates(_qif_records(lines), QIF_DATE_FORMATS, order or 'mdy'):
+        amount = parse_amount(record.get('T') or record.get('U'))
+        if date is None or not amount:
+            stats['rejected'] += 1
+        else:
+            description = record.get('P') or record.get('M') or ''
+            category = record.get('L', '').split(':')[0] or None
+            yield _transaction(date, amount, description, category, default_category)
+
+
+PARSERS = {'csv': parse_csv, 'ofx': parse_ofx, 'qif': parse_qif}
+
+
+def detect_format(filename=None, first_line=''):
+    extension = (filename or '').rsplit('.', 1)[-1].lower()
+    if extension in SUPPORTED_FORMATS:
+        return extension
+    if extension == 'qfx':
+        return 'ofx'
+    head = first_line.strip().upper()
+    if head.startswith('OFXHEADER') or head.startswith('<?XML') or head.startswith('<OFX'):
+        return 'ofx'
+    if head.startswith('!TYPE') or head.startswith('!ACCOUNT'):
+        return 'qif'
+    return 'csv'
+
+
+# Inserts staged rows that are not already stored. Rows are matched on
+# (date, amount, type, description); a key appearing n times in the file and m
+# times in the table inserts n - m rows, so re-importing a statement is a no-op
+# while genuine same-day repeats inside one statement are kept.
+INSERT_NEW_TRANSACTIONS = """
+    INSERT INTO transactions (user_id, amount, type, category, description, date)
+    WITH incoming AS (
+        SELECT s.*,
+               ROW_NUMBER() OVER (
+                   PARTITION BY date, amount, type, description ORDER BY category
+               ) AS occurrence
+        FROM statement_import s
+    ),
+    existing AS (
+        SELECT date, amount, type, COALESCE(description, '') AS description, COUNT(*) AS stored
+        FROM transactions
+        WHERE user_id = %(user_id)s
+          AND date BETWEEN (SELECT MIN(date) FROM statement_import)
+                       AND (SELECT MAX(date) FROM statement_import)
+        GROUP BY 1, 2, 3, 4
+    )
+    SELECT %(user_id)s, i.amount, i.type, i.category, i.description, i.date
+    FROM incoming i
+    LEFT JOIN existing e
+           ON e.date = i.date AND e.amount = i.amount
+          AND e.type = i.type AND e.description = i.description
+    WHERE i.occurrence > COALESCE(e.stored, 0)
+"""
+
+
+def import_statement(user_id, lines, filename=None, fmt=None, default_category='Other', date_order=None):
+    """Parse a CSV/OFX/QIF statement and bulk-load new rows into transactions.
+
+    `lines` is any iterable of text lines (an open file, a TextIOWrapper over
+    an upload stream). Rows are streamed into a temporary table (COPY on
+    Postgres) and inserted with one statement, all in a single transaction.
+    `date_order` ('dmy' or 'mdy') is needed only when the file's dates do
+    not settle it. Returns counts of parsed, inserted, duplicate and
+    rejected rows.
+    """
+    actual_user_id = user_id.get('user_id') if isinstance(user_id, dict) else user_id
+    lines = iter(lines)
+    first_line = next(lines, '')
+    fmt = fmt or detect_format(filename, first_line)
+    if fmt not in PARSERS:
+        raise StatementImportError(f"Unsupported statement format: {fmt}")
+
+    def all_lines():
+        yield first_line
+        yield from lines
+
+    stats = {'format': fmt, 'parsed': 0, 'inserted': 0, 'duplicates': 0, 'rejected': 0}
+    rows = PARSERS[fmt](all_lines(), stats, default_category, date_order)
+    backend = get_backend()
+
+    with db_connection() as conn, conn.cursor() as cur:
+        backend.create_temp_table(cur, 'statement_import', """
+            date TIMESTAMP NOT NULL,
+            amount DECIMAL(12, 2) NOT NULL,
+            type VARCHAR(50) NOT NULL,
+            category VARCHAR(255),
+            description TEXT NOT NULL
+        """)
+        stats['parsed'] = backend.copy_rows(cur, 'statement_import', STAGING_COLUMNS, rows)
+        if stats['parsed']:
+            # Months without a partition yet land in transactions_default
+            cur.execute(INSERT_NEW_TRANSACTIONS, {'user_id': actual_user_id})
+            stats['inserted'] = cur.rowcount
+
+    stats['duplicates'] = stats['parsed'] - stats['inserted']
+    if stats['inserted']:
+        invalidate_user_snapshot(actual_user_id)
+    return stats
@@ -0,0 +1,171 @@
+import os
+import atexit
+import copy
+import threading
+import time
+
+from utils.db import save_dashboard_positions
+
+# Dashboard layout write-behind settings (override with environment variables)
+LAYOUT_SAVE_DELAY = float(os.getenv("LAYOUT_SAVE_DELAY", "2"))  # quiet seconds before a layout change is written, 0 writes immediately
+LAYOUT_SAVE_MAX_DELAY = float(os.getenv("LAYOUT_SAVE_MAX_DELAY", "10"))  # longest a change can wait while a user keeps dragging
+
+
+class WriteBehind:
+    """Coalesces writes per key and persists only the latest value, once the key
+    has been quiet for `delay` seconds or `max_delay` after its first change.
+
+    `write(key, value)` does the actual write and returns False when the value
+    was already stored. With `merge(pending, value)` values are partial updates:
+    a newer one is folded into the value still pending (in place, like
+    dict.update) instead of replacing it. Pending values live in this process
+    only; call flush() at session end and close() at shutdown.
+    """
+
+    def __init__(self, write, delay=LAYOUT_SAVE_DELAY, max_delay=LAYOUT_SAVE_MAX_DELAY, name='write-behind',
+                 merge=None):
+        self.write = write
+        self.delay = delay
+        self.max_delay = max(max_delay, delay)
+        self.name = name
+        self.merge = merge
+
+        self._cond = threading.Condition()
+        self._pending = {}   # key -> (value, first_queued_at, due_at)
+        # Held from taking a pending value until it is written, so a value
+        # queued meanwhile waits its turn rather than racing the older one
+        self._io_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+        self._stats = {
+            'submitted': 0,
+            'coalesced': 0,   # values replaced by or merged into a newer one before being written
+            'written': 0,
+            'unchanged': 0,   # writes skipped because the stored value was identical
+            'errors': 0,
+            'flushes': 0,
+        }
+
+    def submit(self, key, value):
+        """Queue `value` as the latest state (or, with merge, update) for `key`"""
+        if self.delay <= 0 or self._closed:
+            return self.write_now(key, value)
+
+        now = time.monotonic()
+        with self._cond:
+            self._stats['submitted'] += 1
+            previous = self._pending.get(key)
+            if previous:
+                self._stats['coalesced'] += 1
+                first_queued_at = previous[1]
+                value = self._combine(previous[0], value)
+            else:
+                first_queued_at = now
+                if self.merge is not None:
+                    value = copy.copy(value)  # merged into in place later
+            due_at = min(now + self.delay, first_queued_at + self.max_delay)
+            self._pending[key] = (value, first_queued_at, due_at)
+
+            self._ensure_thread()
+            self._cond.notify()
+        return True
+
+    def write_now(self, key, value):
+        """Write `value` immediately, together with (or, without merge,
+        superseding) anything pending for `key`"""
+        with self._io_lock:
+            with self._cond:
+                self._stats['submitted'] += 1
+                entry = self._pending.pop(key, None)
+                if entry:
+                    self._stats['coalesced'] += 1
+                    value = self._combine(entry[0], value)
+            return self._write(key, value)
+
+    def peek(self, key):
+        """The value waiting to be written for `key`, or None"""
+        with self._cond:
+            entry = self._pending.get(key)
+        return copy.deepcopy(entry[0]) if entry else None
+
+    def flush(self, key=None):
+        """Write pending values now, for one key or for all of them"""
+        with self._cond:
+            keys = list(self._pending) if key is None else [key] if key in self._pending else []
+            if keys:
+                self._stats['flushes'] += 1
+        for pending_key in keys:
+            self._write_pending(pending_key)
+
+    def close(self):
+        """Stop the background writer and flush everything still pending"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        stats['writes_saved'] = stats['coalesced'] + stats['unchanged']
+        return stats
+
+    def _ensure_thread(self):
+        # Also restarts the writer in a forked worker, where the parent's thread does not exist
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _combine(self, pending, value):
+        if self.merge is None:
+            return value
+        self.merge(pending, value)
+        return pending
+
+    def _write_pending(self, key, due_by=None):
+        """Take the pending value for `key` and write it; with `due_by`, only
+        if it is due by then"""
+        with self._io_lock:
+            with self._cond:
+                entry = self._pending.get(key)
+                if entry is None or (due_by is not None and entry[2] > due_by):
+                    return True
+                del self._pending[key]
+            return self._write(key, entry[0])
+
+    def _write(self, key, value):
+        try:
+            changed = self.write(key, value)
+        except Exception as e:
+            print(f"Error writing {self.name} for {key}: {e}")
+            with self._cond:
+                self._stats['errors'] += 1
+            return False
+        with self._cond:
+            self._stats['written' if changed else 'unchanged'] += 1
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    now = time.monotonic()
+                    due = [key for key, entry in self._pending.items() if entry[2] <= now]
+                    if due:
+                        break
+                    next_due = min((entry[2] for entry in self._pending.values()), default=None)
+                    self._cond.wait(None if next_due is None else next_due - now)
+            for key in due:
+                self._write_pending(key, due_by=now)
+
+
+# Moved component positions from the dashboard grid, keyed by user_id, as
+# {component_id: {'x', 'y', 'w', 'h'}}; each submit adds to what is pending
+dashboard_layout_writer = WriteBehind(save_dashboard_positions, name='dashboard layout', merge=dict.update)
+atexit.register(dashboard_layout_writer.close)